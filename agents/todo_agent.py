@@ -1,10 +1,11 @@
-import os
-import json
-from pydantic import BaseModel
-from typing import Dict, Optional
+from pydantic import BaseModel, PrivateAttr
+from typing import Dict, List, Optional
 from llm.invoke import model_invoke
 from llm.agent import Agent, AgentTask
-from utils.log import get_custom_logger
+from agents.todo_store import TodoStore, create_todo_store
+from agents.todo_parser import todo_parser
+from utils.log import get_custom_logger, lazy_json
+from config import TODO_PAGE_SIZE, TODO_PARSER_ENABLED
 
 logger = get_custom_logger("Todo Agent")
 
@@ -21,7 +22,7 @@ todo_action_payload = {
                     {
                         "type": "object",
                         "properties": {
-                            "action": {"type": "string", "enum": ["add"]},
+                            "type": {"type": "string", "enum": ["add"]},
                             "title": {
                                 "type": "string",
                                 "description": "Title of the task",
@@ -44,7 +45,7 @@ todo_action_payload = {
                     {
                         "type": "object",
                         "properties": {
-                            "action": {"type": "string", "enum": ["update"]},
+                            "type": {"type": "string", "enum": ["update"]},
                             "id": {
                                 "type": "integer",
                                 "description": "ID of the task to update",
@@ -75,7 +76,7 @@ todo_action_payload = {
                     {
                         "type": "object",
                         "properties": {
-                            "action": {"type": "string", "enum": ["delete"]},
+                            "type": {"type": "string", "enum": ["delete"]},
                             "id": {
                                 "type": "integer",
                                 "description": "ID of the task to delete",
@@ -86,14 +87,22 @@ todo_action_payload = {
                     {
                         "type": "object",
                         "properties": {
-                            "action": {"type": "string", "enum": ["list"]},
+                            "type": {"type": "string", "enum": ["list"]},
                             "filter": {
                                 "type": "string",
                                 "enum": ["all", "status", "priority", "due_date"],
                             },
                             "filter_value": {
                                 "type": "string",
-                                "description": "Value to filter by (if applicable)",
+                                "description": "Value to filter by (if applicable). For due_date, a YYYY-MM-DD date or a FROM..TO range",
+                            },
+                            "cursor": {
+                                "type": "string",
+                                "description": "next_cursor returned by a previous list, to fetch the following page",
+                            },
+                            "limit": {
+                                "type": "integer",
+                                "description": "Maximum number of tasks to return",
                             },
                         },
                         "required": ["type", "filter"],
@@ -105,8 +114,26 @@ todo_action_payload = {
     },
 }
 
+todo_batch_payload = {
+    "name": "todo_batch",
+    "description": "Process one or more todo task actions, applied in order",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "actions": {
+                "type": "array",
+                "description": "Actions to apply, in the order they should be executed",
+                "items": todo_action_payload["parameters"]["properties"]["action"],
+            }
+        },
+        "required": ["actions"],
+    },
+}
+
 
 class TodoAgent(Agent):
+    _store: TodoStore = PrivateAttr()
+
     def __init__(
         self,
         name: str,
@@ -114,6 +141,7 @@ class TodoAgent(Agent):
         system_prompt: str,
         input_payload: Dict,
         output_payload: Dict,
+        store: Optional[TodoStore] = None,
     ):
         super().__init__(
             name=name,
@@ -122,61 +150,64 @@ class TodoAgent(Agent):
             input_payload=input_payload,
             output_payload=output_payload,
         )
+        self._store = store or create_todo_store()
+
+    @property
+    def store(self) -> TodoStore:
+        return self._store
 
     def execute(self, agent_task: AgentTask) -> Dict:
         logger.info(f"Todo Agent executing task: {agent_task.task}")
 
-        todo_task = model_invoke(
-            system_message=self.system_prompt,
-            user_message=agent_task.task,
-            payload=todo_action_payload,
-        )
+        # Common commands are parsed locally; anything else goes to the model
+        actions = todo_parser.parse(agent_task.task) if TODO_PARSER_ENABLED else None
+        if actions is not None:
+            logger.info(f"Parsed {len(actions)} actions without a model call")
+            todo_task = {"actions": actions}
+        else:
+            todo_task = model_invoke(
+                system_message=self.system_prompt,
+                user_message=agent_task.task,
+                payload=todo_batch_payload,
+                stage="todo_agent",
+            )
 
-        logger.info(f"Todo Agent RESPONSE:\n {json.dumps(todo_task, indent=2)}")
+        # A copy, since the results are added below before the listener renders it
+        logger.debug("Todo Agent RESPONSE:\n %s", lazy_json(dict(todo_task)))
 
-        action = todo_task["action"]
+        actions = todo_task.get("actions")
+        if actions is None and "action" in todo_task:
+            # Single-action response
+            actions = [todo_task["action"]]
 
-        match action["type"]:
+        todo_task["results"] = self.apply_actions(actions or [])
+        return todo_task
+
+    def apply_actions(self, actions: List[Dict]) -> List[Dict]:
+        """Applies a batch of actions in one store transaction, returning one result per action."""
+        with self.store.transaction():
+            return [self.apply_action(action) for action in actions]
+
+    def apply_action(self, action: Dict) -> Dict:
+        match action.get("type"):
             case "add":
-                self.add_task(action)
+                return self.add_task(action)
             case "update":
-                self.update_task(action)
+                return self.update_task(action)
             case "delete":
-                self.delete_task(action)
+                return self.delete_task(action)
             case "list":
-                self.list_tasks(action)
-
-        return todo_task
+                return self.list_tasks(action)
+            case _:
+                return {
+                    "status": "error",
+                    "message": f"Invalid action type: {action.get('type')}",
+                }
 
     def add_task(self, task: Dict) -> Dict:
         try:
-            todo_list = []
-            if (
-                os.path.exists("todo_list.json")
-                and os.path.getsize("todo_list.json") > 0
-            ):
-                with open("todo_list.json", "r") as f:
-                    todo_list = json.load(f)
-            else:
-                # Create the file with an empty list if it doesn't exist
-                with open("todo_list.json", "w") as f:
-                    json.dump([], f)
-
-            new_id = max([task.get("id", 0) for task in todo_list], default=0) + 1
-
-            new_task = {
-                "id": new_id,
-                "title": task["title"],
-                "description": task.get("description", ""),
-                "due_date": task["due_date"],
-                "priority": task["priority"],
-                "status": "pending",
-            }
-
-            todo_list.append(new_task)
-
-            with open("todo_list.json", "w") as f:
-                json.dump(todo_list, f, indent=2)
+            new_task = self.store.add(task)
+            new_id = new_task["id"]
 
             logger.info(f"Task added successfully with ID: {new_id}")
             return {
@@ -190,46 +221,15 @@ class TodoAgent(Agent):
 
     def update_task(self, task: Dict) -> Dict:
         try:
-            if (
-                not os.path.exists("todo_list.json")
-                or os.path.getsize("todo_list.json") == 0
-            ):
-                return {
-                    "status": "error",
-                    "message": "Todo list file is empty or doesn't exist",
-                }
-
-            with open("todo_list.json", "r") as f:
-                todo_list = json.load(f)
-
-            # Find the task with the matching ID
-            task_index = next(
-                (index for (index, t) in enumerate(todo_list) if t["id"] == task["id"]),
-                -1,
-            )
+            # Update only the fields that are provided
+            updated = self.store.update(task["id"], task)
 
-            if task_index == -1:
+            if updated is None:
                 return {
                     "status": "error",
                     "message": f"Task with ID {task['id']} not found",
                 }
 
-            # Update only the fields that are provided
-            if "title" in task:
-                todo_list[task_index]["title"] = task["title"]
-            if "description" in task:
-                todo_list[task_index]["description"] = task["description"]
-            if "due_date" in task:
-                todo_list[task_index]["due_date"] = task["due_date"]
-            if "priority" in task:
-                todo_list[task_index]["priority"] = task["priority"]
-            if "status" in task:
-                todo_list[task_index]["status"] = task["status"]
-
-            # Save the updated list
-            with open("todo_list.json", "w") as f:
-                json.dump(todo_list, f, indent=2)
-
             logger.info(f"Task {task['id']} updated successfully")
             return {
                 "status": "success",
@@ -241,10 +241,39 @@ class TodoAgent(Agent):
             return {"status": "error", "message": f"Error updating task: {str(e)}"}
 
     def delete_task(self, task: Dict) -> Dict:
-        return logger.info("Task deleted!")
+        try:
+            if not self.store.delete(task["id"]):
+                return {
+                    "status": "error",
+                    "message": f"Task with ID {task['id']} not found",
+                }
+
+            logger.info(f"Task {task['id']} deleted successfully")
+            return {
+                "status": "success",
+                "message": f"Task #{task['id']} was deleted successfully",
+            }
+
+        except Exception as e:
+            logger.error(f"Error deleting task: {str(e)}")
+            return {"status": "error", "message": f"Error deleting task: {str(e)}"}
 
     def list_tasks(self, task: Dict) -> Dict:
-        return logger.info("Tasks listed!")
+        try:
+            filter = task.get("filter") or "all"
+            page = self.store.list(
+                filter=filter,
+                filter_value=task.get("filter_value") or None,
+                cursor=task.get("cursor") or None,
+                limit=min(task.get("limit") or TODO_PAGE_SIZE, TODO_PAGE_SIZE),
+            )
+
+            logger.info(f"Listed {len(page['tasks'])} tasks (filter: {filter})")
+            return {"status": "success", **page}
+
+        except Exception as e:
+            logger.error(f"Error listing tasks: {str(e)}")
+            return {"status": "error", "message": f"Error listing tasks: {str(e)}"}
 
 
 def create_todo_agent() -> TodoAgent:
@@ -252,60 +281,61 @@ def create_todo_agent() -> TodoAgent:
     return TodoAgent(
         name="TodoAgent",
         description="Agent responsible for managing a todo list, including adding, updating, deleting, and listing tasks with their priorities, due dates, and completion status",
-        system_prompt="""You are a todo list manager that MUST ALWAYS return a complete action structure in your responses.
+        system_prompt="""You are a todo list manager that MUST ALWAYS return a complete list of actions in your responses.
+
+        Your response MUST ALWAYS follow this structure:
+        {
+            "actions": [action, ...]
+        }
+
+        Return one action for each operation the user asks for, in the order they should be applied.
+        For example, "add X and complete task 3" is an ADD action followed by an UPDATE action.
 
-        Your response MUST ALWAYS follow this structure based on the action type:
+        Each action MUST follow this structure based on the action type:
 
         For ADD actions:
         {
-            "action": {
-                "type": "add",
-                "title": "task title",
-                "description": "detailed description",
-                "due_date": "YYYY-MM-DD",
-                "priority": "low|medium|high"
-            }
+            "type": "add",
+            "title": "task title",
+            "description": "detailed description",
+            "due_date": "YYYY-MM-DD",
+            "priority": "low|medium|high"
         }
 
         For UPDATE actions:
         Note: If the field is not provided, it should be returned as an empty string.
         {
-            "action": {
-                "type": "update",
-                "id": task_id,
-                "title": "new title",
-                "description": "new description",
-                "due_date": "YYYY-MM-DD",
-                "priority": "low|medium|high",
-                "status": "pending|in_progress|completed"
-            }
+            "type": "update",
+            "id": task_id,
+            "title": "new title",
+            "description": "new description",
+            "due_date": "YYYY-MM-DD",
+            "priority": "low|medium|high",
+            "status": "pending|in_progress|completed"
         }
 
         For DELETE actions:
         {
-            "action": {
-                "type": "delete",
-                "id": task_id
-            }
+            "type": "delete",
+            "id": task_id
         }
 
         For LIST actions:
         {
-            "action": {
-                "type": "list",
-                "filter": "all|status|priority|due_date",
-                "filter_value": "value to filter by"
-            }
+            "type": "list",
+            "filter": "all|status|priority|due_date",
+            "filter_value": "value to filter by, for due_date YYYY-MM-DD or FROM..TO",
+            "cursor": "next_cursor from a previous list, only to get the next page"
         }
 
         IMPORTANT:
         1. NEVER return just the action type
         2. ALWAYS include all required fields for the chosen action
-        3. Ensure the response matches exactly one of these structures
+        3. Ensure each action matches exactly one of these structures
         4. All dates must be in YYYY-MM-DD format
         5. Priority must be one of: low, medium, high
         6. Status must be one of: pending, in_progress, completed
         """,
-        input_payload=todo_action_payload,
-        output_payload=todo_action_payload,
+        input_payload=todo_batch_payload,
+        output_payload=todo_batch_payload,
     )
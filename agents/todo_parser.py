@@ -0,0 +1,263 @@
+"""
+Todo Command Parser
+
+A small grammar for the todo commands users type most often, so TodoAgent can build
+the action list without a model call. Examples it understands:
+
+- "mark task 3 as completed", "complete task 3", "start task 4"
+- "delete task 5", "remove task #5 from my list"
+- "add 'buy milk' high priority due 2026-11-01"
+- "change the priority of task 2 to low", "set the due date of task 2 to 2026-12-01"
+- "rename task 2 to 'call mom'"
+- "show my tasks", "list completed tasks", "list high priority tasks",
+  "show tasks due 2026-11-01", "list tasks due between 2026-11-01 and 2026-11-30"
+
+Compound commands ("add 'x' and mark task 3 as done") are split on `and`, `then`, `;`
+and sentence breaks outside quotes. Every clause has to match a rule completely,
+otherwise parse() returns None and the caller falls back to the LLM.
+
+Coverage is tracked in utils.metrics as todo_parser.outcome{result=hit|miss} and
+todo_parser.rule{rule=...}; recent misses are kept for growing the grammar.
+"""
+
+import re
+from collections import deque
+from datetime import date
+from typing import Dict, List, Optional
+from utils import metrics
+from utils.log import get_custom_logger
+
+logger = get_custom_logger("TODO PARSER")
+
+STATUS_WORDS = {
+    "completed": "completed",
+    "complete": "completed",
+    "done": "completed",
+    "finished": "completed",
+    "pending": "pending",
+    "not done": "pending",
+    "todo": "pending",
+    "in progress": "in_progress",
+    "in_progress": "in_progress",
+    "started": "in_progress",
+}
+
+# Shared fragments
+TASK = r"(?:the\s+)?(?:task|todo|item)\s*(?:(?:with\s+)?(?:id|number|index|of\s+id)\s*)?#?\s*(?P<id>\d+)"
+QUOTED = r"['\"‘“](?P<title>.+?)['\"’”]"
+DATE = r"\d{4}-\d{2}-\d{2}"
+LIST_SUFFIX = r"(?:\s+(?:from|to|on|in)\s+(?:my|the|the\s+user's)\s+(?:todo\s+|to-do\s+)?list)?"
+STATUS = "(?P<status>" + "|".join(re.escape(w) for w in sorted(STATUS_WORDS, key=len, reverse=True)) + ")"
+
+POLITE_PREFIX = re.compile(
+    r"^(?:(?:hi|hello|hey)[,!.]?\s+)?(?:(?:please|kindly)\s+)?"
+    r"(?:(?:can|could|would|will)\s+you\s+(?:please\s+)?)?(?:please\s+)?",
+    re.IGNORECASE,
+)
+PROTECTED = re.compile(
+    r"['\"‘“].+?['\"’”]|between\s+" + DATE + r"\s+and\s+" + DATE, re.IGNORECASE
+)
+CLAUSE_SPLIT = re.compile(
+    r"\s*(?:,?\s+and\s+(?:then\s+)?(?:also\s+)?|,?\s+then\s+|;|\.\s+)\s*", re.IGNORECASE
+)
+
+
+def _valid_date(value: str) -> bool:
+    try:
+        date.fromisoformat(value)
+        return True
+    except ValueError:
+        return False
+
+
+class TodoCommandParser:
+    def __init__(self, max_misses: int = 100):
+        self.recent_misses: deque = deque(maxlen=max_misses)
+        self.rules: List[tuple] = [
+            ("add", self._compile(
+                r"(?:add|create|insert|put)\s+(?:a\s+)?(?:new\s+)?(?:task\s+)?" + QUOTED
+                + LIST_SUFFIX
+                + r"(?:\s*(?:with|,)?\s*(?:(?:a\s+)?(?P<priority>low|medium|high)\s+priority|priority\s+(?P<priority2>low|medium|high)))?"
+                + r"(?:\s*(?:,|and)?\s*(?:due|due\s+on|due\s+date|by)\s+(?P<due>" + DATE + "))?"
+                + LIST_SUFFIX
+            ), self._add),
+            ("add_unquoted", self._compile(
+                r"(?:add|put)\s+(?P<title>[^'\"]+?)\s+(?:to|on)\s+(?:my|the|the\s+user's)\s+(?:todo\s+|to-do\s+)?list"
+            ), self._add),
+            ("mark_status", self._compile(
+                r"(?:mark|set|change|update)\s+(?:the\s+status\s+of\s+)?" + TASK
+                + r"(?:'s\s+status)?\s+(?:as|to)\s+(?:be\s+)?" + STATUS
+            ), self._status),
+            ("complete", self._compile(r"(?:complete|finish|close)\s+" + TASK), self._completed),
+            ("start", self._compile(r"(?:start|begin)\s+(?:working\s+on\s+)?" + TASK), self._started),
+            ("delete", self._compile(r"(?:delete|remove|drop)\s+" + TASK + LIST_SUFFIX), self._delete),
+            ("priority", self._compile(
+                r"(?:change|set|update|make)\s+(?:the\s+)?priority\s+(?:of|for)\s+" + TASK
+                + r"\s+(?:to\s+)?(?P<priority>low|medium|high)(?:\s+priority)?"
+            ), self._priority),
+            ("priority_of_task", self._compile(
+                r"(?:set|make|change)\s+" + TASK + r"(?:'s)?\s+(?:priority\s+)?(?:to\s+)?(?P<priority>low|medium|high)(?:\s+priority)?"
+            ), self._priority),
+            ("due_date", self._compile(
+                r"(?:change|set|update|move)\s+(?:the\s+)?due\s+date\s+(?:of|for)\s+" + TASK
+                + r"\s+to\s+(?P<due>" + DATE + ")"
+            ), self._due_date),
+            ("rename", self._compile(r"(?:rename|retitle)\s+" + TASK + r"\s+(?:to|as)\s+" + QUOTED), self._rename),
+            ("list_due", self._compile(
+                r"(?:list|show|display|what\s+are)\s+(?:me\s+)?(?:all\s+)?(?:of\s+)?(?:my\s+|the\s+)?(?:tasks|todos)\s+due\s+"
+                r"(?:(?:on|by)\s+)?(?:(?P<due>" + DATE + r")|between\s+(?P<start>" + DATE + r")\s+and\s+(?P<end>" + DATE + r"))"
+            ), self._list_due),
+            ("list_filtered", self._compile(
+                r"(?:list|show|display|what\s+are)\s+(?:me\s+)?(?:all\s+)?(?:of\s+)?(?:my\s+|the\s+)?"
+                r"(?:(?P<priority>low|medium|high)\s+priority|" + STATUS + r")\s+(?:tasks|todos)"
+            ), self._list_filtered),
+            ("list_all", self._compile(
+                r"(?:(?:list|show|display)\s+(?:me\s+)?(?:all\s+)?(?:of\s+)?(?:my\s+|the\s+)?(?:tasks|todos|todo\s+list|to-do\s+list)"
+                r"|what(?:'s|\s+is)\s+on\s+my\s+(?:todo\s+|to-do\s+)?list"
+                r"|what\s+tasks\s+do\s+i\s+have(?:\s+on\s+my\s+(?:todo\s+|to-do\s+)?list)?)"
+            ), self._list_all),
+        ]
+
+    @staticmethod
+    def _compile(pattern: str) -> re.Pattern:
+        return re.compile(pattern + r"[\s.!?]*", re.IGNORECASE)
+
+    def _split(self, text: str) -> List[str]:
+        # Protect quoted titles and date ranges so separators inside them are not split on
+        protected: List[str] = []
+
+        def protect(match: re.Match) -> str:
+            protected.append(match.group(0))
+            return f"\x00{len(protected) - 1}\x00"
+
+        masked = PROTECTED.sub(protect, text)
+        clauses = [c for c in CLAUSE_SPLIT.split(masked) if c.strip()]
+        return [
+            re.sub(r"\x00(\d+)\x00", lambda m: protected[int(m.group(1))], clause)
+            for clause in clauses
+        ]
+
+    def parse_clause(self, clause: str) -> Optional[tuple]:
+        """Returns (rule name, action) for a single clause, or None."""
+        clause = POLITE_PREFIX.sub("", clause.strip()).strip()
+        for name, pattern, build in self.rules:
+            match = pattern.fullmatch(clause)
+            if not match:
+                continue
+            action = build(match)
+            if action is not None:
+                return name, action
+        return None
+
+    def parse(self, text: str) -> Optional[List[Dict]]:
+        """Returns the list of actions for text, or None if any part is not understood."""
+        parsed = []
+        for clause in self._split(text.strip()):
+            result = self.parse_clause(clause)
+            if result is None:
+                logger.info(f"No grammar rule matched: {clause!r}")
+                break
+            parsed.append(result)
+        else:
+            if parsed:
+                metrics.incr("todo_parser.outcome", result="hit")
+                for name, _ in parsed:
+                    metrics.incr("todo_parser.rule", rule=name)
+                return [action for _, action in parsed]
+
+        metrics.incr("todo_parser.outcome", result="miss")
+        self.recent_misses.append(text)
+        return None
+
+    def stats(self) -> Dict:
+        hits = metrics.get("todo_parser.outcome", result="hit")
+        misses = metrics.get("todo_parser.outcome", result="miss")
+        rules = {
+            name: metrics.get("todo_parser.rule", rule=name) for name, _, _ in self.rules
+        }
+        return {
+            "hits": hits,
+            "misses": misses,
+            "coverage": hits / (hits + misses) if hits + misses else 0.0,
+            "rules": rules,
+            "recent_misses": list(self.recent_misses),
+        }
+
+    # Action builders; returning None rejects the match
+
+    @staticmethod
+    def _add(match: re.Match) -> Optional[Dict]:
+        groups = match.groupdict()
+        title = groups["title"].strip()
+        due = groups.get("due") or "none"
+        if not title or (due != "none" and not _valid_date(due)):
+            return None
+        return {
+            "type": "add",
+            "title": title,
+            "description": "",
+            "due_date": due,
+            "priority": (groups.get("priority") or groups.get("priority2") or "medium").lower(),
+        }
+
+    @staticmethod
+    def _status(match: re.Match) -> Dict:
+        status = STATUS_WORDS[match.group("status").lower()]
+        return {"type": "update", "id": int(match.group("id")), "status": status}
+
+    @staticmethod
+    def _completed(match: re.Match) -> Dict:
+        return {"type": "update", "id": int(match.group("id")), "status": "completed"}
+
+    @staticmethod
+    def _started(match: re.Match) -> Dict:
+        return {"type": "update", "id": int(match.group("id")), "status": "in_progress"}
+
+    @staticmethod
+    def _delete(match: re.Match) -> Dict:
+        return {"type": "delete", "id": int(match.group("id"))}
+
+    @staticmethod
+    def _priority(match: re.Match) -> Dict:
+        return {
+            "type": "update",
+            "id": int(match.group("id")),
+            "priority": match.group("priority").lower(),
+        }
+
+    @staticmethod
+    def _due_date(match: re.Match) -> Optional[Dict]:
+        if not _valid_date(match.group("due")):
+            return None
+        return {"type": "update", "id": int(match.group("id")), "due_date": match.group("due")}
+
+    @staticmethod
+    def _rename(match: re.Match) -> Dict:
+        return {"type": "update", "id": int(match.group("id")), "title": match.group("title").strip()}
+
+    @staticmethod
+    def _list_due(match: re.Match) -> Optional[Dict]:
+        if match.group("due"):
+            value = match.group("due")
+        else:
+            value = f"{match.group('start')}..{match.group('end')}"
+        if not all(_valid_date(d) for d in value.split("..")):
+            return None
+        return {"type": "list", "filter": "due_date", "filter_value": value}
+
+    @staticmethod
+    def _list_filtered(match: re.Match) -> Dict:
+        if match.group("priority"):
+            return {"type": "list", "filter": "priority", "filter_value": match.group("priority").lower()}
+        return {
+            "type": "list",
+            "filter": "status",
+            "filter_value": STATUS_WORDS[match.group("status").lower()],
+        }
+
+    @staticmethod
+    def _list_all(match: re.Match) -> Dict:
+        return {"type": "list", "filter": "all"}
+
+
+todo_parser = TodoCommandParser()
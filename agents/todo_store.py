@@ -0,0 +1,488 @@
+"""
+Todo Store Module
+
+This module provides the storage backends used by the TodoAgent. It includes:
+
+- TodoStore: The abstract interface every backend implements
+- SQLiteTodoStore: Indexed SQLite store in WAL mode (default)
+- JsonTodoStore: The legacy todo_list.json file, kept for compatibility
+- TodoIndex: In-memory secondary indexes used by the JSON store
+- create_todo_store(): Builds the backend selected by TODO_STORE
+
+The SQLite store hands out ids from the table's AUTOINCREMENT sequence and applies
+every write as a single transaction, so adds and updates cost the same regardless of
+the list size and stay correct when several steps write at once. On first use it
+migrates the existing todo_list.json, preserving task ids.
+
+Listing is filtered through secondary indexes and cursor-paginated, so a page never
+touches more than `limit` tasks. Filters:
+- all: every task, by id
+- status / priority: exact match, by id
+- due_date: "YYYY-MM-DD", or a range "FROM..TO" where either bound may be omitted,
+  ordered by due date then id. Tasks without a due date never match a due_date filter.
+"""
+
+import base64
+import bisect
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import ContextManager, Dict, Iterator, List, Optional, Tuple
+from utils.log import get_custom_logger
+from config import TODO_STORE, TODO_DB_PATH, TODO_JSON_PATH, TODO_PAGE_SIZE
+
+logger = get_custom_logger("TODO STORE")
+
+TASK_FIELDS = ("title", "description", "due_date", "priority", "status")
+LIST_FILTERS = ("all", "status", "priority", "due_date")
+
+# Bounds used for open-ended due date ranges; they exclude '' and 'none'
+MIN_DATE = "0000-00-00"
+MAX_DATE = "9999-99-99"
+
+
+class TodoStore(ABC):
+    @abstractmethod
+    def transaction(self) -> ContextManager:
+        """
+        Groups every store call made in the block (on the current thread) into one
+        atomic unit. An exception escaping the block rolls all of them back.
+        """
+        pass
+
+    @abstractmethod
+    def add(self, task: Dict) -> Dict:
+        """Stores a new task and returns it with its assigned id."""
+        pass
+
+    @abstractmethod
+    def update(self, task_id: int, fields: Dict) -> Optional[Dict]:
+        """Updates the given fields of a task, returning None if it does not exist."""
+        pass
+
+    @abstractmethod
+    def get(self, task_id: int) -> Optional[Dict]:
+        pass
+
+    @abstractmethod
+    def delete(self, task_id: int) -> bool:
+        """Deletes a task, returning False if it does not exist."""
+        pass
+
+    @abstractmethod
+    def list(
+        self,
+        filter: str = "all",
+        filter_value: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = TODO_PAGE_SIZE,
+    ) -> Dict:
+        """Returns {"tasks": [...], "next_cursor": str | None}."""
+        pass
+
+
+def encode_cursor(key: Tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple]:
+    if not cursor:
+        return None
+    try:
+        return tuple(json.loads(base64.urlsafe_b64decode(cursor.encode())))
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def parse_date_range(filter_value: Optional[str]) -> Tuple[str, str]:
+    if not filter_value:
+        return MIN_DATE, MAX_DATE
+    if ".." in filter_value:
+        start, end = filter_value.split("..", 1)
+        return start.strip() or MIN_DATE, end.strip() or MAX_DATE
+    return filter_value.strip(), filter_value.strip()
+
+
+def _validate_list_args(filter: str, filter_value: Optional[str], limit: int) -> None:
+    if filter not in LIST_FILTERS:
+        raise ValueError(f"Invalid filter: {filter}. Filters available: {', '.join(LIST_FILTERS)}")
+    if filter in ("status", "priority") and not filter_value:
+        raise ValueError(f"Filter '{filter}' requires a filter_value")
+    if limit <= 0:
+        raise ValueError("limit must be positive")
+
+
+def _new_task(task: Dict) -> Dict:
+    return {
+        "title": task["title"],
+        "description": task.get("description", ""),
+        "due_date": task["due_date"],
+        "priority": task["priority"],
+        "status": "pending",
+    }
+
+
+class SQLiteTodoStore(TodoStore):
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            description TEXT NOT NULL DEFAULT '',
+            due_date TEXT NOT NULL DEFAULT '',
+            priority TEXT NOT NULL DEFAULT 'medium',
+            status TEXT NOT NULL DEFAULT 'pending'
+        );
+        CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status, id);
+        CREATE INDEX IF NOT EXISTS idx_tasks_priority ON tasks (priority, id);
+        CREATE INDEX IF NOT EXISTS idx_tasks_due_date ON tasks (due_date, id);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, db_path: str = TODO_DB_PATH, json_path: str = TODO_JSON_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+
+        self._connection().executescript(self.SCHEMA)
+        self.migrate_json(json_path)
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections are not shared across threads; WAL lets them coexist
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def transaction(self):
+        return _Transaction(self._connection(), self._local)
+
+    def migrate_json(self, json_path: str) -> int:
+        """One-time import of the legacy JSON file. Returns the number of tasks copied."""
+        with self.transaction() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+                return 0
+
+            todo_list = []
+            if json_path and os.path.exists(json_path) and os.path.getsize(json_path) > 0:
+                with open(json_path, "r") as f:
+                    todo_list = json.load(f)
+
+            conn.executemany(
+                "INSERT OR IGNORE INTO tasks (id, title, description, due_date, priority, status) "
+                "VALUES (:id, :title, :description, :due_date, :priority, :status)",
+                [
+                    {
+                        "id": t["id"],
+                        "title": t.get("title", ""),
+                        "description": t.get("description", ""),
+                        "due_date": t.get("due_date", ""),
+                        "priority": t.get("priority", "medium"),
+                        "status": t.get("status", "pending"),
+                    }
+                    for t in todo_list
+                ],
+            )
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('json_migrated', ?)",
+                (json_path or "",),
+            )
+
+        if todo_list:
+            logger.info(f"Migrated {len(todo_list)} tasks from {json_path}")
+        return len(todo_list)
+
+    def add(self, task: Dict) -> Dict:
+        new_task = _new_task(task)
+        with self.transaction() as conn:
+            row = conn.execute(
+                "INSERT INTO tasks (title, description, due_date, priority, status) "
+                "VALUES (:title, :description, :due_date, :priority, :status) RETURNING *",
+                new_task,
+            ).fetchone()
+        return dict(row)
+
+    def update(self, task_id: int, fields: Dict) -> Optional[Dict]:
+        fields = {k: v for k, v in fields.items() if k in TASK_FIELDS}
+        with self.transaction() as conn:
+            if not fields:
+                row = conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+            else:
+                assignments = ", ".join(f"{k} = :{k}" for k in fields)
+                row = conn.execute(
+                    f"UPDATE tasks SET {assignments} WHERE id = :id RETURNING *",
+                    {**fields, "id": task_id},
+                ).fetchone()
+        return dict(row) if row else None
+
+    def get(self, task_id: int) -> Optional[Dict]:
+        row = (
+            self._connection()
+            .execute("SELECT * FROM tasks WHERE id = ?", (task_id,))
+            .fetchone()
+        )
+        return dict(row) if row else None
+
+    def delete(self, task_id: int) -> bool:
+        with self.transaction() as conn:
+            deleted = conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,)).rowcount
+        return deleted > 0
+
+    def list(
+        self,
+        filter: str = "all",
+        filter_value: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = TODO_PAGE_SIZE,
+    ) -> Dict:
+        _validate_list_args(filter, filter_value, limit)
+        after = decode_cursor(cursor)
+
+        # Keyset pagination over the (column, id) indexes
+        if filter == "due_date":
+            start, end = parse_date_range(filter_value)
+            query = "SELECT * FROM tasks WHERE due_date BETWEEN ? AND ?"
+            params = [start, end]
+            if after:
+                query += " AND (due_date, id) > (?, ?)"
+                params += list(after)
+            query += " ORDER BY due_date, id LIMIT ?"
+        else:
+            query = "SELECT * FROM tasks WHERE 1 = 1"
+            params = []
+            if filter in ("status", "priority"):
+                query += f" AND {filter} = ?"
+                params.append(filter_value)
+            if after:
+                query += " AND id > ?"
+                params.append(after[-1])
+            query += " ORDER BY id LIMIT ?"
+
+        # Fetch one extra row to know whether another page exists
+        rows = self._connection().execute(query, params + [limit + 1]).fetchall()
+        tasks = [dict(row) for row in rows[:limit]]
+        return {"tasks": tasks, "next_cursor": _next_cursor(filter, tasks, rows, limit)}
+
+
+def _next_cursor(filter: str, tasks: List[Dict], rows: List, limit: int) -> Optional[str]:
+    if len(rows) <= limit:
+        return None
+    last = tasks[-1]
+    if filter == "due_date":
+        return encode_cursor((last["due_date"], last["id"]))
+    return encode_cursor((last["id"],))
+
+
+class _Transaction:
+    """
+    BEGIN IMMEDIATE ... COMMIT/ROLLBACK around a block, taking the write lock up front.
+
+    Nested transactions on the same thread join the outermost one.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, local: threading.local):
+        self.conn = conn
+        self.local = local
+
+    def __enter__(self) -> sqlite3.Connection:
+        depth = getattr(self.local, "depth", 0)
+        if depth == 0:
+            self.conn.execute("BEGIN IMMEDIATE")
+        self.local.depth = depth + 1
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.local.depth -= 1
+        if self.local.depth == 0:
+            if exc_type is None:
+                self.conn.execute("COMMIT")
+            else:
+                self.conn.execute("ROLLBACK")
+        return False
+
+
+class TodoIndex:
+    """
+    Secondary indexes over an in-memory task table, maintained incrementally.
+
+    - by_status / by_priority: hash maps from value to a sorted list of ids
+    - by_due_date: sorted list of (due_date, id) for range queries
+    """
+
+    def __init__(self):
+        self.by_status: Dict[str, List[int]] = {}
+        self.by_priority: Dict[str, List[int]] = {}
+        self.by_due_date: List[Tuple[str, int]] = []
+        self.ids: List[int] = []
+
+    @staticmethod
+    def _insert(ids: List, key) -> None:
+        bisect.insort(ids, key)
+
+    @staticmethod
+    def _remove(ids: List, key) -> None:
+        i = bisect.bisect_left(ids, key)
+        if i < len(ids) and ids[i] == key:
+            del ids[i]
+
+    def add(self, task: Dict) -> None:
+        self._insert(self.ids, task["id"])
+        self._insert(self.by_status.setdefault(task["status"], []), task["id"])
+        self._insert(self.by_priority.setdefault(task["priority"], []), task["id"])
+        self._insert(self.by_due_date, (task["due_date"] or "", task["id"]))
+
+    def remove(self, task: Dict) -> None:
+        self._remove(self.ids, task["id"])
+        self._remove(self.by_status.get(task["status"], []), task["id"])
+        self._remove(self.by_priority.get(task["priority"], []), task["id"])
+        self._remove(self.by_due_date, (task["due_date"] or "", task["id"]))
+
+    def page(
+        self, filter: str, filter_value: Optional[str], after: Optional[Tuple], limit: int
+    ) -> List[int]:
+        """Returns up to limit + 1 ids following the cursor key."""
+        if filter == "due_date":
+            start, end = parse_date_range(filter_value)
+            lo = bisect.bisect_left(self.by_due_date, (start,))
+            if after:
+                lo = max(lo, bisect.bisect_right(self.by_due_date, tuple(after)))
+            hi = bisect.bisect_right(self.by_due_date, (end, float("inf")))
+            return [task_id for _, task_id in self.by_due_date[lo : min(hi, lo + limit + 1)]]
+
+        match filter:
+            case "status":
+                ids = self.by_status.get(filter_value, [])
+            case "priority":
+                ids = self.by_priority.get(filter_value, [])
+            case _:
+                ids = self.ids
+        lo = bisect.bisect_right(ids, after[-1]) if after else 0
+        return ids[lo : lo + limit + 1]
+
+
+class JsonTodoStore(TodoStore):
+    """The legacy whole-file JSON store, loaded once and rewritten atomically on change."""
+
+    def __init__(self, json_path: str = TODO_JSON_PATH):
+        self.json_path = json_path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._tasks: Dict[int, Dict] = {}
+        self._index = TodoIndex()
+        self._next_id = 1
+        self._load()
+
+    def _load(self) -> None:
+        if os.path.exists(self.json_path) and os.path.getsize(self.json_path) > 0:
+            with open(self.json_path, "r") as f:
+                self._tasks = {t["id"]: t for t in json.load(f)}
+        self._reindex()
+
+    def _reindex(self) -> None:
+        self._index = TodoIndex()
+        for task in self._tasks.values():
+            self._index.add(task)
+        self._next_id = max(self._tasks, default=0) + 1
+
+    @contextmanager
+    def transaction(self) -> Iterator["JsonTodoStore"]:
+        with self._lock:
+            if self._depth:
+                # Nested: the outermost transaction saves or rolls back
+                self._depth += 1
+                try:
+                    yield self
+                finally:
+                    self._depth -= 1
+                return
+
+            snapshot = {task_id: dict(task) for task_id, task in self._tasks.items()}
+            self._depth = 1
+            try:
+                yield self
+            except BaseException:
+                self._tasks = snapshot
+                self._reindex()
+                raise
+            else:
+                self._write()
+            finally:
+                self._depth = 0
+
+    def _save(self) -> None:
+        # Inside a transaction the file is written once, on commit
+        if not self._depth:
+            self._write()
+
+    def _write(self) -> None:
+        tmp_path = f"{self.json_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(list(self._tasks.values()), f, indent=2)
+        os.replace(tmp_path, self.json_path)
+
+    def add(self, task: Dict) -> Dict:
+        new_task = _new_task(task)
+        with self._lock:
+            new_task = {"id": self._next_id, **new_task}
+            self._tasks[new_task["id"]] = new_task
+            self._index.add(new_task)
+            self._next_id += 1
+            self._save()
+        return dict(new_task)
+
+    def update(self, task_id: int, fields: Dict) -> Optional[Dict]:
+        with self._lock:
+            if task_id not in self._tasks:
+                return None
+            task = self._tasks[task_id]
+            self._index.remove(task)
+            task.update({k: v for k, v in fields.items() if k in TASK_FIELDS})
+            self._index.add(task)
+            self._save()
+            return dict(task)
+
+    def get(self, task_id: int) -> Optional[Dict]:
+        with self._lock:
+            task = self._tasks.get(task_id)
+            return dict(task) if task else None
+
+    def delete(self, task_id: int) -> bool:
+        with self._lock:
+            task = self._tasks.pop(task_id, None)
+            if task is None:
+                return False
+            self._index.remove(task)
+            self._save()
+            return True
+
+    def list(
+        self,
+        filter: str = "all",
+        filter_value: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = TODO_PAGE_SIZE,
+    ) -> Dict:
+        _validate_list_args(filter, filter_value, limit)
+        with self._lock:
+            ids = self._index.page(filter, filter_value, decode_cursor(cursor), limit)
+            rows = [dict(self._tasks[task_id]) for task_id in ids]
+        tasks = rows[:limit]
+        return {"tasks": tasks, "next_cursor": _next_cursor(filter, tasks, rows, limit)}
+
+
+def create_todo_store() -> TodoStore:
+    match TODO_STORE:
+        case "sqlite":
+            return SQLiteTodoStore()
+        case "json":
+            return JsonTodoStore()
+        case _:
+            raise ValueError(f"Invalid todo store: {TODO_STORE}. Stores available: sqlite, json")
@@ -1,6 +1,6 @@
 from typing import Dict
-import json
-import time
+from llm import repair
+from utils import metrics
 from utils.log import get_custom_logger
 
 logger = get_custom_logger("LLM")
@@ -12,58 +12,85 @@ class ToolCallValidationError(Exception):
     pass
 
 
-def get_arguments(response: dict, max_retries: int = 3, delay: float = 1.0) -> Dict:
+def get_arguments(response: dict, payload: dict = None) -> Dict:
     """
-    Extract arguments from LLM response with retry mechanism
+    Extract arguments from LLM response, repairing malformed output locally
 
     Args:
         response: Raw response from LLM
-        max_retries: Maximum number of retry attempts
-        delay: Delay between retries in seconds
+        payload: Tool definition the arguments should match, used to coerce types
 
     Returns:
         Dict containing the extracted arguments
 
     Raises:
-        ToolCallValidationError: If validation fails after all retries
+        ToolCallValidationError: If no usable arguments can be recovered
     """
-    retries = 0
-    while retries < max_retries:
-        try:
-            if "tool_calls" not in response.get("message", {}):
+    message = response.get("message") or {}
+    tool_calls = message.get("tool_calls")
+
+    try:
+        if tool_calls and isinstance(tool_calls, list):
+            function = tool_calls[0].get("function") or {}
+            if "arguments" not in function:
+                raise ToolCallValidationError("No arguments found in function call")
+            args = function["arguments"]
+            if isinstance(args, str):
+                args = repair.loads(args)
+        else:
+            # Some models answer with the JSON in the message body instead of a tool call
+            content = message.get("content") or ""
+            if not content.strip():
                 raise ToolCallValidationError("No tool_calls found in response")
+            args = repair.loads(content)
+            metrics.incr("llm.repairs", kind="content")
+    except repair.RepairError as e:
+        raise ToolCallValidationError(f"Arguments are not valid JSON: {str(e)}")
+
+    # Unwrap {"name": ..., "arguments": {...}} echoed back as the arguments
+    if isinstance(args, dict) and set(args) <= {"name", "arguments", "parameters"}:
+        inner = args.get("arguments", args.get("parameters"))
+        if isinstance(inner, str):
+            try:
+                args = repair.loads(inner)
+            except repair.RepairError as e:
+                raise ToolCallValidationError(f"Wrapped arguments are not valid JSON: {str(e)}")
+        elif isinstance(inner, dict):
+            args = inner
 
-            tool_calls = response["message"]["tool_calls"]
-            if not tool_calls or not isinstance(tool_calls, list):
-                raise ToolCallValidationError("Invalid tool_calls format")
+    if payload:
+        schema = payload.get("parameters", {})
+        args = repair.coerce(args, schema)
+        missing = repair.missing_required(args, schema)
+        if missing:
+            raise ToolCallValidationError(f"Missing required field: {missing}")
 
-            if "function" not in tool_calls[0]:
-                raise ToolCallValidationError("No function data in tool call")
+    return args
 
-            if "arguments" not in tool_calls[0]["function"]:
-                raise ToolCallValidationError("No arguments found in function call")
 
-            args = tool_calls[0]["function"]["arguments"]
+def get_structured_output(response: dict, payload: dict) -> Dict:
+    """
+    Extract arguments from a schema-constrained response
 
-            # Validate args is valid JSON
-            try:
-                if isinstance(args, str):
-                    args = json.loads(args)
-            except json.JSONDecodeError:
-                raise ToolCallValidationError("Arguments are not valid JSON")
-
-            return args
-
-        except (KeyError, IndexError, ToolCallValidationError) as e:
-            retries += 1
-            if retries == max_retries:
-                logger.error(
-                    f"Tool call validation failed after {max_retries} retries: {str(e)}"
-                )
-                raise ToolCallValidationError(f"Final validation error: {str(e)}")
-
-            logger.warning(
-                f"Tool call validation failed (attempt {retries}/{max_retries}): {str(e)}"
-            )
-            logger.warning(f"Retrying in {delay} seconds...")
-            time.sleep(delay)
+    With constrained decoding the message content is the JSON document itself, so
+    no tool_calls unwrapping or content extraction is needed.
+
+    Raises:
+        ToolCallValidationError: If the content is not a document matching the schema
+    """
+    content = (response.get("message") or {}).get("content") or ""
+    if not content.strip():
+        raise ToolCallValidationError("Empty structured output")
+
+    try:
+        args = repair.loads(content)
+    except repair.RepairError as e:
+        raise ToolCallValidationError(f"Structured output is not valid JSON: {str(e)}")
+
+    schema = payload.get("parameters", {})
+    args = repair.coerce(args, schema)
+    missing = repair.missing_required(args, schema)
+    if missing:
+        raise ToolCallValidationError(f"Missing required field: {missing}")
+
+    return args
@@ -11,10 +11,17 @@ The module enables a flexible system for creating and managing various AI agents
 each capable of executing specific tasks based on their implementation.
 """
 
+import asyncio
 from pydantic import BaseModel
-from typing import List, Dict
+from typing import List, Dict, Optional
 import llm
-from llm import stream
+import llm.query
+from functools import partial
+from llm.stream import astream, astream_text
+from llm.clients import run_sync
+from llm import prompts, recording, speculation
+from config import PIPELINE_MODE
+from utils import tracing
 from utils.log import get_custom_logger
 from abc import ABC, abstractmethod
 
@@ -34,11 +41,17 @@ class Agent(BaseModel, ABC):
     system_prompt: str
     input_payload: Dict
     output_payload: Dict
+    # Overrides AGENT_MAX_CONCURRENCY for this agent
+    max_concurrency: Optional[int] = None
 
     @abstractmethod
     def execute(self, agent_task: AgentTask) -> Dict:
         pass
 
+    async def aexecute(self, agent_task: AgentTask) -> Dict:
+        # Agents doing blocking I/O run off the event loop by default
+        return await asyncio.to_thread(self.execute, agent_task)
+
 
 class AgentHandler:
     def __init__(self):
@@ -47,6 +60,8 @@ class AgentHandler:
     def add_agent(self, agent: Agent):
         logger.info(f"Adding agent: {agent.name}")
         self.agent_list.append(agent)
+        # Prompts compiled for the previous registry are dropped
+        prompts.invalidate()
 
     def get_list(self) -> List[Agent]:
         return self.agent_list
@@ -59,29 +74,73 @@ class AgentHandler:
         return None
 
 
-def run_agent(message: str, agent_manager: AgentHandler) -> None:
+@tracing.traced("run_agent")
+async def arun_agent(
+    message: str, agent_manager: AgentHandler, mode: str = PIPELINE_MODE
+) -> None:
     logger.info(f"Processing message: {message}")
+    recording.record_run(message)
+    available_agents = agent_manager.get_list()
 
     # Determine if message should be handled conversationally or by a tool
-    query_route = llm.query.route(message)
+    speculative = None
+    match mode:
+        case "fused":
+            fallback = partial(llm.task.aplan, agent_list=available_agents)
+        case "two_call":
+            fallback = None
+            # Optionally start planning while the router is still deciding
+            speculative = speculation.start(message, available_agents)
+        case _:
+            raise ValueError(f"Invalid pipeline mode: {mode}")
+
+    try:
+        query_route = await llm.query.aroute(
+            message, available_agents, fallback=fallback
+        )
+    except BaseException:
+        if speculative:
+            speculative.discard()
+        raise
     agent_type = query_route["agent"]
     logger.info(f"Message routed to {agent_type} agent")
 
+    if speculative and agent_type != "tool":
+        speculative.discard()
+
     match agent_type:
         case "conversational":
             # Handle conversational messages by streaming response
-            stream(message)
+            reply = query_route.get("reply")
+            chunks = astream_text(reply) if reply else astream(message)
+            async for content in chunks:
+                print(content, end="", flush=True)
+            print()
 
         case "tool":
             # Handle tool requests by generating and routing specific tasks
-            available_agents = agent_manager.get_list()
-            tasks = llm.task.generate(message, available_agents)
-            results = llm.task.route(tasks, available_agents)
-            for result in results:
-                print(result)
-            final_answer = llm.task.generate_final_answer(message, results)
-            # stream(final_answer)
-            print(final_answer)
+            tasks = query_route.get("tasks")
+            if tasks is None and speculative:
+                tasks = await speculative.take()
+            if tasks is None:
+                tasks = await llm.task.agenerate(message, available_agents)
+            # Stream the final answer while the steps are still completing
+            results = llm.task.aroute_iter(tasks, available_agents)
+            async for content in llm.task.astream_final_answer(
+                message, results, on_step=lambda r: print(llm.task.step_status(r), flush=True)
+            ):
+                print(content, end="", flush=True)
+            print()
 
         case _:
             raise ValueError(f"Invalid agent type: {agent_type}")
+
+
+def run_agent(
+    message: str, agent_manager: AgentHandler, mode: str = PIPELINE_MODE
+) -> None:
+    return run_sync(arun_agent(message, agent_manager, mode))
+
+
+# llm.task builds on Agent, so it can only be imported once Agent is defined
+import llm.task  # noqa: E402
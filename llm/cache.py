@@ -0,0 +1,235 @@
+"""
+Response Cache Module
+
+Exact-match cache for model_invoke results. Entries are keyed on the backend, the
+model name, a hash of the system prompt, the user message and a hash of the payload
+schema (plus the output mode), so any change to a prompt or tool definition misses.
+
+Two tiers:
+- MemoryTier: an LRU of at most LLM_CACHE_MAX_ENTRIES entries
+- SQLiteTier: optional persistent tier at LLM_CACHE_PATH, shared across restarts;
+  hits are promoted into memory
+
+Whether a stage is cached, and for how long, is set in CACHE_POLICIES. Stages whose
+calls lead to state changes (todo_agent) are never cached: replaying an old action
+list would skip or repeat mutations.
+
+Counters: llm.cache{result=hit|miss,tier=...} and llm.cache.evictions{reason=lru|ttl}.
+"""
+
+import copy
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+from llm.prompts import prefix_key
+from utils import metrics
+from utils.log import get_custom_logger
+from config import LLM_CACHE_ENABLED, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_PATH
+
+logger = get_custom_logger("CACHE")
+
+_MISSING = object()
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    cacheable: bool = False
+    ttl: float = 0.0
+
+
+CACHE_POLICIES: Dict[str, CachePolicy] = {
+    "default": CachePolicy(),
+    "router": CachePolicy(cacheable=True, ttl=24 * 3600),
+    "planner": CachePolicy(cacheable=True, ttl=3600),
+    "final_answer": CachePolicy(cacheable=True, ttl=600),
+    "todo_agent": CachePolicy(cacheable=False),
+}
+
+
+def get_cache_policy(stage: str) -> CachePolicy:
+    return CACHE_POLICIES.get(stage, CACHE_POLICIES["default"])
+
+
+def _digest(value: Any) -> str:
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+def make_key(
+    backend: str,
+    model_name: Optional[str],
+    system_message: str,
+    user_message: str,
+    payload: Optional[dict],
+    mode: str,
+) -> str:
+    return _digest(
+        [
+            backend,
+            model_name or "",
+            prefix_key(system_message),
+            user_message,
+            _digest(payload) if payload else "",
+            mode,
+        ]
+    )
+
+
+class MemoryTier:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                metrics.incr("llm.cache.evictions", reason="ttl")
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                metrics.incr("llm.cache.evictions", reason="lru")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteTier:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_responses_expires_at ON responses (expires_at);
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._connection().executescript(self.SCHEMA)
+        self.purge_expired()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> tuple:
+        row = self._connection().execute(
+            "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return _MISSING, 0.0
+        value, expires_at = row
+        if expires_at <= time.time():
+            self._connection().execute("DELETE FROM responses WHERE key = ?", (key,))
+            metrics.incr("llm.cache.evictions", reason="ttl")
+            return _MISSING, 0.0
+        return json.loads(value), expires_at
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        self._connection().execute(
+            "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value), expires_at),
+        )
+
+    def purge_expired(self) -> int:
+        cursor = self._connection().execute(
+            "DELETE FROM responses WHERE expires_at <= ?", (time.time(),)
+        )
+        if cursor.rowcount:
+            metrics.incr("llm.cache.evictions", cursor.rowcount, reason="ttl")
+        return cursor.rowcount
+
+    def clear(self) -> None:
+        self._connection().execute("DELETE FROM responses")
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+        db_path: Optional[str] = LLM_CACHE_PATH,
+    ):
+        self.memory = MemoryTier(max_entries)
+        self.persistent = SQLiteTier(db_path) if db_path else None
+
+    def get(self, key: str) -> Any:
+        """Returns the cached value, or None on a miss."""
+        value = self.memory.get(key)
+        if value is not _MISSING:
+            metrics.incr("llm.cache", result="hit", tier="memory")
+            # Callers may mutate what they get back; never hand out the cached object
+            return copy.deepcopy(value)
+
+        if self.persistent is not None:
+            value, expires_at = self.persistent.get(key)
+            if value is not _MISSING:
+                metrics.incr("llm.cache", result="hit", tier="sqlite")
+                self.memory.set(key, copy.deepcopy(value), expires_at)
+                return value
+
+        metrics.incr("llm.cache", result="miss", tier="all")
+        return None
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        expires_at = time.time() + ttl
+        self.memory.set(key, copy.deepcopy(value), expires_at)
+        if self.persistent is not None:
+            try:
+                self.persistent.set(key, value, expires_at)
+            except (TypeError, sqlite3.Error) as e:
+                logger.warning(f"Could not persist cache entry: {str(e)}")
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.persistent is not None:
+            self.persistent.clear()
+
+    def stats(self) -> Dict:
+        hits = sum(
+            value
+            for labels, value in metrics.series("llm.cache").items()
+            if dict(labels)["result"] == "hit"
+        )
+        misses = metrics.get("llm.cache", result="miss", tier="all")
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "entries": len(self.memory),
+            "evictions": {
+                dict(labels)["reason"]: value
+                for labels, value in metrics.series("llm.cache.evictions").items()
+            },
+        }
+
+
+response_cache = ResponseCache() if LLM_CACHE_ENABLED else None
@@ -0,0 +1,131 @@
+"""
+Backend Clients Module
+
+This module owns the long-lived clients used to talk to the model backends. It provides:
+
+- get_ollama_client(): A connection-pooled ollama.AsyncClient per Ollama host
+- get_openai_client(): A connection-pooled AsyncOpenAI client
+- run_sync(): Runs a coroutine on the shared background event loop and waits for it
+- iter_sync(): Iterates an async generator from synchronous code
+
+Clients are created lazily and cached per event loop, since httpx connection pools
+cannot be shared across loops. Synchronous callers all go through one background
+loop, so a single pool drives every in-flight request regardless of the calling thread.
+"""
+
+import asyncio
+import queue
+import threading
+import weakref
+from typing import AsyncIterator, Awaitable, Dict, Iterator, Optional, TypeVar
+
+import httpx
+import ollama
+from openai import AsyncOpenAI
+from config import (
+    OLLAMA_HOST,
+    LLM_MAX_CONNECTIONS,
+    LLM_MAX_KEEPALIVE_CONNECTIONS,
+    LLM_KEEPALIVE_EXPIRY,
+    LLM_TIMEOUT,
+)
+from utils.log import get_custom_logger
+
+logger = get_custom_logger("CLIENTS")
+
+T = TypeVar("T")
+
+_ollama_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, ollama.AsyncClient]]" = (
+    weakref.WeakKeyDictionary()
+)
+_openai_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = (
+    weakref.WeakKeyDictionary()
+)
+
+_loop: asyncio.AbstractEventLoop = None
+_loop_thread: threading.Thread = None
+_loop_lock = threading.Lock()
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+    )
+
+
+def get_ollama_client(host: Optional[str] = None) -> ollama.AsyncClient:
+    host = host or OLLAMA_HOST
+    clients = _ollama_clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(host)
+    if client is None:
+        logger.info(f"Creating pooled Ollama client (host={host or 'default'})")
+        client = ollama.AsyncClient(host=host, timeout=LLM_TIMEOUT, limits=_limits())
+        clients[host] = client
+    return client
+
+
+def get_openai_client() -> AsyncOpenAI:
+    loop = asyncio.get_running_loop()
+    client = _openai_clients.get(loop)
+    if client is None:
+        logger.info("Creating pooled OpenAI client")
+        client = AsyncOpenAI(
+            http_client=httpx.AsyncClient(timeout=LLM_TIMEOUT, limits=_limits())
+        )
+        _openai_clients[loop] = client
+    return client
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Returns the shared background event loop, starting it on first use."""
+    global _loop, _loop_thread
+
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(
+                target=_loop.run_forever, name="llm-event-loop", daemon=True
+            )
+            _loop_thread.start()
+    return _loop
+
+
+def run_sync(coro: Awaitable[T]) -> T:
+    """Runs a coroutine on the background loop and blocks until it completes."""
+    loop = get_loop()
+    if threading.current_thread() is _loop_thread:
+        coro.close()
+        raise RuntimeError(
+            "run_sync() called from the LLM event loop; await the async API instead"
+        )
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+def iter_sync(agen: AsyncIterator[T]) -> Iterator[T]:
+    """Iterates an async generator on the background loop from synchronous code."""
+    loop = get_loop()
+    items: queue.Queue = queue.Queue()
+    done = object()
+
+    async def pump():
+        try:
+            async for item in agen:
+                items.put(item)
+        except BaseException as e:
+            items.put(e)
+        finally:
+            items.put(done)
+
+    future = asyncio.run_coroutine_threadsafe(pump(), loop)
+    try:
+        while True:
+            item = items.get()
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        future.cancel()
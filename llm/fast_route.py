@@ -0,0 +1,273 @@
+"""
+Fast Route Module
+
+This module provides a local pre-classifier that answers the conversational vs tool
+routing decision without a model call when it is confident. It combines:
+
+- Keyword rules: small-talk patterns, plus keywords built from the registered
+  agent descriptions and a set of common action verbs
+- A linear model: logistic regression over hashed word n-grams, loaded from a JSON
+  weights file (see train() and the `python -m llm.fast_route` command)
+
+Both produce a logit for "tool"; the combined probability is compared against a
+confidence threshold. Low-confidence messages fall back to the LLM router. The tool
+rules are calibrated to stay below the default threshold on their own, so only
+whole-message small talk is routed without a trained model; a "tool" decision
+always needs the model to agree. FAST_ROUTER_ENABLED is off until one is trained.
+
+Metrics (see utils.metrics):
+- fast_router.decisions{outcome=hit|fallback}
+- fast_router.agreement{result=agree|disagree}: local guess vs LLM label, recorded
+  on fallbacks and on shadow-sampled hits
+"""
+
+import json
+import math
+import os
+import re
+import sys
+import zlib
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from utils import metrics
+from utils.log import get_custom_logger
+from config import FAST_ROUTER_MODEL_PATH, FAST_ROUTER_THRESHOLD
+
+logger = get_custom_logger("FAST ROUTE")
+
+N_FEATURES = 2**18
+
+SMALL_TALK = re.compile(
+    r"^\s*(hi|hello|hey|yo|hiya|good (morning|afternoon|evening|night)|"
+    r"thanks?( you)?( so much| a lot)?|thank you|thx|bye|goodbye|see you|"
+    r"how are you( doing)?|how's it going|what's up|who are you|what can you do|"
+    r"ok(ay)?|cool|nice|great)\b[\s!.?,]*(there|buddy|friend)?[\s!.?]*$",
+    re.IGNORECASE,
+)
+
+ACTION_VERBS = {
+    "add", "creat", "insert", "put", "append", "remov", "delet", "drop", "clear",
+    "updat", "chang", "edit", "renam", "mark", "compl", "finis", "set", "show",
+    "list", "displ", "sched", "remin",
+}
+
+STOPWORDS = {
+    "the", "and", "for", "with", "that", "this", "their", "them", "from", "into",
+    "agent", "responsible", "including", "managing", "handles", "user", "users",
+    "your", "about", "which", "when", "will", "other", "also",
+}
+
+# Logit contributions of the keyword rules. Keywords also show up in questions
+# about the tools ("what does high priority mean?"), so the tool rules alone stay
+# below the default threshold (sigmoid(2.0) = 0.88 < 0.9)
+SMALL_TALK_LOGIT = -4.0
+STRONG_TOOL_LOGIT = 2.0
+WEAK_TOOL_LOGIT = 1.0
+
+
+def _stem(word: str) -> str:
+    for suffix in ("ing", "ed", "es", "s"):
+        if len(word) > len(suffix) + 2 and word.endswith(suffix):
+            word = word[: -len(suffix)]
+            break
+    return word[:5]
+
+
+def tokenize(message: str) -> List[str]:
+    return [_stem(w) for w in re.findall(r"[a-z0-9']+", message.lower())]
+
+
+def hashed_features(tokens: List[str], n_features: int = N_FEATURES) -> Dict[int, float]:
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    features: Dict[int, float] = {}
+    for gram in grams:
+        index = zlib.crc32(gram.encode()) % n_features
+        features[index] = features.get(index, 0.0) + 1.0
+    return features
+
+
+def _sigmoid(x: float) -> float:
+    if x < -30:
+        return 0.0
+    if x > 30:
+        return 1.0
+    return 1.0 / (1.0 + math.exp(-x))
+
+
+@dataclass
+class Prediction:
+    agent: str
+    confidence: float
+
+    @property
+    def label(self) -> dict:
+        return {"agent": self.agent}
+
+
+class LinearModel:
+    def __init__(
+        self,
+        weights: Optional[Dict[int, float]] = None,
+        bias: float = 0.0,
+        n_features: int = N_FEATURES,
+    ):
+        self.weights = weights or {}
+        self.bias = bias
+        self.n_features = n_features
+
+    def logit(self, tokens: List[str]) -> float:
+        features = hashed_features(tokens, self.n_features)
+        return self.bias + sum(
+            self.weights.get(i, 0.0) * v for i, v in features.items()
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "LinearModel":
+        with open(path, "r") as f:
+            data = json.load(f)
+        return cls(
+            weights={int(k): v for k, v in data["weights"].items()},
+            bias=data["bias"],
+            n_features=data["n_features"],
+        )
+
+    def save(self, path: str) -> None:
+        data = {
+            "n_features": self.n_features,
+            "bias": self.bias,
+            "weights": {str(k): round(v, 6) for k, v in self.weights.items() if v},
+        }
+        with open(path, "w") as f:
+            json.dump(data, f)
+
+
+def train(
+    examples: List[Tuple[str, str]],
+    epochs: int = 20,
+    learning_rate: float = 0.5,
+    l2: float = 1e-4,
+) -> LinearModel:
+    """Fits a logistic regression on (message, agent) pairs with plain SGD."""
+    model = LinearModel()
+    data = [
+        (hashed_features(tokenize(message)), 1.0 if agent == "tool" else 0.0)
+        for message, agent in examples
+    ]
+
+    for _ in range(epochs):
+        for features, target in data:
+            z = model.bias + sum(model.weights.get(i, 0.0) * v for i, v in features.items())
+            error = _sigmoid(z) - target
+            model.bias -= learning_rate * error
+            for i, v in features.items():
+                w = model.weights.get(i, 0.0)
+                model.weights[i] = w - learning_rate * (error * v + l2 * w)
+
+    return model
+
+
+class FastRouter:
+    def __init__(
+        self,
+        model: Optional[LinearModel] = None,
+        threshold: float = FAST_ROUTER_THRESHOLD,
+    ):
+        self.model = model
+        self.threshold = threshold
+        self._keywords_key = None
+        self._keywords: set = set()
+
+    @classmethod
+    def from_config(cls) -> "FastRouter":
+        model = None
+        if FAST_ROUTER_MODEL_PATH and os.path.exists(FAST_ROUTER_MODEL_PATH):
+            logger.info(f"Loading fast router model from {FAST_ROUTER_MODEL_PATH}")
+            model = LinearModel.load(FAST_ROUTER_MODEL_PATH)
+        return cls(model=model)
+
+    def _agent_keywords(self, agent_list: List) -> set:
+        key = tuple((agent.name, agent.description) for agent in agent_list)
+        if key != self._keywords_key:
+            keywords = set()
+            for name, description in key:
+                words = re.findall(r"[a-z]+", f"{name} {description}".lower())
+                keywords.update(
+                    _stem(w) for w in words if len(w) >= 4 and w not in STOPWORDS
+                )
+            # Split CamelCase agent names, e.g. TodoAgent -> todo
+            for name, _ in key:
+                keywords.update(
+                    _stem(w.lower())
+                    for w in re.findall(r"[A-Z]?[a-z]+", name)
+                    if w.lower() not in STOPWORDS
+                )
+            self._keywords = keywords - ACTION_VERBS
+            self._keywords_key = key
+        return self._keywords
+
+    def rule_logit(self, message: str, tokens: List[str], agent_list: List) -> float:
+        if SMALL_TALK.match(message):
+            return SMALL_TALK_LOGIT
+
+        keywords = self._agent_keywords(agent_list)
+        keyword_hits = len(keywords.intersection(tokens))
+        has_verb = bool(ACTION_VERBS.intersection(tokens))
+
+        if keyword_hits >= 2 or (keyword_hits and has_verb):
+            return STRONG_TOOL_LOGIT
+        if keyword_hits or has_verb:
+            return WEAK_TOOL_LOGIT
+        return 0.0
+
+    def classify(self, message: str, agent_list: List) -> Prediction:
+        tokens = tokenize(message)
+        logit = self.rule_logit(message, tokens, agent_list)
+        if self.model is not None:
+            logit += self.model.logit(tokens)
+
+        p_tool = _sigmoid(logit)
+        if p_tool >= 0.5:
+            return Prediction(agent="tool", confidence=p_tool)
+        return Prediction(agent="conversational", confidence=1.0 - p_tool)
+
+    def is_confident(self, prediction: Prediction) -> bool:
+        if self.model is None and prediction.agent == "tool":
+            # Keyword rules alone never skip the LLM router for a tool decision
+            return False
+        return prediction.confidence >= self.threshold
+
+    def record_decision(self, hit: bool) -> None:
+        metrics.incr("fast_router.decisions", outcome="hit" if hit else "fallback")
+
+    def record_agreement(self, prediction: Prediction, llm_agent: str) -> None:
+        agree = prediction.agent == llm_agent
+        metrics.incr("fast_router.agreement", result="agree" if agree else "disagree")
+
+    def stats(self) -> Dict[str, float]:
+        hits = metrics.get("fast_router.decisions", outcome="hit")
+        fallbacks = metrics.get("fast_router.decisions", outcome="fallback")
+        agree = metrics.get("fast_router.agreement", result="agree")
+        disagree = metrics.get("fast_router.agreement", result="disagree")
+        return {
+            "hits": hits,
+            "fallbacks": fallbacks,
+            "hit_rate": hits / (hits + fallbacks) if hits + fallbacks else 0.0,
+            "agreement": agree / (agree + disagree) if agree + disagree else 0.0,
+        }
+
+
+fast_router = FastRouter.from_config()
+
+
+if __name__ == "__main__":
+    # Usage: python -m llm.fast_route <examples.jsonl> [output.json]
+    # Each line: {"message": "...", "agent": "conversational" | "tool"}
+    examples_path = sys.argv[1]
+    output_path = sys.argv[2] if len(sys.argv) > 2 else FAST_ROUTER_MODEL_PATH
+
+    with open(examples_path, "r") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+
+    trained = train([(row["message"], row["agent"]) for row in rows])
+    trained.save(output_path)
+    logger.info(f"Trained on {len(rows)} examples, saved to {output_path}")
@@ -0,0 +1,135 @@
+"""
+Hedged Requests Module
+
+Cuts the latency tail of latency-critical stages. When a call has not answered within
+its stage's running p95, a duplicate request is sent (to the least-loaded Ollama host,
+or to HEDGE_MODEL when set); the first valid response wins and the other request is
+cancelled.
+
+- LatencyTracker: rolling window of successful call latencies per stage
+- HedgeBudget: caps the share of calls that are hedged (HEDGE_MAX_RATE), counting
+  hedges still in flight, so a slow backend does not get its load multiplied
+
+Only stages listed in HEDGE_STAGES are hedged, and only once the stage has
+MIN_SAMPLES latencies to estimate its p95 from.
+
+Counters: llm.hedge{stage,outcome=primary_won|hedge_won|failed} and
+llm.hedge.skipped{stage,reason=rate_cap}.
+"""
+
+import asyncio
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+from utils import metrics
+from utils.log import get_custom_logger
+from config import HEDGE_ENABLED, HEDGE_MAX_RATE, HEDGE_MIN_DELAY, HEDGE_STAGES
+
+logger = get_custom_logger("HEDGE")
+
+MIN_SAMPLES = 20
+WINDOW = 500
+
+
+class LatencyTracker:
+    def __init__(self, window: int = WINDOW):
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self._samples[stage].append(seconds)
+
+    def quantile(self, stage: str, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(stage, ()))
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, math.ceil(q * len(samples)) - 1)]
+
+    def p95(self, stage: str) -> Optional[float]:
+        return self.quantile(stage, 0.95)
+
+
+class HedgeBudget:
+    def __init__(self, max_rate: float = HEDGE_MAX_RATE, window: int = WINDOW):
+        self.max_rate = max_rate
+        self._lock = threading.Lock()
+        self._decisions: Dict[str, Deque[bool]] = defaultdict(lambda: deque(maxlen=window))
+        self._in_flight: Dict[str, int] = defaultdict(int)
+
+    def acquire(self, stage: str) -> bool:
+        """Reserves a hedge if it keeps the stage's hedge rate under the cap."""
+        with self._lock:
+            decisions = self._decisions[stage]
+            hedged = sum(decisions) + self._in_flight[stage] + 1
+            if hedged / (len(decisions) + 1) > self.max_rate:
+                return False
+            self._in_flight[stage] += 1
+            return True
+
+    def record(self, stage: str, hedged: bool) -> None:
+        with self._lock:
+            if hedged:
+                self._in_flight[stage] -= 1
+            self._decisions[stage].append(hedged)
+
+
+latencies = LatencyTracker()
+budget = HedgeBudget()
+
+
+def hedging_enabled(stage: str) -> bool:
+    return HEDGE_ENABLED and stage in HEDGE_STAGES
+
+
+async def _race(first: asyncio.Task, second: asyncio.Task, stage: str) -> Any:
+    pending = {first, second}
+    error: BaseException = None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is None:
+                outcome = "hedge_won" if task is second else "primary_won"
+                metrics.incr("llm.hedge", stage=stage, outcome=outcome)
+                return task.result()
+            error = task.exception()
+    metrics.incr("llm.hedge", stage=stage, outcome="failed")
+    raise error
+
+
+async def run_hedged(
+    primary: Callable[[], Awaitable[Any]],
+    hedge: Callable[[], Awaitable[Any]],
+    stage: str,
+) -> Any:
+    """Awaits primary(), racing it against hedge() if it runs past the stage's p95."""
+    start = time.perf_counter()
+    delay = latencies.p95(stage) if hedging_enabled(stage) else None
+    tasks = [asyncio.ensure_future(primary())]
+    hedged = False
+
+    try:
+        if delay is not None:
+            done, _ = await asyncio.wait(tasks, timeout=max(delay, HEDGE_MIN_DELAY))
+            if not done:
+                if budget.acquire(stage):
+                    hedged = True
+                    logger.info(f"[{stage}] No answer after {delay:.2f}s, sending hedge")
+                    tasks.append(asyncio.ensure_future(hedge()))
+                    result = await _race(tasks[0], tasks[1], stage)
+                else:
+                    metrics.incr("llm.hedge.skipped", stage=stage, reason="rate_cap")
+        if not hedged:
+            result = await tasks[0]
+    finally:
+        # The loser (or both, if the caller went away) must not keep a backend busy
+        for task in tasks:
+            task.cancel()
+        if delay is not None:
+            budget.record(stage, hedged)
+
+    latencies.record(stage, time.perf_counter() - start)
+    return result
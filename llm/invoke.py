@@ -1,89 +1,293 @@
-import ollama
-from openai import OpenAI
-from llm import get_arguments, ToolCallValidationError
+"""
+Model Invocation Module
+
+Single entry point for non-streaming model calls. Tool payloads can be requested in
+two output modes:
+
+- "tools": the payload is sent as a tool definition and the arguments are read
+  from the tool call (repaired locally when malformed)
+- "constrained": the payload's JSON schema is enforced during decoding, via Ollama's
+  `format` parameter or a `json_schema` response_format on OpenAI-compatible backends
+
+The mode is chosen per call and defaults to OUTPUT_MODE. Parse outcomes are counted
+per stage and mode as llm.parse{stage,mode,result=ok|failed}; see
+parse_failure_rates().
+
+Results of cacheable stages are served from llm.cache before any backend call, and
+identical concurrent calls of those stages are coalesced by llm.singleflight. Slow
+attempts of latency-critical stages are hedged by llm.hedge. The model(s) serving
+each stage, including fallbacks, come from the routing table in llm.models.
+
+Every call runs in an "llm_call" tracing span carrying its stage, model, cache status
+(hit, miss, coalesced or uncached), pool host, retries and token counts.
+"""
+
+from functools import partial
+from typing import Dict, Optional
+from llm import ToolCallValidationError, get_arguments, get_structured_output
+from llm.cache import get_cache_policy, make_key, response_cache
+from llm.singleflight import single_flight
+from llm.clients import get_openai_client, run_sync
+from llm.pool import ollama_pool
+from llm.hedge import run_hedged
+from llm.prompts import prefix_key
+from llm.models import ModelTarget, model_routes
+from llm.retry import get_retry_policy, is_retryable, retry_async
+from llm import usage
+from utils import metrics, tracing
 from utils.log import get_custom_logger
-from config import OLLAMA_MODEL, OPENAI_MODEL, DEEPSEEK_MODEL
+from config import OUTPUT_MODE, LLM_COALESCE_ENABLED, HEDGE_MODEL, OLLAMA_KEEP_ALIVE, PROMPT_CACHE_HINTS
 
 logger = get_custom_logger("INVOKE")
 
-client = OpenAI()
+OUTPUT_MODES = ("tools", "constrained")
 
 
-def model_invoke(
+def _build_request(system_message: str, user_message: str, payload: dict, mode: str):
+    tools = None
+    schema = None
+    if payload and mode == "constrained":
+        schema = payload
+    elif payload:
+        tools = [{"type": "function", "function": payload}]
+
+    messages = [
+        {"role": "system", "content": system_message},
+        {"role": "user", "content": user_message},
+    ]
+    return messages, tools, schema
+
+
+def _record_ollama_usage(response) -> None:
+    usage.record(
+        response.get("prompt_eval_count") or 0, response.get("eval_count") or 0
+    )
+
+
+def _prefix_hint(messages: list) -> Optional[str]:
+    """Id of the static system prompt, for backends that reuse cached prefixes."""
+    if not PROMPT_CACHE_HINTS or messages[0]["role"] != "system":
+        return None
+    return prefix_key(messages[0]["content"])
+
+
+async def _ollama_chat(
+    model_name: str, messages: list, tools: list = None, schema: dict = None
+):
+    async with ollama_pool.lease(model_name, _prefix_hint(messages)) as client:
+        response = await client.chat(
+            model=model_name,
+            messages=messages,
+            tools=tools,
+            format=schema["parameters"] if schema else None,
+            keep_alive=OLLAMA_KEEP_ALIVE,
+        )
+    _record_ollama_usage(response)
+    return response
+
+
+async def _openai_chat(
+    model_name: str, messages: list, tools: list = None, schema: dict = None
+) -> dict:
+    client = get_openai_client()
+    kwargs = {}
+    if tools:
+        kwargs["tools"] = tools
+    if schema:
+        # Not strict: strict mode rejects the oneOf variants some payloads use
+        kwargs["response_format"] = {
+            "type": "json_schema",
+            "json_schema": {
+                "name": schema["name"],
+                "schema": schema["parameters"],
+                "strict": False,
+            },
+        }
+    prefix = _prefix_hint(messages)
+    if prefix:
+        kwargs["prompt_cache_key"] = prefix
+    completion = await client.chat.completions.create(
+        model=model_name,
+        messages=messages,
+        **kwargs,
+    )
+    if completion.usage:
+        usage.record(
+            completion.usage.prompt_tokens, completion.usage.completion_tokens
+        )
+
+    # Normalize to the Ollama response shape expected by get_arguments
+    return {"message": completion.choices[0].message.model_dump()}
+
+
+# Backends take (model_name, messages, tools, schema) and return an Ollama-shaped response
+BACKENDS = {
+    "ollama": _ollama_chat,
+    "deepseek": _ollama_chat,
+    "openai": _openai_chat,
+}
+
+
+def _parse(response: dict, payload: dict, mode: str, stage: str) -> Dict:
+    try:
+        if mode == "constrained":
+            args = get_structured_output(response, payload)
+        else:
+            # Malformed tool calls are repaired locally before any retry
+            args = get_arguments(response, payload)
+    except ToolCallValidationError:
+        metrics.incr("llm.parse", stage=stage, mode=mode, result="failed")
+        raise
+    metrics.incr("llm.parse", stage=stage, mode=mode, result="ok")
+    return args
+
+
+def parse_failure_rates() -> Dict[str, Dict[str, float]]:
+    """Returns {stage: {mode: failure rate}} over every parse attempt so far."""
+    totals: Dict[tuple, Dict[str, float]] = {}
+    for labels, value in metrics.series("llm.parse").items():
+        labels = dict(labels)
+        counts = totals.setdefault((labels["stage"], labels["mode"]), {"ok": 0, "failed": 0})
+        counts[labels["result"]] += value
+
+    rates: Dict[str, Dict[str, float]] = {}
+    for (stage, mode), counts in sorted(totals.items()):
+        attempts = counts["ok"] + counts["failed"]
+        rates.setdefault(stage, {})[mode] = counts["failed"] / attempts if attempts else 0.0
+    return rates
+
+
+async def amodel_invoke(
     system_message: str,
     user_message: str,
     payload: dict = None,
-    model: str = "ollama",
+    model: str = None,
+    stage: str = "default",
+    mode: str = None,
 ) -> dict:
-    if model == "ollama":
-        return ollama_invoke(system_message, user_message, payload)
-    elif model == "deepseek":
-        return deepseek_invoke(system_message, user_message, payload)
-    elif model == "openai":
-        return openai_invoke(system_message, user_message, payload)
-    else:
+    """
+    Calls the model(s) routed to `stage`, or `model` ("backend" or "backend:model")
+    when given. Each target of the stage's fallback chain gets the stage's retry
+    budget before the next one is tried.
+    """
+    with tracing.span("llm_call", stage=stage, cache="uncached"):
+        return await _amodel_invoke(system_message, user_message, payload, model, stage, mode)
+
+
+async def _amodel_invoke(
+    system_message: str,
+    user_message: str,
+    payload: dict,
+    model: str,
+    stage: str,
+    mode: str,
+) -> dict:
+    chain = [ModelTarget.parse(model)] if model else model_routes.chain(stage)
+    for target in chain:
+        if target.backend not in BACKENDS:
+            raise ValueError(
+                f"Invalid model: {target.backend}. Models avaiable: {', '.join(BACKENDS)}"
+            )
+    mode = mode or OUTPUT_MODE
+    if mode not in OUTPUT_MODES:
         raise ValueError(
-            f"Invalid model: {model}. Models avaiable: ollama, deepseek, openai"
+            f"Invalid output mode: {mode}. Modes available: {', '.join(OUTPUT_MODES)}"
         )
 
+    cache_policy = get_cache_policy(stage)
+    cache_key = None
+    if cache_policy.cacheable:
+        cache_key = make_key(
+            chain[0].backend,
+            ",".join(map(str, chain)),
+            system_message,
+            user_message,
+            payload,
+            mode,
+        )
+        if response_cache is not None:
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                tracing.annotate(cache="hit")
+                return cached
+        tracing.annotate(cache="miss")
 
-def ollama_invoke(system_message: str, user_message: str, payload: dict) -> dict:
-    tools = None
-    if payload:
-        tools = [{"type": "function", "function": payload}]
-
-    messages = [
-        {"role": "system", "content": system_message},
-        {"role": "user", "content": user_message},
-    ]
+    messages, tools, schema = _build_request(system_message, user_message, payload, mode)
+    hedge_target = ModelTarget.parse(HEDGE_MODEL) if HEDGE_MODEL else None
 
-    response = ollama.chat(model=OLLAMA_MODEL, messages=messages, tools=tools)
+    async def leg(target: ModelTarget):
+        tracing.annotate(model=str(target))
+        chat = BACKENDS[target.backend]
+        response = await chat(target.model, messages, tools, schema)
+        if payload:
+            return _parse(response, payload, mode, stage)
+        return response["message"]["content"]
 
-    if payload:
-        try:
-            response = get_arguments(response)
-            return response
-        except ToolCallValidationError as e:
-            logger.error(f"Tool call validation failed: {str(e)}")
-            # Re-attempt the entire request
-            logger.info("Retrying complete request...")
-            return ollama_invoke(system_message, user_message, payload)
+    async def attempt(target: ModelTarget):
+        # A hedge goes to HEDGE_MODEL, or to the same target on another pool host
+        with ollama_pool.spread():
+            return await run_hedged(
+                partial(leg, target), partial(leg, hedge_target or target), stage
+            )
 
-    return response["message"]["content"]
+    async def call():
+        policy = get_retry_policy(stage)
+        for i, target in enumerate(chain):
+            try:
+                result = await retry_async(partial(attempt, target), policy, stage)
+            except Exception as e:
+                if i == len(chain) - 1 or not is_retryable(e):
+                    raise
+                metrics.incr("llm.model_fallback", stage=stage, target=str(target))
+                logger.warning(
+                    f"[{stage}] {target} failed ({str(e)}), falling back to {chain[i + 1]}"
+                )
+                continue
+            if cache_key is not None and response_cache is not None:
+                response_cache.set(cache_key, result, cache_policy.ttl)
+            return result
 
+    # Identical concurrent calls share one backend request. Only cacheable stages
+    # are coalesced: two identical todo commands are two intended mutations
+    if cache_key is not None and LLM_COALESCE_ENABLED:
+        return await single_flight.do(cache_key, call, stage)
+    return await call()
 
-def deepseek_invoke(system_message: str, user_message: str, payload: dict) -> dict:
-    tools = None
-    if payload:
-        tools = [{"type": "function", "function": payload}]
 
-    messages = [
-        {"role": "system", "content": system_message},
-        {"role": "user", "content": user_message},
-    ]
+async def aollama_invoke(system_message: str, user_message: str, payload: dict) -> dict:
+    return await amodel_invoke(system_message, user_message, payload, "ollama")
 
-    response = ollama.chat(model=DEEPSEEK_MODEL, messages=messages, tools=tools)
 
-    if payload:
-        response = get_arguments(response)
-        return response
+async def adeepseek_invoke(
+    system_message: str, user_message: str, payload: dict
+) -> dict:
+    return await amodel_invoke(system_message, user_message, payload, "deepseek")
 
-    return response["message"]["content"]
 
+async def aopenai_invoke(system_message: str, user_message: str, payload: dict) -> dict:
+    return await amodel_invoke(system_message, user_message, payload, "openai")
 
-def openai_invoke(system_message: dict, user_message: dict, payload: dict) -> dict:
-    tools = None
-    if payload:
-        tools = [{"type": "function", "function": payload}]
 
-    response = client.chat.completions.create(
-        model=OPENAI_MODEL,
-        messages=[system_message, user_message],
-        tools=tools,
+def model_invoke(
+    system_message: str,
+    user_message: str,
+    payload: dict = None,
+    model: str = None,
+    stage: str = "default",
+    mode: str = None,
+) -> dict:
+    return run_sync(
+        amodel_invoke(system_message, user_message, payload, model, stage, mode)
     )
 
-    if payload:
-        response = get_arguments(response)
-        return response
 
-    return response["message"]["content"]
+def ollama_invoke(system_message: str, user_message: str, payload: dict) -> dict:
+    return run_sync(aollama_invoke(system_message, user_message, payload))
+
+
+def deepseek_invoke(system_message: str, user_message: str, payload: dict) -> dict:
+    return run_sync(adeepseek_invoke(system_message, user_message, payload))
+
+
+def openai_invoke(system_message: str, user_message: str, payload: dict) -> dict:
+    return run_sync(aopenai_invoke(system_message, user_message, payload))
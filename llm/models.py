@@ -0,0 +1,90 @@
+"""
+Model Routing Module
+
+Central table of which model serves which pipeline stage. A stage maps to a fallback
+chain of targets written as "backend:model", e.g.
+
+    {
+        "router": ["ollama:llama3.2:1b", "ollama:llama3.1:8b"],
+        "planner": ["ollama:llama3.1:8b", "openai:gpt-4o-mini"],
+        "chat": ["ollama:llama3.1:8b"]
+    }
+
+A bare backend name ("ollama", "openai", "deepseek") stands for that backend with its
+model from OLLAMA_MODEL / OPENAI_MODEL / DEEPSEEK_MODEL. Stages are: router, planner,
+final_answer, chat (streamed conversational replies) and one per agent (e.g.
+todo_agent); stages missing from the table use "default".
+
+The table is read from MODEL_ROUTES_PATH when that file exists, so models can be
+changed without code changes; otherwise every stage uses the configured Ollama model.
+"""
+
+import json
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from utils.log import get_custom_logger
+from config import DEEPSEEK_MODEL, MODEL_ROUTES_PATH, OLLAMA_MODEL, OPENAI_MODEL
+
+logger = get_custom_logger("MODELS")
+
+DEFAULT_MODELS = {
+    "ollama": OLLAMA_MODEL,
+    "deepseek": DEEPSEEK_MODEL,
+    "openai": OPENAI_MODEL,
+}
+
+
+@dataclass(frozen=True)
+class ModelTarget:
+    backend: str
+    model: Optional[str]
+
+    @classmethod
+    def parse(cls, spec: str) -> "ModelTarget":
+        # Backends are validated where they are called, so test backends can be added
+        backend, _, model = spec.strip().partition(":")
+        if not backend:
+            raise ValueError(f"Invalid model target: {spec!r}")
+        return cls(backend, model or DEFAULT_MODELS.get(backend))
+
+    def __str__(self) -> str:
+        return f"{self.backend}:{self.model}"
+
+
+class ModelRoutes:
+    def __init__(self, routes: Dict[str, List[str]] = None):
+        self.routes: Dict[str, List[ModelTarget]] = {"default": [ModelTarget.parse("ollama")]}
+        for stage, chain in (routes or {}).items():
+            if isinstance(chain, str):
+                chain = [chain]
+            if not chain:
+                raise ValueError(f"Empty model chain for stage {stage!r}")
+            self.routes[stage] = [ModelTarget.parse(spec) for spec in chain]
+
+    @classmethod
+    def load(cls, path: str = MODEL_ROUTES_PATH) -> "ModelRoutes":
+        if not path or not os.path.exists(path):
+            return cls()
+        with open(path, "r") as file:
+            routes = cls(json.load(file))
+        logger.info(f"Loaded model routes from {path}: {routes.describe()}")
+        return routes
+
+    def chain(self, stage: str) -> List[ModelTarget]:
+        return self.routes.get(stage) or self.routes["default"]
+
+    def primary(self, stage: str) -> ModelTarget:
+        return self.chain(stage)[0]
+
+    def targets(self) -> List[ModelTarget]:
+        """Every distinct target in the table."""
+        return list(dict.fromkeys(t for chain in self.routes.values() for t in chain))
+
+    def describe(self) -> str:
+        return "; ".join(
+            f"{stage}={' > '.join(map(str, chain))}" for stage, chain in self.routes.items()
+        )
+
+
+model_routes = ModelRoutes.load()
@@ -0,0 +1,249 @@
+"""
+Ollama Host Pool Module
+
+Spreads Ollama requests over several inference hosts (OLLAMA_HOSTS). It provides:
+
+- HostPool.lease(model, affinity): an async context manager yielding the client of
+  the host with the fewest outstanding requests among the healthy hosts serving that
+  model; with an affinity key (a prompt prefix id) the same prefix sticks to one host
+  while it is at most POOL_AFFINITY_SLACK requests busier than the least-loaded one
+- HostPool.spread(): leases made inside it avoid the hosts already leased in it and
+  ignore affinity, so a hedged duplicate goes to another host than the slow original
+- Model pinning (OLLAMA_MODEL_PINS): a model is only sent to its pinned hosts while
+  any of them is healthy, so its weights stay loaded there
+- Passive health checks: a host that fails POOL_FAILURE_THRESHOLD requests in a row
+  (transport errors, timeouts, 5xx) is ejected for POOL_EJECT_SECONDS, doubling on
+  every repeated ejection
+- Active health checks: a background task probes every host each
+  POOL_HEALTH_INTERVAL seconds, ejecting unreachable hosts and re-adding recovered ones
+
+With no OLLAMA_HOSTS configured the pool holds only OLLAMA_HOST (or the client
+default) and behaves like a single pooled client.
+
+Counters: ollama_pool.requests{host}, ollama_pool.failures{host},
+ollama_pool.ejections{host,reason=passive|active}.
+"""
+
+import asyncio
+import random
+import time
+import weakref
+import zlib
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import AsyncIterator, Collection, Dict, Iterator, List, Optional
+
+import httpx
+import ollama
+from llm.clients import get_ollama_client
+from utils import metrics, tracing
+from utils.log import get_custom_logger
+from config import (
+    OLLAMA_HOST,
+    OLLAMA_HOSTS,
+    OLLAMA_MODEL_PINS,
+    POOL_AFFINITY_SLACK,
+    POOL_EJECT_SECONDS,
+    POOL_FAILURE_THRESHOLD,
+    POOL_HEALTH_INTERVAL,
+)
+
+logger = get_custom_logger("OLLAMA POOL")
+
+# Hosts leased so far inside HostPool.spread()
+_leased: ContextVar[Optional[List[Optional[str]]]] = ContextVar("pool_leased", default=None)
+
+
+@dataclass
+class HostState:
+    host: Optional[str]
+    outstanding: int = 0
+    consecutive_failures: int = 0
+    ejections: int = 0
+    ejected_until: float = 0.0
+
+    @property
+    def healthy(self) -> bool:
+        return self.ejected_until <= time.monotonic()
+
+    @property
+    def label(self) -> str:
+        return self.host or "default"
+
+
+def is_host_failure(error: BaseException) -> bool:
+    """Errors that say something about the host rather than the request."""
+    if isinstance(error, (TimeoutError, ConnectionError, httpx.TransportError)):
+        return True
+    if isinstance(error, ollama.ResponseError):
+        return error.status_code >= 500
+    return False
+
+
+def parse_pins(spec: str) -> Dict[str, List[str]]:
+    """Parses "model=host1|host2,other=host3" into {model: [hosts]}."""
+    pins: Dict[str, List[str]] = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        model, _, hosts = item.partition("=")
+        pins[model.strip()] = [h.strip() for h in hosts.split("|") if h.strip()]
+    return pins
+
+
+class HostPool:
+    def __init__(
+        self,
+        hosts: List[Optional[str]],
+        pins: Dict[str, List[str]] = None,
+        failure_threshold: int = POOL_FAILURE_THRESHOLD,
+        eject_seconds: float = POOL_EJECT_SECONDS,
+        health_interval: float = POOL_HEALTH_INTERVAL,
+        affinity_slack: int = POOL_AFFINITY_SLACK,
+    ):
+        self.hosts = {host: HostState(host) for host in hosts}
+        self.pins = pins or {}
+        self.failure_threshold = failure_threshold
+        self.eject_seconds = eject_seconds
+        self.health_interval = health_interval
+        self.affinity_slack = affinity_slack
+        self._checkers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Task]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+        unknown = {h for pinned in self.pins.values() for h in pinned} - set(self.hosts)
+        if unknown:
+            logger.warning(f"Pinned hosts not in OLLAMA_HOSTS: {', '.join(sorted(unknown))}")
+
+    @classmethod
+    def from_config(cls) -> "HostPool":
+        hosts = [h.strip() for h in OLLAMA_HOSTS.split(",") if h.strip()]
+        return cls(hosts or [OLLAMA_HOST], parse_pins(OLLAMA_MODEL_PINS))
+
+    def hosts_for(self, model: Optional[str]) -> List[Optional[str]]:
+        """Hosts a model may be sent to: its pinned hosts, or every host."""
+        pinned = [h for h in self.pins.get(model, []) if h in self.hosts]
+        return pinned or list(self.hosts)
+
+    def _candidates(self, model: Optional[str]) -> List[HostState]:
+        pinned = [self.hosts[h] for h in self.pins.get(model, []) if h in self.hosts]
+        for group in (pinned, list(self.hosts.values())):
+            healthy = [state for state in group if state.healthy]
+            if healthy:
+                return healthy
+        # Everything is ejected: fail open to the host that comes back first
+        return [min(self.hosts.values(), key=lambda state: state.ejected_until)]
+
+    def select(
+        self,
+        model: Optional[str] = None,
+        affinity: Optional[str] = None,
+        exclude: Collection[Optional[str]] = (),
+    ) -> HostState:
+        candidates = self._candidates(model)
+        if exclude:
+            # Another host if there is one, else the excluded ones are still better than nothing
+            candidates = [s for s in candidates if s.host not in exclude] or candidates
+        fewest = min(state.outstanding for state in candidates)
+        if affinity is not None:
+            # Rendezvous hashing: a prompt prefix keeps going to the host that already
+            # holds its KV cache, unless that host is clearly busier than the rest
+            preferred = max(
+                candidates, key=lambda s: zlib.crc32(f"{affinity}|{s.label}".encode())
+            )
+            if preferred.outstanding <= fewest + self.affinity_slack:
+                return preferred
+        return random.choice([s for s in candidates if s.outstanding == fewest])
+
+    def _start_health_checks(self) -> None:
+        if len(self.hosts) < 2 or self.health_interval <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        task = self._checkers.get(loop)
+        if task is None or task.done():
+            self._checkers[loop] = loop.create_task(self._health_loop())
+
+    @asynccontextmanager
+    async def lease(
+        self, model: Optional[str] = None, affinity: Optional[str] = None
+    ) -> AsyncIterator[ollama.AsyncClient]:
+        self._start_health_checks()
+        leased = _leased.get()
+        if leased:
+            state = self.select(model, exclude=leased)
+        else:
+            state = self.select(model, affinity)
+        if leased is not None:
+            leased.append(state.host)
+        state.outstanding += 1
+        metrics.incr("ollama_pool.requests", host=state.label)
+        tracing.annotate(host=state.label)
+        try:
+            yield get_ollama_client(state.host)
+        except BaseException as e:
+            if is_host_failure(e):
+                self.record_failure(state)
+            raise
+        else:
+            state.consecutive_failures = 0
+        finally:
+            state.outstanding -= 1
+
+    @staticmethod
+    @contextmanager
+    def spread() -> Iterator[None]:
+        """Leases in this context (and the tasks it starts) go to distinct hosts."""
+        token = _leased.set([])
+        try:
+            yield
+        finally:
+            _leased.reset(token)
+
+    def record_failure(self, state: HostState) -> None:
+        metrics.incr("ollama_pool.failures", host=state.label)
+        state.consecutive_failures += 1
+        if state.consecutive_failures >= self.failure_threshold and state.healthy:
+            self._eject(state, "passive")
+
+    def _eject(self, state: HostState, reason: str) -> None:
+        duration = self.eject_seconds * 2 ** min(state.ejections, 5)
+        state.ejections += 1
+        state.ejected_until = time.monotonic() + duration
+        metrics.incr("ollama_pool.ejections", host=state.label, reason=reason)
+        logger.warning(f"Ejected {state.label} for {duration:.1f}s ({reason} health check)")
+
+    def _restore(self, state: HostState) -> None:
+        logger.info(f"Host {state.label} is healthy again")
+        state.ejected_until = 0.0
+        state.ejections = 0
+        state.consecutive_failures = 0
+
+    async def check(self, state: HostState) -> bool:
+        try:
+            await asyncio.wait_for(get_ollama_client(state.host).ps(), timeout=5)
+        except Exception as e:
+            if state.healthy:
+                logger.warning(f"Health check failed for {state.label}: {str(e)}")
+                self._eject(state, "active")
+            return False
+        if not state.healthy:
+            self._restore(state)
+        return True
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.gather(*(self.check(state) for state in self.hosts.values()))
+            await asyncio.sleep(self.health_interval)
+
+    def stats(self) -> Dict[str, Dict]:
+        return {
+            state.label: {
+                "healthy": state.healthy,
+                "outstanding": state.outstanding,
+                "consecutive_failures": state.consecutive_failures,
+                "requests": metrics.get("ollama_pool.requests", host=state.label),
+            }
+            for state in self.hosts.values()
+        }
+
+
+ollama_pool = HostPool.from_config()
@@ -0,0 +1,75 @@
+"""
+Prompt Compilation Module
+
+System prompts are compiled once and reused byte for byte, so backends can reuse the
+KV state of the shared prefix instead of prefilling it on every call:
+
+- compiled(): builds a prompt that depends on the registered agents once per agent
+  registry, normalizing its whitespace; AgentHandler.add_agent() calls invalidate()
+- static(): the same normalization for prompts that never change
+- prefix_key(): short stable id of a system prompt, used as the prompt-cache hint for
+  backends that take one (OpenAI `prompt_cache_key`) and as the host affinity key of
+  the Ollama pool, whose prefix cache lives on each host
+
+Counters: prompts.compiled{prompt} and prompts.invalidations.
+"""
+
+import hashlib
+import threading
+from functools import lru_cache
+from typing import Callable, Dict, List, Tuple
+from utils import metrics
+from utils.log import get_custom_logger
+
+logger = get_custom_logger("PROMPTS")
+
+_lock = threading.Lock()
+_compiled: Dict[Tuple, str] = {}
+
+
+def normalize(text: str) -> str:
+    """Removes the source indentation and trailing spaces; they only cost prefill tokens."""
+    lines = text.strip("\n").splitlines()
+    first = next((line for line in lines if line.strip()), "")
+    # Interpolated blocks (e.g. the agent list) are less indented than the template,
+    # so dedent by the first line's indentation rather than the common one
+    indent = len(first) - len(first.lstrip())
+
+    def dedent(line: str) -> str:
+        if len(line) - len(line.lstrip()) >= indent:
+            line = line[indent:]
+        return line.rstrip()
+
+    return "\n".join(dedent(line) for line in lines).strip()
+
+
+def static(text: str) -> str:
+    return normalize(text)
+
+
+def registry_key(agent_list: List) -> Tuple:
+    return tuple((agent.name, agent.description) for agent in agent_list)
+
+
+def compiled(name: str, agent_list: List, build: Callable[[List], str]) -> str:
+    """Returns the prompt `name` for these agents, building it only on first use."""
+    key = (name, registry_key(agent_list))
+    text = _compiled.get(key)
+    if text is None:
+        text = normalize(build(agent_list))
+        with _lock:
+            text = _compiled.setdefault(key, text)
+        metrics.incr("prompts.compiled", prompt=name)
+        logger.info(f"Compiled prompt {name!r} ({len(text)} chars, key {prefix_key(text)})")
+    return text
+
+
+def invalidate() -> None:
+    with _lock:
+        _compiled.clear()
+    metrics.incr("prompts.invalidations")
+
+
+@lru_cache(maxsize=256)
+def prefix_key(system_message: str) -> str:
+    return hashlib.sha256(system_message.encode("utf-8")).hexdigest()[:16]
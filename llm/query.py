@@ -1,13 +1,17 @@
-import os
-from llm.invoke import model_invoke
-from dotenv import load_dotenv
+import random
+import asyncio
+from typing import Awaitable, Callable, List
+from llm import prompts
+from llm.invoke import amodel_invoke
+from llm.clients import run_sync
+from llm.fast_route import fast_router, Prediction
+from llm.semantic_cache import semantic_cache
+from config import FAST_ROUTER_ENABLED, FAST_ROUTER_SHADOW_RATE
+from utils import tracing
 from utils.log import get_custom_logger
 
 logger = get_custom_logger("QUERY")
 
-load_dotenv()
-MODEL = os.getenv("MODEL")
-
 route_payload = {
     "name": "route_query",
     "description": "Route the query to a specific agent",
@@ -24,14 +28,81 @@ route_payload = {
 }
 
 
-def route(user_message: str) -> dict:
-    logger.info("Routing message")
-
-    system = """
+SYSTEM_PROMPT = prompts.static(
+    """
             You are an intelligent assistant capable of routing queries. 
             If the user's query is conversational, route to conversational agent. 
             If it requires an action, route to the tool agent.
             """
+)
+
+# Keeps shadow comparisons alive until they finish
+_shadow_tasks = set()
+
 
-    response = model_invoke(system, user_message, route_payload)
+async def _llm_route(user_message: str) -> dict:
+    if semantic_cache is not None:
+        cached = await semantic_cache.alookup("route", user_message, SYSTEM_PROMPT)
+        if cached is not None:
+            tracing.annotate(cache="semantic_hit")
+            return cached
+
+    response = await amodel_invoke(
+        SYSTEM_PROMPT, user_message, route_payload, stage="router"
+    )
+    if semantic_cache is not None:
+        await semantic_cache.astore("route", user_message, SYSTEM_PROMPT, response)
     return response
+
+
+async def _shadow_compare(user_message: str, prediction: Prediction) -> None:
+    try:
+        response = await _llm_route(user_message)
+        fast_router.record_agreement(prediction, response["agent"])
+    except Exception as e:
+        logger.warning(f"Shadow routing failed: {str(e)}")
+
+
+@tracing.traced("route", stage="router")
+async def aroute(
+    user_message: str,
+    agent_list: List = None,
+    fallback: Callable[[str], Awaitable[dict]] = None,
+    fast_path: bool = FAST_ROUTER_ENABLED,
+) -> dict:
+    """
+    Routes a message to the conversational or tool agent.
+
+    Confident fast-path predictions are returned without a model call. Otherwise
+    `fallback` (the LLM router by default) is awaited; it must return a dict with
+    an "agent" key and may carry extra fields, e.g. a fused plan.
+    """
+    logger.info("Routing message")
+    fallback = fallback or _llm_route
+
+    if fast_path:
+        prediction = fast_router.classify(user_message, agent_list or [])
+
+        if fast_router.is_confident(prediction):
+            fast_router.record_decision(hit=True)
+            tracing.annotate(cache="fast_path")
+            logger.info(
+                f"Fast-path routed to {prediction.agent} "
+                f"(confidence {prediction.confidence:.2f})"
+            )
+            if random.random() < FAST_ROUTER_SHADOW_RATE:
+                task = asyncio.create_task(_shadow_compare(user_message, prediction))
+                _shadow_tasks.add(task)
+                task.add_done_callback(_shadow_tasks.discard)
+            return prediction.label
+
+        fast_router.record_decision(hit=False)
+        response = await fallback(user_message)
+        fast_router.record_agreement(prediction, response["agent"])
+        return response
+
+    return await fallback(user_message)
+
+
+def route(user_message: str, agent_list: List = None) -> dict:
+    return run_sync(aroute(user_message, agent_list))
@@ -0,0 +1,321 @@
+"""
+Record/replay of backend calls
+
+Captures real traffic so latency regressions can be reproduced offline:
+
+- record: every chat and stream backend call (llm.invoke.BACKENDS and
+  llm.stream.STREAM_BACKENDS) is appended to LLM_TRACE_PATH with its stage, timing,
+  token usage, response or error, and stream chunk offsets; each run_agent message is
+  recorded too, so the request mix can be replayed
+- replay: the backends are replaced by ones answering from a trace, waiting the
+  recorded time divided by LLM_REPLAY_SPEED (0 answers immediately)
+
+The trace is JSON lines, appended only. System prompts are written once as
+{"type": "prompt"} lines and referenced by id from the calls; {"type": "call"} lines
+carry the same "request"/"response" fields as the cassettes of utils.standin_server,
+which can serve a trace directly.
+
+Replay matches a call on its messages and requested tool. Identical requests get
+their recorded responses in order (the last one repeats). A request that was not
+recorded as is, e.g. a final answer whose prompt embeds step results with fresh ids,
+gets the recordings with the same system prompt and tool in turn; if there are none,
+ReplayMissError is raised.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import AsyncIterator, Deque, Dict, List, Optional, Tuple
+from llm import usage
+from llm.prompts import prefix_key
+from llm.retry import is_retryable
+from utils import tracing
+from utils.log import get_custom_logger
+from config import LLM_REPLAY_SPEED, LLM_TRACE_MODE, LLM_TRACE_PATH
+
+logger = get_custom_logger("RECORDING")
+
+MODES = ("off", "record", "replay")
+
+
+class ReplayMissError(LookupError):
+    """Raised when a replayed call has no recording"""
+
+    pass
+
+
+class ReplayedError(Exception):
+    """Stands in for a non-retryable error that was recorded"""
+
+    pass
+
+
+def cassette_key(messages: List[Dict], tool: Optional[str]) -> str:
+    """Identifies a request by its messages' roles and contents and the requested tool."""
+    normalized = [[m.get("role"), m.get("content") or ""] for m in messages]
+    return hashlib.sha256(json.dumps([normalized, tool]).encode("utf-8")).hexdigest()
+
+
+def _tool_name(tools: list, schema: dict) -> Optional[str]:
+    if tools:
+        return tools[0]["function"]["name"]
+    return schema["name"] if schema else None
+
+
+def _plain(value):
+    return value.model_dump() if hasattr(value, "model_dump") else value
+
+
+def _response_fields(response) -> Dict:
+    """Content and first tool call arguments of an Ollama-shaped response."""
+    message = _plain(response["message"])
+    fields = {"content": message.get("content") or ""}
+    tool_calls = message.get("tool_calls")
+    if tool_calls:
+        fields["arguments"] = (_plain(tool_calls[0]).get("function") or {}).get("arguments")
+    return fields
+
+
+class TraceWriter:
+    def __init__(self, path: str = LLM_TRACE_PATH):
+        self.path = path
+        self.start = time.time()
+        self._lock = threading.Lock()
+        self._prompts = set()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _write(self, record: Dict) -> None:
+        self._file.write(json.dumps(record, separators=(",", ":"), default=str) + "\n")
+
+    def _messages(self, messages: list) -> List[Dict]:
+        """Messages with system prompts replaced by references; call with the lock held."""
+        compact = []
+        for message in messages:
+            if message["role"] == "system":
+                ref = prefix_key(message["content"])
+                if ref not in self._prompts:
+                    self._prompts.add(ref)
+                    self._write({"type": "prompt", "id": ref, "text": message["content"]})
+                compact.append({"role": "system", "ref": ref})
+            else:
+                compact.append({"role": message["role"], "content": message["content"]})
+        return compact
+
+    def run(self, message: str) -> None:
+        with self._lock:
+            self._write({"type": "run", "at": round(time.time() - self.start, 6), "message": message})
+            self._file.flush()
+
+    def call(self, record: Dict, messages: list) -> None:
+        span = tracing.current()
+        with self._lock:
+            record["request"]["messages"] = self._messages(messages)
+            record["stage"] = span.attributes.get("stage") if span else None
+            self._write({"type": "call", **record})
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def _error_fields(error: BaseException) -> Dict:
+    return {"type": type(error).__name__, "message": str(error), "retryable": is_retryable(error)}
+
+
+def recording_chat(writer: TraceWriter, backend: str, chat):
+    async def record(model_name: str, messages: list, tools: list = None, schema: dict = None):
+        at = time.time() - writer.start
+        start = time.perf_counter()
+        record = {
+            "kind": "chat", "at": round(at, 6), "backend": backend, "model": model_name,
+            "request": {"tool": _tool_name(tools, schema)},
+        }
+        with usage.track() as meter:
+            try:
+                response = await chat(model_name, messages, tools, schema)
+                record["response"] = _response_fields(response)
+                return response
+            except Exception as e:
+                record["error"] = _error_fields(e)
+                raise
+            finally:
+                record["seconds"] = round(time.perf_counter() - start, 6)
+                record["usage"] = [meter.prompt_tokens, meter.completion_tokens]
+                # Cancelled calls (e.g. lost hedges) are not part of the traffic
+                if "response" in record or "error" in record:
+                    writer.call(record, messages)
+
+    return record
+
+
+def recording_stream(writer: TraceWriter, backend: str, stream):
+    async def record(target, messages: list) -> AsyncIterator[str]:
+        at = time.time() - writer.start
+        start = time.perf_counter()
+        record = {
+            "kind": "stream", "at": round(at, 6), "backend": backend, "model": target.model,
+            "request": {"tool": None},
+        }
+        chunks = []
+        with usage.track() as meter:
+            try:
+                async for content in stream(target, messages):
+                    chunks.append([round(time.perf_counter() - start, 6), content])
+                    yield content
+                record["response"] = {"content": "".join(c for _, c in chunks)}
+            except Exception as e:
+                record["error"] = _error_fields(e)
+                raise
+            finally:
+                record["seconds"] = round(time.perf_counter() - start, 6)
+                record["chunks"] = chunks
+                record["usage"] = [meter.prompt_tokens, meter.completion_tokens]
+                if "response" in record or "error" in record:
+                    writer.call(record, messages)
+
+    return record
+
+
+def load_trace(path: str = LLM_TRACE_PATH) -> Tuple[List[str], List[Dict]]:
+    """Returns the recorded run_agent messages and the calls, with prompts expanded."""
+    prompts: Dict[str, str] = {}
+    runs: List[str] = []
+    calls: List[Dict] = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            match record.get("type"):
+                case "prompt":
+                    prompts[record["id"]] = record["text"]
+                case "run":
+                    runs.append(record["message"])
+                case "call":
+                    record["request"]["messages"] = [
+                        {"role": m["role"], "content": prompts[m["ref"]]} if "ref" in m else m
+                        for m in record["request"]["messages"]
+                    ]
+                    calls.append(record)
+    return runs, calls
+
+
+class Replayer:
+    def __init__(self, calls: List[Dict], speed: float = LLM_REPLAY_SPEED):
+        self.speed = speed
+        self.misses = 0
+        self.approximate = 0
+        self._calls: Dict[Tuple[str, str], Deque[Dict]] = defaultdict(deque)
+        self._similar: Dict[Tuple, Deque[Dict]] = defaultdict(deque)
+        for call in calls:
+            request = call["request"]
+            key = cassette_key(request["messages"], request.get("tool"))
+            self._calls[(call["kind"], key)].append(call)
+            self._similar[self._similar_key(call["kind"], request["messages"], request.get("tool"))].append(call)
+
+    @staticmethod
+    def _similar_key(kind: str, messages: list, tool: Optional[str]) -> Tuple:
+        system = next((m["content"] for m in messages if m["role"] == "system"), None)
+        return kind, tool, system
+
+    def take(self, kind: str, messages: list, tool: Optional[str]) -> Dict:
+        recorded = self._calls.get((kind, cassette_key(messages, tool)))
+        if recorded:
+            # The last recording answers every further identical request
+            return recorded.popleft() if len(recorded) > 1 else recorded[0]
+
+        similar = self._similar.get(self._similar_key(kind, messages, tool))
+        if similar:
+            self.approximate += 1
+            similar.rotate(-1)
+            return similar[-1]
+
+        self.misses += 1
+        raise ReplayMissError(f"No recorded {kind} call for this request (tool={tool})")
+
+    async def _wait(self, seconds: float) -> None:
+        """Waits `seconds` of recorded time."""
+        if self.speed > 0 and seconds > 0:
+            await asyncio.sleep(seconds / self.speed)
+
+    @staticmethod
+    def _raise(error: Dict) -> None:
+        message = f"{error['type']}: {error['message']}"
+        # Retryable errors have to stay retryable for the retry path to be replayed
+        raise ConnectionError(message) if error["retryable"] else ReplayedError(message)
+
+    async def chat(self, model_name: str, messages: list, tools: list = None, schema: dict = None):
+        tool = _tool_name(tools, schema)
+        call = self.take("chat", messages, tool)
+        await self._wait(call["seconds"])
+        usage.record(*call.get("usage", (0, 0)))
+        if call.get("error"):
+            self._raise(call["error"])
+
+        response = call["response"]
+        message = {"role": "assistant", "content": response.get("content") or ""}
+        if response.get("arguments") is not None:
+            message["tool_calls"] = [
+                {"function": {"name": tool, "arguments": response["arguments"]}}
+            ]
+        return {"message": message}
+
+    async def stream(self, target, messages: list) -> AsyncIterator[str]:
+        call = self.take("stream", messages, None)
+        start = time.perf_counter()
+        for offset, content in call.get("chunks", []):
+            await self._wait(offset - (time.perf_counter() - start) * self.speed)
+            yield content
+        await self._wait(call["seconds"] - (time.perf_counter() - start) * self.speed)
+        usage.record(*call.get("usage", (0, 0)))
+        if call.get("error"):
+            self._raise(call["error"])
+
+
+_writer: Optional[TraceWriter] = None
+
+
+def record_run(message: str) -> None:
+    """Notes a run_agent message in the trace being recorded, if any."""
+    if _writer is not None:
+        _writer.run(message)
+
+
+def start_recording(path: str = LLM_TRACE_PATH) -> TraceWriter:
+    global _writer
+    from llm import invoke, stream
+
+    _writer = TraceWriter(path)
+    for name, chat in list(invoke.BACKENDS.items()):
+        invoke.BACKENDS[name] = recording_chat(_writer, name, chat)
+    for name, backend_stream in list(stream.STREAM_BACKENDS.items()):
+        stream.STREAM_BACKENDS[name] = recording_stream(_writer, name, backend_stream)
+    logger.info(f"Recording backend calls to {os.path.abspath(path)}")
+    return _writer
+
+
+def start_replay(calls: List[Dict], speed: float = LLM_REPLAY_SPEED) -> Replayer:
+    from llm import invoke, stream
+
+    replayer = Replayer(calls, speed)
+    for name in invoke.BACKENDS:
+        invoke.BACKENDS[name] = replayer.chat
+    for name in stream.STREAM_BACKENDS:
+        stream.STREAM_BACKENDS[name] = replayer.stream
+    logger.info(f"Replaying {len(calls)} recorded calls (speed {speed or 'unlimited'})")
+    return replayer
+
+
+def setup_recording(mode: str = LLM_TRACE_MODE, path: str = LLM_TRACE_PATH) -> None:
+    """Applies LLM_TRACE_MODE; called once at startup."""
+    if mode not in MODES:
+        raise ValueError(f"Invalid trace mode: {mode}. Modes available: {', '.join(MODES)}")
+    if mode == "record":
+        start_recording(path)
+    elif mode == "replay":
+        start_replay(load_trace(path)[1])
@@ -0,0 +1,194 @@
+"""
+Local repair of malformed model output.
+
+Most invalid tool-call responses are fixable without asking the model again:
+
+- extract_json(): pulls a JSON object out of free text (code fences, surrounding prose)
+- close_truncated(): closes strings, arrays and objects cut off by a length limit
+- loads(): json.loads with both of the above as fallbacks
+- coerce(): walks a JSON schema and fixes types, e.g. stringified arrays/objects,
+  "3" for integers, "true" for booleans, or a single object where a list is expected
+
+Every applied fix is counted in utils.metrics as llm.repairs{kind=...}.
+"""
+
+import json
+import re
+from typing import Any, Dict, Optional
+from utils import metrics
+
+FENCE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.DOTALL)
+
+
+class RepairError(ValueError):
+    pass
+
+
+def _count(kind: str) -> None:
+    metrics.incr("llm.repairs", kind=kind)
+
+
+def close_truncated(text: str) -> str:
+    """Appends whatever closing quotes/brackets a truncated JSON document is missing."""
+    stack = []
+    in_string = False
+    escaped = False
+
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+
+    repaired = text.rstrip()
+    if in_string:
+        repaired += '"'
+    # A dangling separator or key cannot be completed meaningfully
+    repaired = re.sub(r'(,|:\s*|,\s*"[^"]*"\s*:?\s*)$', "", repaired)
+    return repaired + "".join(reversed(stack))
+
+
+def extract_json(text: str) -> Optional[str]:
+    """Returns the first JSON object or array embedded in text, if any."""
+    fenced = FENCE.search(text)
+    if fenced:
+        text = fenced.group(1)
+
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        return None
+    start = min(starts)
+
+    # Trim trailing prose after the last closing bracket, if the document is complete
+    end = max(text.rfind("}"), text.rfind("]"))
+    candidate = text[start : end + 1] if end > start else text[start:]
+    return candidate
+
+
+def loads(text: str) -> Any:
+    try:
+        return json.loads(text)
+    except (json.JSONDecodeError, TypeError):
+        pass
+
+    extracted = extract_json(text or "")
+    if extracted is None:
+        raise RepairError("No JSON found in text")
+
+    try:
+        value = json.loads(extracted)
+        _count("extracted")
+        return value
+    except json.JSONDecodeError:
+        pass
+
+    # Prefer closing everything after the opening bracket; trimming at the last
+    # closing bracket would silently drop a partially written trailing item
+    for candidate in (close_truncated(text[text.find(extracted):]), close_truncated(extracted)):
+        try:
+            value = json.loads(candidate)
+            _count("truncated")
+            return value
+        except json.JSONDecodeError:
+            continue
+
+    raise RepairError("Could not repair JSON")
+
+
+def _matches_variant(value: Dict, variant: Dict) -> bool:
+    # Variants are told apart by a single-value enum, e.g. {"type": {"enum": ["add"]}}
+    for key, prop in variant.get("properties", {}).items():
+        enum = prop.get("enum")
+        if enum and len(enum) == 1:
+            discriminator = value.get(key, value.get("type"))
+            if discriminator is not None and discriminator not in enum:
+                return False
+    return True
+
+
+def coerce(value: Any, schema: Dict) -> Any:
+    """Best-effort conversion of value to the shape described by a JSON schema."""
+    if not schema:
+        return value
+
+    if "oneOf" in schema or "anyOf" in schema:
+        variants = schema.get("oneOf") or schema.get("anyOf")
+        if isinstance(value, str):
+            value = _parse_nested(value)
+        if isinstance(value, dict):
+            for variant in variants:
+                if _matches_variant(value, variant):
+                    return coerce(value, {**variant, "type": "object"})
+        return value
+
+    expected = schema.get("type")
+
+    if expected == "object":
+        if isinstance(value, str):
+            value = _parse_nested(value)
+        if not isinstance(value, dict):
+            return value
+        properties = schema.get("properties", {})
+        return {
+            key: coerce(item, properties[key]) if key in properties else item
+            for key, item in value.items()
+        }
+
+    if expected == "array":
+        if isinstance(value, str):
+            value = _parse_nested(value)
+        if isinstance(value, dict):
+            _count("wrapped_list")
+            value = [value]
+        if not isinstance(value, list):
+            return value
+        items = schema.get("items", {})
+        return [coerce(item, items) for item in value]
+
+    if expected == "integer" and isinstance(value, str):
+        try:
+            coerced = int(value.strip().lstrip("#"))
+            _count("integer")
+            return coerced
+        except ValueError:
+            return value
+
+    if expected == "boolean" and isinstance(value, str):
+        if value.strip().lower() in ("true", "false"):
+            _count("boolean")
+            return value.strip().lower() == "true"
+        return value
+
+    if expected == "string" and isinstance(value, (int, float, bool)):
+        _count("string")
+        return str(value)
+
+    return value
+
+
+def _parse_nested(value: str) -> Any:
+    try:
+        parsed = loads(value)
+    except RepairError:
+        return value
+    _count("stringified")
+    return parsed
+
+
+def missing_required(value: Any, schema: Dict) -> Optional[str]:
+    """Returns the first missing required top-level field, if any."""
+    if not isinstance(value, dict):
+        return "<object>"
+    for key in schema.get("required", []):
+        if key not in value:
+            return key
+    return None
@@ -0,0 +1,102 @@
+"""
+Retry policies for model calls.
+
+Each pipeline stage has its own budget: a maximum number of attempts, exponential
+backoff with full jitter between them, and a hard deadline for the whole call
+including retries. Only errors a new attempt could fix are retried: invalid tool
+calls that local repair could not fix, transport failures, timeouts, rate limits
+and 5xx responses.
+
+Retries are counted in utils.metrics as llm.retries{stage=...}.
+"""
+
+import asyncio
+import random
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, TypeVar
+
+import httpx
+import ollama
+import openai
+from llm import ToolCallValidationError
+from utils import metrics, tracing
+from utils.log import get_custom_logger
+
+logger = get_custom_logger("RETRY")
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_attempts: int = 3
+    base_delay: float = 0.25
+    max_delay: float = 4.0
+    deadline: float = 120.0
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff before the given retry (1-based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+# Routing is cheap to redo and latency-critical; planning and agents get more room
+RETRY_POLICIES: Dict[str, RetryPolicy] = {
+    "default": RetryPolicy(),
+    "router": RetryPolicy(max_attempts=2, base_delay=0.1, max_delay=1.0, deadline=20.0),
+    "planner": RetryPolicy(max_attempts=3, base_delay=0.25, max_delay=2.0, deadline=90.0),
+    "todo_agent": RetryPolicy(max_attempts=3, base_delay=0.25, max_delay=2.0, deadline=60.0),
+    "final_answer": RetryPolicy(max_attempts=2, base_delay=0.5, max_delay=2.0, deadline=120.0),
+}
+
+
+def get_retry_policy(stage: str) -> RetryPolicy:
+    return RETRY_POLICIES.get(stage, RETRY_POLICIES["default"])
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (ToolCallValidationError, TimeoutError, ConnectionError)):
+        return True
+    if isinstance(error, httpx.TransportError):
+        return True
+    if isinstance(error, ollama.ResponseError):
+        return error.status_code == 429 or error.status_code >= 500
+    if isinstance(
+        error,
+        (
+            openai.APIConnectionError,
+            openai.RateLimitError,
+            openai.InternalServerError,
+        ),
+    ):
+        return True
+    return False
+
+
+async def retry_async(
+    call: Callable[[], Awaitable[T]], policy: RetryPolicy, stage: str = "default"
+) -> T:
+    """Runs call() until it succeeds, the attempts run out or the deadline passes."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + policy.deadline
+    attempt = 1
+
+    async with asyncio.timeout_at(deadline):
+        while True:
+            try:
+                return await call()
+            except Exception as e:
+                if not is_retryable(e) or attempt >= policy.max_attempts:
+                    raise
+
+                delay = policy.backoff(attempt)
+                if loop.time() + delay >= deadline:
+                    raise
+
+                metrics.incr("llm.retries", stage=stage)
+                tracing.add(retries=1)
+                logger.warning(
+                    f"[{stage}] attempt {attempt}/{policy.max_attempts} failed: {str(e)}. "
+                    f"Retrying in {delay:.2f}s"
+                )
+                await asyncio.sleep(delay)
+                attempt += 1
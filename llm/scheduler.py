@@ -0,0 +1,147 @@
+"""
+Step Scheduler Module
+
+This module executes a TaskList as a dependency graph instead of a flat sequence. It provides:
+
+- build_dag(): Derives step dependencies from the step order and `is_async`
+- StepScheduler: Runs ready steps concurrently with global and per-agent limits
+
+Dependency rules:
+- Steps are ordered by `step_number`; steps are identified by their position in
+  that order, so duplicate or non-contiguous numbers run like the plan lists them
+- An async step depends only on the closest preceding sync step
+- A sync step is a barrier: it depends on every step before it, and every later
+  step depends on it
+
+run() returns results in step order, regardless of completion order; run_iter()
+yields them as they complete.
+"""
+
+import asyncio
+import time
+from typing import AsyncIterator, Dict, List, Set, Tuple
+from llm.agent import Agent, AgentTask
+from utils import tracing
+from utils.log import get_custom_logger
+from config import TASK_MAX_WORKERS, AGENT_MAX_CONCURRENCY
+
+logger = get_custom_logger("SCHEDULER")
+
+
+def build_dag(steps: List) -> Dict[int, Set[int]]:
+    """
+    Returns a mapping of step index -> indices of the steps it must wait for, for
+    `steps` already ordered by step_number.
+    """
+    dependencies: Dict[int, Set[int]] = {}
+    barrier = None
+    since_barrier: List[int] = []
+
+    for index, task in enumerate(steps):
+        if task.is_async:
+            dependencies[index] = {barrier} if barrier is not None else set()
+            since_barrier.append(index)
+        else:
+            deps = set(since_barrier)
+            if barrier is not None:
+                deps.add(barrier)
+            dependencies[index] = deps
+            barrier = index
+            since_barrier = []
+
+    return dependencies
+
+
+class StepScheduler:
+    def __init__(
+        self,
+        agent_list: List[Agent],
+        max_workers: int = TASK_MAX_WORKERS,
+        agent_concurrency: int = AGENT_MAX_CONCURRENCY,
+    ):
+        self.agents = {agent.name.lower(): agent for agent in agent_list}
+        self.workers = asyncio.Semaphore(max_workers)
+        self.agent_limits = {
+            name: asyncio.Semaphore(agent.max_concurrency or agent_concurrency)
+            for name, agent in self.agents.items()
+        }
+
+    async def run(self, task_list) -> List[Dict]:
+        results = [item async for item in self._run(task_list)]
+        return [result for _, result in sorted(results, key=lambda item: item[0])]
+
+    async def run_iter(self, task_list) -> AsyncIterator[Dict]:
+        """Yields step results in completion order."""
+        async for _, result in self._run(task_list):
+            yield result
+
+    async def _run(self, task_list) -> AsyncIterator[Tuple[int, Dict]]:
+        """Yields (step index, result) pairs in completion order."""
+        steps = sorted(task_list.steps, key=lambda t: t.step_number)
+        dependencies = build_dag(steps)
+        done = [asyncio.Event() for _ in steps]
+
+        async def run_step(index, task):
+            for dep in dependencies[index]:
+                await done[dep].wait()
+            try:
+                return index, await self._execute(task)
+            finally:
+                done[index].set()
+
+        start = time.perf_counter()
+        pending = [asyncio.create_task(run_step(i, task)) for i, task in enumerate(steps)]
+        try:
+            for next_result in asyncio.as_completed(pending):
+                yield await next_result
+        finally:
+            # The consumer may stop early; do not leave steps running unobserved
+            for task in pending:
+                task.cancel()
+
+        logger.info(
+            f"Executed {len(steps)} steps in {time.perf_counter() - start:.2f}s"
+        )
+
+    async def _execute(self, task) -> Dict:
+        agent_name = task.agent.lower()
+
+        if agent_name not in self.agents:
+            error_msg = f"Agent '{agent_name}' not found in agent list"
+            logger.error(error_msg)
+            return {
+                "step": task.step_number,
+                "status": "error",
+                "result": "None",
+                "message": error_msg,
+            }
+
+        agent = self.agents[agent_name]
+        agent_task = AgentTask(task=task.task, expected_output=task.expected_output)
+
+        with tracing.span("step", agent=agent_name, step=task.step_number) as span:
+            queued = time.perf_counter()
+            # The agent's own limit first, so steps waiting on a saturated agent do
+            # not hold global slots other agents' steps could use
+            async with self.agent_limits[agent_name], self.workers:
+                span.set(queue_seconds=time.perf_counter() - queued)
+                logger.info(f"[Task #{task.step_number}] Routing to {agent_name}: {task.task}")
+                try:
+                    response = await agent.aexecute(agent_task)
+                except Exception as e:
+                    logger.error(f"Task [#{task.step_number}] failed: {str(e)}")
+                    span.set(status="error")
+                    return {
+                        "step": task.step_number,
+                        "status": "error",
+                        "result": "None",
+                        "message": str(e),
+                    }
+
+        logger.info(f"Task [#{task.step_number}] completed successfully")
+        return {
+            "step": task.step_number,
+            "status": "success",
+            "result": response,
+            "is_async": task.is_async,
+        }
@@ -0,0 +1,372 @@
+"""
+Semantic Cache Module
+
+Caches router decisions and generated plans by meaning instead of exact text, so
+paraphrases such as "what's on my list" and "show my todos" reuse the same result.
+
+- Messages are embedded (Ollama or OpenAI embeddings, or local hashed n-grams) after
+  masking their entities, and the nearest cached message is reused when its cosine
+  similarity reaches SEMANTIC_CACHE_THRESHOLD
+- Cached values are parameterized: quoted titles, ids and dates found in the original
+  message are turned into slots and re-filled from the new message. A hit whose
+  changed entities cannot be re-filled is treated as a miss
+- Entries are scoped by a fingerprint of the system prompt that produced them. The
+  planner prompt lists the registered agents, so registering, removing or
+  redescribing an agent invalidates the cached plans
+
+Index backends:
+- NumpyIndex: in-process matrix of normalized embeddings (requires numpy)
+- PgVectorIndex: the pgvector database from ci/docker-compose.yml (requires psycopg)
+
+Counters: semantic_cache{namespace,result=hit|miss|stale_entities} and
+semantic_cache.invalidations{namespace}.
+"""
+
+import asyncio
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from llm.clients import get_openai_client
+from llm.pool import ollama_pool
+from llm.prompts import prefix_key
+from llm.fast_route import hashed_features, tokenize
+from utils import metrics
+from utils.log import get_custom_logger
+from config import (
+    EMBEDDING_BACKEND,
+    EMBEDDING_MODEL,
+    OLLAMA_KEEP_ALIVE,
+    PGVECTOR_DSN,
+    SEMANTIC_CACHE_BACKEND,
+    SEMANTIC_CACHE_ENABLED,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_TTL,
+)
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+logger = get_custom_logger("SEMANTIC CACHE")
+
+HASHED_DIM = 4096
+
+ENTITY = re.compile(
+    r"['\"‘“](?P<title>[^'\"’”]+)['\"’”]"
+    r"|(?P<date>\b\d{4}-\d{2}-\d{2}\b)"
+    r"|#?(?P<id>\b\d+\b)"
+)
+SLOT = "\x00{}\x00"
+
+
+def fingerprint(system_message: str) -> str:
+    return prefix_key(system_message)
+
+
+def extract_entities(message: str) -> Tuple[str, List[Tuple[str, str]]]:
+    """Returns the message with entities replaced by their kind, and the entities."""
+    entities: List[Tuple[str, str]] = []
+
+    def mask(match: re.Match) -> str:
+        kind = match.lastgroup
+        entities.append((kind, match.group(kind)))
+        return f"<{kind}>"
+
+    return ENTITY.sub(mask, message), entities
+
+
+def _substitute(value: Any, replace) -> Any:
+    if isinstance(value, str):
+        return replace(value)
+    if isinstance(value, list):
+        return [_substitute(item, replace) for item in value]
+    if isinstance(value, dict):
+        return {key: _substitute(item, replace) for key, item in value.items()}
+    return value
+
+
+def parameterize(value: Any, entities: List[Tuple[str, str]]) -> Tuple[Any, List[bool]]:
+    """Replaces entity values in every string of value with slots.
+
+    Returns the template and, per entity, whether it was found (and so can be re-filled).
+    """
+    bound = [False] * len(entities)
+    # Longest values first, so "12" is not slotted inside "2026-12-01"
+    order = sorted(range(len(entities)), key=lambda i: -len(entities[i][1]))
+
+    def replace(text: str) -> str:
+        for i in order:
+            kind, entity = entities[i]
+            if kind == "title":
+                pattern = re.compile(re.escape(entity), re.IGNORECASE)
+            else:
+                pattern = re.compile(r"(?<![\d-])" + re.escape(entity) + r"(?![\d-])")
+            text, count = pattern.subn(SLOT.format(i), text)
+            bound[i] = bound[i] or count > 0
+        return text
+
+    return _substitute(value, replace), bound
+
+
+def fill(template: Any, entities: List[Tuple[str, str]]) -> Any:
+    def replace(text: str) -> str:
+        return re.sub(
+            "\x00(\\d+)\x00", lambda m: entities[int(m.group(1))][1], text
+        )
+
+    return _substitute(template, replace)
+
+
+class NumpyIndex:
+    blocking = False
+
+    def __init__(self, max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES):
+        if np is None:
+            raise ImportError("numpy is required for the in-process semantic cache")
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # namespace -> (matrix of unit vectors, [(fingerprint, expires_at, entry)])
+        self._namespaces: Dict[str, Tuple[Any, List[tuple]]] = {}
+
+    def add(self, namespace, fp, vector, entry, expires_at) -> None:
+        with self._lock:
+            matrix, rows = self._namespaces.get(namespace, (None, []))
+            vector = vector.reshape(1, -1)
+            matrix = vector if matrix is None else np.vstack([matrix, vector])
+            rows = rows + [(fp, expires_at, entry)]
+            if len(rows) > self.max_entries:
+                # Oldest entries go first
+                drop = len(rows) - self.max_entries
+                matrix, rows = matrix[drop:], rows[drop:]
+            self._namespaces[namespace] = (matrix, rows)
+
+    def search(self, namespace, fp, vector) -> Optional[Tuple[float, dict]]:
+        with self._lock:
+            matrix, rows = self._namespaces.get(namespace, (None, []))
+            if matrix is None or matrix.shape[1] != vector.shape[0]:
+                return None
+            scores = matrix @ vector
+            now = time.time()
+            for i in np.argsort(-scores)[:8]:
+                row_fp, expires_at, entry = rows[i]
+                if row_fp == fp and expires_at > now:
+                    return float(scores[i]), entry
+            return None
+
+    def invalidate(self, namespace, keep_fp) -> int:
+        with self._lock:
+            matrix, rows = self._namespaces.get(namespace, (None, []))
+            keep = [i for i, row in enumerate(rows) if row[0] == keep_fp]
+            if len(keep) == len(rows):
+                return 0
+            self._namespaces[namespace] = (
+                matrix[keep] if keep else None,
+                [rows[i] for i in keep],
+            )
+            return len(rows) - len(keep)
+
+
+class PgVectorIndex:
+    blocking = True
+
+    def __init__(self, dsn: str = PGVECTOR_DSN):
+        import psycopg
+
+        self._conn = psycopg.connect(dsn, autocommit=True)
+        self._lock = threading.Lock()
+        self._dim = None
+
+    @staticmethod
+    def _literal(vector) -> str:
+        return "[" + ",".join(f"{x:.6f}" for x in vector) + "]"
+
+    def _ensure_table(self, dim: int) -> None:
+        if self._dim == dim:
+            return
+        self._conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
+        self._conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS semantic_cache_{dim} (
+                id BIGSERIAL PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                embedding vector({dim}) NOT NULL,
+                entry JSONB NOT NULL,
+                expires_at DOUBLE PRECISION NOT NULL
+            )
+            """
+        )
+        self._dim = dim
+
+    def add(self, namespace, fp, vector, entry, expires_at) -> None:
+        with self._lock:
+            self._ensure_table(len(vector))
+            self._conn.execute(
+                f"INSERT INTO semantic_cache_{self._dim} "
+                "(namespace, fingerprint, embedding, entry, expires_at) "
+                "VALUES (%s, %s, %s::vector, %s::jsonb, %s)",
+                (namespace, fp, self._literal(vector), json.dumps(entry), expires_at),
+            )
+
+    def search(self, namespace, fp, vector) -> Optional[Tuple[float, dict]]:
+        with self._lock:
+            self._ensure_table(len(vector))
+            literal = self._literal(vector)
+            row = self._conn.execute(
+                f"SELECT 1 - (embedding <=> %s::vector), entry FROM semantic_cache_{self._dim} "
+                "WHERE namespace = %s AND fingerprint = %s AND expires_at > %s "
+                "ORDER BY embedding <=> %s::vector LIMIT 1",
+                (literal, namespace, fp, time.time(), literal),
+            ).fetchone()
+        if row is None:
+            return None
+        score, entry = row
+        return float(score), entry if isinstance(entry, dict) else json.loads(entry)
+
+    def invalidate(self, namespace, keep_fp) -> int:
+        with self._lock:
+            if self._dim is None:
+                return 0
+            cursor = self._conn.execute(
+                f"DELETE FROM semantic_cache_{self._dim} "
+                "WHERE namespace = %s AND fingerprint <> %s",
+                (namespace, keep_fp),
+            )
+            return cursor.rowcount
+
+
+async def embed(text: str):
+    """Returns a unit-length embedding of text as a numpy vector."""
+    match EMBEDDING_BACKEND:
+        case "ollama":
+            async with ollama_pool.lease(EMBEDDING_MODEL) as client:
+                response = await client.embed(
+                    model=EMBEDDING_MODEL, input=text, keep_alive=OLLAMA_KEEP_ALIVE
+                )
+            vector = np.asarray(response["embeddings"][0], dtype=np.float32)
+        case "openai":
+            response = await get_openai_client().embeddings.create(
+                model=EMBEDDING_MODEL, input=text
+            )
+            vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+        case "hashed":
+            vector = np.zeros(HASHED_DIM, dtype=np.float32)
+            for index, value in hashed_features(tokenize(text), HASHED_DIM).items():
+                vector[index] = value
+        case _:
+            raise ValueError(f"Invalid embedding backend: {EMBEDDING_BACKEND}")
+
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticCache:
+    def __init__(
+        self,
+        index,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        ttl: float = SEMANTIC_CACHE_TTL,
+    ):
+        self.index = index
+        self.threshold = threshold
+        self.ttl = ttl
+        self._fingerprints: Dict[str, str] = {}
+        # A miss is usually followed by a store of the same message; embed it once
+        self._embeddings: "OrderedDict[str, Any]" = OrderedDict()
+
+    @classmethod
+    def from_config(cls) -> Optional["SemanticCache"]:
+        if not SEMANTIC_CACHE_ENABLED:
+            return None
+        if np is None:
+            logger.warning("numpy is not installed; semantic cache disabled")
+            return None
+        try:
+            index = PgVectorIndex() if SEMANTIC_CACHE_BACKEND == "pgvector" else NumpyIndex()
+        except Exception as e:
+            logger.warning(f"Could not open {SEMANTIC_CACHE_BACKEND} index: {str(e)}")
+            return None
+        return cls(index)
+
+    async def _call(self, method, *args):
+        if self.index.blocking:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    async def _embed(self, masked: str):
+        vector = self._embeddings.get(masked)
+        if vector is None:
+            vector = await embed(masked)
+            self._embeddings[masked] = vector
+            if len(self._embeddings) > 256:
+                self._embeddings.popitem(last=False)
+        return vector
+
+    async def _check_fingerprint(self, namespace: str, fp: str) -> None:
+        if self._fingerprints.get(namespace) == fp:
+            return
+        if namespace in self._fingerprints:
+            dropped = await self._call(self.index.invalidate, namespace, fp)
+            metrics.incr("semantic_cache.invalidations", namespace=namespace)
+            logger.info(f"[{namespace}] prompt changed, dropped {dropped} entries")
+        self._fingerprints[namespace] = fp
+
+    async def alookup(self, namespace: str, message: str, system_message: str) -> Any:
+        """Returns the cached value for a message similar to this one, or None."""
+        fp = fingerprint(system_message)
+        try:
+            await self._check_fingerprint(namespace, fp)
+            masked, entities = extract_entities(message)
+            found = await self._call(self.index.search, namespace, fp, await self._embed(masked))
+        except Exception as e:
+            logger.warning(f"[{namespace}] lookup failed: {str(e)}")
+            return None
+
+        if found is None or found[0] < self.threshold:
+            metrics.incr("semantic_cache", namespace=namespace, result="miss")
+            return None
+
+        score, entry = found
+        old = [tuple(e) for e in entry["entities"]]
+        changed = [
+            i
+            for i, (before, after) in enumerate(zip(old, entities))
+            if before[1] != after[1]
+        ]
+        if [kind for kind, _ in old] != [kind for kind, _ in entities] or any(
+            not entry["bound"][i] for i in changed
+        ):
+            metrics.incr("semantic_cache", namespace=namespace, result="stale_entities")
+            return None
+
+        metrics.incr("semantic_cache", namespace=namespace, result="hit")
+        logger.info(f"[{namespace}] hit (similarity {score:.3f})")
+        return fill(entry["template"], entities)
+
+    async def astore(
+        self, namespace: str, message: str, system_message: str, value: Any
+    ) -> None:
+        fp = fingerprint(system_message)
+        masked, entities = extract_entities(message)
+        template, bound = parameterize(value, entities)
+        entry = {"template": template, "entities": entities, "bound": bound}
+        try:
+            await self._check_fingerprint(namespace, fp)
+            await self._call(
+                self.index.add,
+                namespace,
+                fp,
+                await self._embed(masked),
+                entry,
+                time.time() + self.ttl,
+            )
+        except Exception as e:
+            logger.warning(f"[{namespace}] store failed: {str(e)}")
+
+
+semantic_cache = SemanticCache.from_config()
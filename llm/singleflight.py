@@ -0,0 +1,77 @@
+"""
+Single-flight Module
+
+Coalesces identical in-flight model calls: while a call for a key is pending, later
+callers with the same key wait on it instead of sending their own request, and all of
+them receive its result (or its exception).
+
+The shared call keeps running while at least one caller is still waiting; it is
+cancelled only when every waiter has been cancelled. Sync callers go through
+run_sync() and so share the same event loop and the same in-flight calls as async
+callers.
+
+Coalesced calls are counted in utils.metrics as llm.coalesced{stage=...}.
+"""
+
+import asyncio
+import copy
+from typing import Any, Awaitable, Callable, Dict, Tuple
+from utils import metrics, tracing
+from utils.log import get_custom_logger
+
+logger = get_custom_logger("SINGLEFLIGHT")
+
+
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        # Keyed by loop too: a task can only be awaited from the loop that runs it
+        self._calls: Dict[Tuple[asyncio.AbstractEventLoop, str], _Call] = {}
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(
+        self, key: str, factory: Callable[[], Awaitable[Any]], stage: str = "default"
+    ) -> Any:
+        loop = asyncio.get_running_loop()
+        call_key = (loop, key)
+        call = self._calls.get(call_key)
+        leader = call is None
+
+        if leader:
+            call = _Call(loop.create_task(factory()))
+            self._calls[call_key] = call
+
+            def forget(_, call=call):
+                if self._calls.get(call_key) is call:
+                    del self._calls[call_key]
+
+            call.task.add_done_callback(forget)
+        else:
+            metrics.incr("llm.coalesced", stage=stage)
+            tracing.annotate(cache="coalesced")
+            logger.info(f"[{stage}] Joined an in-flight call ({call.waiters} waiting)")
+
+        call.waiters += 1
+        try:
+            result = await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Every caller went away; nobody needs the result any more. Forget the
+                # call now so a new caller does not join a cancelling task
+                call.task.cancel()
+                if self._calls.get(call_key) is call:
+                    del self._calls[call_key]
+
+        # Waiters must not share one mutable result
+        return result if leader else copy.deepcopy(result)
+
+
+single_flight = SingleFlight()
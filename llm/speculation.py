@@ -0,0 +1,122 @@
+"""
+Speculative Planning Module
+
+Starts llm.task.generate while llm.query.route is still running, so tool requests do
+not pay for the two model calls back to back. If the router answers "conversational"
+the speculative plan is cancelled (or thrown away if it already finished).
+
+Policy (SPECULATIVE_PLANNING):
+- "off": never speculate
+- "always": speculate on every message that reaches the LLM router
+  (confident fast-path decisions never speculate)
+- "lean_tool": speculate only when the local fast router leans towards "tool" with
+  at least SPECULATION_MIN_TOOL_PROB
+
+Metrics (see utils.metrics):
+- speculation.outcome{result=used|discarded|cancelled|failed}
+- speculation.latency_saved_seconds: overlap between planning and routing on used plans
+- speculation.wasted_tokens / speculation.wasted_seconds: cost of discarded plans
+"""
+
+import asyncio
+import time
+from typing import Dict, List, Optional
+import llm
+from llm import usage
+from llm.fast_route import fast_router
+from utils import metrics
+from utils.log import get_custom_logger
+from config import (
+    FAST_ROUTER_ENABLED,
+    SPECULATIVE_PLANNING,
+    SPECULATION_MIN_TOOL_PROB,
+)
+
+logger = get_custom_logger("SPECULATION")
+
+
+def should_speculate(
+    message: str, agent_list: List, policy: str = SPECULATIVE_PLANNING
+) -> bool:
+    if policy == "off":
+        return False
+
+    prediction = fast_router.classify(message, agent_list)
+    if FAST_ROUTER_ENABLED and fast_router.is_confident(prediction):
+        # Routing will not call the model, so there is nothing to overlap with
+        return False
+
+    match policy:
+        case "always":
+            return True
+        case "lean_tool":
+            p_tool = (
+                prediction.confidence
+                if prediction.agent == "tool"
+                else 1.0 - prediction.confidence
+            )
+            return p_tool >= SPECULATION_MIN_TOOL_PROB
+        case _:
+            raise ValueError(f"Invalid speculation policy: {policy}")
+
+
+class Speculation:
+    def __init__(self, message: str, agent_list: List):
+        self.usage = usage.Usage()
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.task = asyncio.create_task(self._generate(message, agent_list))
+
+    async def _generate(self, message: str, agent_list: List):
+        try:
+            with usage.track(self.usage):
+                return await llm.task.agenerate(message, agent_list)
+        finally:
+            self.finished = time.perf_counter()
+
+    async def take(self):
+        """Returns the speculative TaskList, or None if planning failed."""
+        routed = time.perf_counter()
+        try:
+            tasks = await self.task
+        except Exception as e:
+            logger.warning(f"Speculative planning failed: {str(e)}")
+            metrics.incr("speculation.outcome", result="failed")
+            return None
+
+        saved = min(routed, self.finished) - self.started
+        metrics.incr("speculation.outcome", result="used")
+        metrics.incr("speculation.latency_saved_seconds", saved)
+        logger.info(f"Speculative plan used, saved {saved:.2f}s")
+        return tasks
+
+    def discard(self) -> None:
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        metrics.incr("speculation.wasted_seconds", elapsed)
+
+        if self.task.done():
+            metrics.incr("speculation.outcome", result="discarded")
+            # Retrieve the exception, if any, so it is not reported as unhandled
+            if not self.task.cancelled():
+                self.task.exception()
+        else:
+            self.task.cancel()
+            metrics.incr("speculation.outcome", result="cancelled")
+
+        # Tokens of a cancelled in-flight call are not reported by the backend
+        metrics.incr("speculation.wasted_tokens", self.usage.total_tokens)
+        logger.info(
+            f"Speculative plan discarded after {elapsed:.2f}s "
+            f"({self.usage.total_tokens} tokens)"
+        )
+
+
+def start(message: str, agent_list: List) -> Optional[Speculation]:
+    if not should_speculate(message, agent_list):
+        return None
+    logger.info("Starting speculative task generation")
+    return Speculation(message, agent_list)
+
+
+def stats() -> Dict[str, float]:
+    return metrics.snapshot("speculation.")
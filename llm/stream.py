@@ -1,19 +1,92 @@
-import os
-import ollama
-from dotenv import load_dotenv
+import time
+from typing import AsyncIterator
+from llm.clients import get_openai_client, iter_sync
+from llm.models import ModelTarget, model_routes
+from llm.pool import ollama_pool
+from llm.prompts import prefix_key
+from llm.retry import is_retryable
+from llm import usage
+from utils import metrics, tracing
+from utils.log import get_custom_logger
+from config import OLLAMA_KEEP_ALIVE, PROMPT_CACHE_HINTS
 
-load_dotenv()
-OLLAMA_MODEL = os.getenv("OLLAMA_MODEL")
+logger = get_custom_logger("STREAM")
 
 
-def stream(message):
-    formatted_message = {"role": "user", "content": message}
+async def _ollama_stream(target: ModelTarget, messages: list) -> AsyncIterator[str]:
+    # The lease is held until the stream is consumed, so it counts as outstanding
+    affinity = None
+    if PROMPT_CACHE_HINTS and messages[0]["role"] == "system":
+        affinity = prefix_key(messages[0]["content"])
+    async with ollama_pool.lease(target.model, affinity) as client:
+        chunks = await client.chat(
+            model=target.model,
+            messages=messages,
+            stream=True,
+            keep_alive=OLLAMA_KEEP_ALIVE,
+        )
+        async for chunk in chunks:
+            if chunk.get("done"):
+                usage.record(chunk.get("prompt_eval_count") or 0, chunk.get("eval_count") or 0)
+            yield chunk["message"]["content"]
+
 
-    stream = ollama.chat(
-        model=OLLAMA_MODEL,
-        messages=[formatted_message],
+async def _openai_stream(target: ModelTarget, messages: list) -> AsyncIterator[str]:
+    chunks = await get_openai_client().chat.completions.create(
+        model=target.model,
+        messages=messages,
         stream=True,
+        stream_options={"include_usage": True},
     )
-    for chunk in stream:
-        print(chunk["message"]["content"], end="", flush=True)
+    async for chunk in chunks:
+        if chunk.usage:
+            usage.record(chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+STREAM_BACKENDS = {
+    "ollama": _ollama_stream,
+    "deepseek": _ollama_stream,
+    "openai": _openai_stream,
+}
+
+
+async def astream(
+    message, system_message: str = None, stage: str = "chat"
+) -> AsyncIterator[str]:
+    messages = [{"role": "user", "content": message}]
+    if system_message:
+        messages.insert(0, {"role": "system", "content": system_message})
+
+    chain = model_routes.chain(stage)
+    with tracing.span("stream", stage=stage) as span:
+        for i, target in enumerate(chain):
+            started = False
+            span.set(model=str(target))
+            try:
+                async for content in STREAM_BACKENDS[target.backend](target, messages):
+                    if not started:
+                        started = True
+                        span.set(first_chunk_seconds=time.perf_counter() - span.started)
+                    yield content
+                return
+            except Exception as e:
+                # Falling back is only possible before anything reached the caller
+                if started or i == len(chain) - 1 or not is_retryable(e):
+                    raise
+                metrics.incr("llm.model_fallback", stage=stage, target=str(target))
+                logger.warning(
+                    f"[{stage}] {target} failed ({str(e)}), falling back to {chain[i + 1]}"
+                )
+
+
+async def astream_text(text: str) -> AsyncIterator[str]:
+    """Sends an already generated reply through the same path as astream()."""
+    yield text
+
+
+def stream(message):
+    for content in iter_sync(astream(message)):
+        print(content, end="", flush=True)
     print()
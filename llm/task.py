@@ -10,7 +10,12 @@ Key Components:
 
 Main Functions:
 - generate(): Creates a TaskList from user input, determining required steps and agents
-- route(): Executes tasks by dispatching them to appropriate agents
+- route(): Executes tasks by dispatching them to appropriate agents, running
+  independent async steps concurrently (see llm.scheduler)
+- plan(): Fused routing and task generation in a single model call (PIPELINE_MODE=fused)
+- agenerate(), aroute(), aplan(), agenerate_final_answer(): Async versions of the above
+- aroute_iter(), astream_final_answer(): Stream step results and the final answer as
+  they become available
 
 The module supports both single-step and multi-step task execution, with capabilities for:
 - Asynchronous task handling
@@ -24,12 +29,19 @@ Classes:
 """
 
 import json
-from typing import Dict, List
-from llm.agent import Agent, AgentTask
+import time
+from typing import AsyncIterable, AsyncIterator, Callable, Dict, List
+from llm.agent import Agent
 from pydantic import BaseModel
-from llm.invoke import model_invoke
+from llm import prompts
+from llm.invoke import amodel_invoke
+from llm.clients import run_sync
+from llm.scheduler import StepScheduler
+from llm.semantic_cache import semantic_cache
+from llm.stream import astream
+from utils import metrics, tracing
 from llm import get_arguments as get_arguments
-from utils.log import get_custom_logger
+from utils.log import get_custom_logger, lazy_json
 
 logger = get_custom_logger("TASK")
 
@@ -74,19 +86,41 @@ tasks_payload = {
 }
 
 
+plan_payload = {
+    "name": "plan_query",
+    "description": "Either reply to a conversational query directly, or route it to one or multiple agents.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "agent": {
+                "type": "string",
+                "enum": ["conversational", "tool"],
+                "description": "conversational if the query can be answered directly, tool if it requires an action",
+            },
+            "reply": {
+                "type": "string",
+                "description": "The reply to the user, only when agent is conversational",
+            },
+            "steps": tasks_payload["parameters"]["properties"]["steps"],
+        },
+        "required": ["agent"],
+    },
+}
+
+
 class Task(BaseModel):
     step_number: int
     task: str
     agent: str
-    expected_output: str
-    is_async: bool
+    expected_output: str = ""
+    is_async: bool = False
 
 
 class TaskList(BaseModel):
     steps: List[Task]
 
 
-def generate(user_message: str, agent_list: List[Agent]) -> TaskList:
+def _planner_prompt(agent_list: List[Agent]) -> str:
     agents_available = "\n".join(
         [
             f"- **Name**: `{agent.name}`\n  **Description**: {agent.description}"
@@ -137,72 +171,206 @@ def generate(user_message: str, agent_list: List[Agent]) -> TaskList:
                 Available agents:
                 {agents_available}
                 """
+    return system
 
-    logger.info(f"Sending task generation request with message: {user_message}")
 
-    response = model_invoke(system, user_message, tasks_payload)
-    logger.info(f"Generation response: {response}")
+def _fused_planner_prompt(agent_list: List[Agent]) -> str:
+    # The planner prompt comes first so both prompts share a cacheable prefix
+    return (
+        _planner_prompt(agent_list)
+        + """
+                If the user's query is conversational, set `agent` to `conversational` and answer it in `reply`.
+                If it requires an action, set `agent` to `tool` and plan the `steps` as described above.
+                """
+    )
+
 
-    tasks = json.loads(response["steps"])
+def _parse_steps(response: Dict) -> TaskList:
+    # Stringified steps are already decoded by the tool call repair in get_arguments
+    tasks = response["steps"]
 
     tasks_list = {"steps": tasks}
 
     tasks_list = TaskList.model_validate(tasks_list)
     logger.info(f"Successfully validated {len(tasks_list.steps)} tasks")
-    logger.info(f"Task list: {json.dumps(tasks_list.model_dump(), indent=2)}")
+    logger.debug("Task list: %s", lazy_json(tasks_list))
 
     return tasks_list
 
 
-def route(task_list: TaskList, agent_list: List[Agent]):
-    logger.info("Starting task routing process")
-    results = []
+@tracing.traced("generate", stage="planner")
+async def agenerate(user_message: str, agent_list: List[Agent]) -> TaskList:
+    system = prompts.compiled("planner", agent_list, _planner_prompt)
 
-    agents = {agent.name.lower(): agent for agent in agent_list}
+    if semantic_cache is not None:
+        cached = await semantic_cache.alookup("plan", user_message, system)
+        if cached is not None:
+            try:
+                tasks = _parse_steps(cached)
+                tracing.annotate(cache="semantic_hit")
+                return tasks
+            except Exception as e:
+                logger.warning(f"Cached plan is unusable: {str(e)}")
 
-    for task in task_list.steps:
-        agent_name = task.agent.lower()
+    logger.info(f"Sending task generation request with message: {user_message}")
 
-        logger.info(f"[Task #{task.step_number}] Routing to {agent_name}: {task.task}")
+    response = await amodel_invoke(
+        system, user_message, tasks_payload, stage="planner"
+    )
+    logger.debug("Generation response: %s", response)
 
-        if agent_name not in agents:
-            error_msg = f"Agent '{agent_name}' not found in agent list"
-            logger.error(error_msg)
+    tasks = _parse_steps(response)
+    if semantic_cache is not None:
+        await semantic_cache.astore("plan", user_message, system, response)
+    return tasks
 
-            results.append(
-                {
-                    "step": task.step_number,
-                    "status": "error",
-                    "result": "None",
-                    "message": error_msg,
-                }
-            )
-            continue
 
-        agent = agents[agent_name]
+def generate(user_message: str, agent_list: List[Agent]) -> TaskList:
+    return run_sync(agenerate(user_message, agent_list))
 
-        agent_task = AgentTask(task=task.task, expected_output=task.expected_output)
 
-        response = agent.execute(agent_task)
+async def aroute(task_list: TaskList, agent_list: List[Agent]):
+    logger.info("Starting task routing process")
 
-        results.append(
-            {
-                "step": task.step_number,
-                "status": "success",
-                "result": response,
-                "is_async": task.is_async,
-            }
-        )
-        logger.info(f"Task [#{task.step_number}] completed successfully")
+    scheduler = StepScheduler(agent_list)
+    results = await scheduler.run(task_list)
 
     logger.info("Task routing completed")
     return results
 
 
-def generate_final_answer(message: str, results: List[Dict]) -> str:
-    system = """
+@tracing.traced("plan", stage="planner")
+async def aplan(user_message: str, agent_list: List[Agent]) -> Dict:
+    """
+    Fused routing and task generation in a single model call.
+
+    Returns {"agent": "conversational", "reply": str} or {"agent": "tool", "tasks": TaskList}.
+    A tool decision without usable steps returns tasks=None so the caller can
+    fall back to generate().
+    """
+    system = prompts.compiled("fused_planner", agent_list, _fused_planner_prompt)
+
+    logger.info(f"Sending fused planning request with message: {user_message}")
+
+    response = await amodel_invoke(
+        system, user_message, plan_payload, stage="planner"
+    )
+    logger.debug("Plan response: %s", response)
+
+    if response.get("agent") == "conversational":
+        return {"agent": "conversational", "reply": response.get("reply") or None}
+
+    tasks = None
+    if response.get("steps"):
+        try:
+            tasks = _parse_steps(response)
+        except Exception as e:
+            logger.warning(f"Fused plan returned unusable steps: {str(e)}")
+    return {"agent": "tool", "tasks": tasks}
+
+
+def plan(user_message: str, agent_list: List[Agent]) -> Dict:
+    return run_sync(aplan(user_message, agent_list))
+
+
+async def aroute_iter(
+    task_list: TaskList, agent_list: List[Agent]
+) -> AsyncIterator[Dict]:
+    """Like aroute(), but yields each step result as soon as it completes."""
+    logger.info("Starting task routing process")
+
+    scheduler = StepScheduler(agent_list)
+    async for result in scheduler.run_iter(task_list):
+        yield result
+
+    logger.info("Task routing completed")
+
+
+def route(task_list: TaskList, agent_list: List[Agent]):
+    return run_sync(aroute(task_list, agent_list))
+
+
+FINAL_ANSWER_SYSTEM = prompts.static(
+    """
             You are an intelligent assistant responsible for generating a final answer based on the results of the tasks.
+            Answer the user's request using only what the step results say was actually done.
             """
-    response = model_invoke(system, message, None)
-    print(f"Final answer: {response}")
+)
+
+
+def _final_answer_prompt(message: str, results: List[Dict]) -> str:
+    ordered = sorted(results, key=lambda result: result["step"])
+    return (
+        f"User request: {message}\n\n"
+        f"Step results:\n{json.dumps(ordered, default=str)}"
+    )
+
+
+def step_status(result: Dict) -> str:
+    """Progress line for a finished step."""
+    if result["status"] == "success":
+        return f"[Step {result['step']}] done"
+    return f"[Step {result['step']}] failed: {result.get('message', '')}"
+
+
+async def astream_final_answer(
+    message: str,
+    results: AsyncIterable[Dict],
+    on_step: Callable[[Dict], None] = None,
+) -> AsyncIterator[str]:
+    """
+    Streams the final answer while steps are still running.
+
+    Each step result is passed to `on_step` as soon as it arrives, so callers can
+    show progress; once every step has finished, the model's answer, grounded on
+    the step results, is streamed through llm.stream.astream(). Only the answer is
+    yielded.
+
+    Metrics: final_answer.steps_seconds (waiting for the steps) and
+    final_answer.time_to_first_token_seconds (from the model call to its first chunk).
+    """
+    start = time.perf_counter()
+    collected = []
+    async for result in results:
+        collected.append(result)
+        if on_step is not None:
+            on_step(result)
+    steps_seconds = time.perf_counter() - start
+    metrics.incr("final_answer.steps_seconds", steps_seconds)
+
+    first_token = None
+    # Steps have their own spans; this one covers the answer alone
+    with tracing.span("final_answer", stage="final_answer", steps=len(collected)):
+        answer_start = time.perf_counter()
+        async for content in astream(
+            _final_answer_prompt(message, collected),
+            FINAL_ANSWER_SYSTEM,
+            stage="final_answer",
+        ):
+            if first_token is None and content:
+                first_token = time.perf_counter() - answer_start
+                metrics.incr("final_answer.time_to_first_token_seconds", first_token)
+            yield content
+
+    total = time.perf_counter() - start
+    metrics.incr("final_answer.total_seconds", total)
+    metrics.incr("final_answer.count")
+    logger.info(
+        f"Final answer streamed (steps {steps_seconds:.2f}s, "
+        f"first token {first_token or 0:.2f}s, total {total:.2f}s)"
+    )
+
+
+async def agenerate_final_answer(message: str, results: List[Dict]) -> str:
+    response = await amodel_invoke(
+        FINAL_ANSWER_SYSTEM,
+        _final_answer_prompt(message, results),
+        None,
+        stage="final_answer",
+    )
+    logger.debug("Final answer: %s", response)
     return response
+
+
+def generate_final_answer(message: str, results: List[Dict]) -> str:
+    return run_sync(agenerate_final_answer(message, results))
@@ -0,0 +1,51 @@
+"""
+Token usage accounting for model calls.
+
+Backends report their token counts through record(). Callers that want to know what
+a block of work cost wrap it in track(), which collects usage from every model call
+made in the current context (including nested asyncio tasks created inside it).
+Meters nest: usage recorded under an inner meter also counts towards the outer ones.
+Usage is also added to the current tracing span.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Iterator, Optional
+from utils import tracing
+
+
+@dataclass
+class Usage:
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    calls: int = 0
+    parent: Optional["Usage"] = None
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+_current: ContextVar[Optional[Usage]] = ContextVar("llm_usage", default=None)
+
+
+def record(prompt_tokens: int, completion_tokens: int) -> None:
+    tracing.add(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    meter = _current.get()
+    while meter is not None:
+        meter.prompt_tokens += prompt_tokens or 0
+        meter.completion_tokens += completion_tokens or 0
+        meter.calls += 1
+        meter = meter.parent
+
+
+@contextmanager
+def track(usage: Usage = None) -> Iterator[Usage]:
+    usage = usage or Usage()
+    usage.parent = _current.get()
+    token = _current.set(usage)
+    try:
+        yield usage
+    finally:
+        _current.reset(token)
@@ -0,0 +1,227 @@
+"""
+Model Warm-up Module
+
+Removes cold loads from the request path:
+
+- warm_up(): loads every Ollama model in the stage routing table (plus the embedding
+  model when the semantic cache is on) on every host that may serve it, timing the
+  same one-token request cold and then warm, and logs a cold vs warm report
+- OLLAMA_KEEP_ALIVE: sent with the warm-up and with every Ollama request, so models
+  stay resident between requests
+- ModelKeeper: background task that re-warms each model before its keep_alive runs
+  out, reloading (and logging) models the server evicted anyway
+
+Hosted OpenAI models have no cold start and are skipped.
+
+Counters: warmup.cold_seconds{model,host}, warmup.warm_seconds{model,host} and
+warmup.reloads{model,host}.
+"""
+
+import asyncio
+import re
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from llm.clients import get_ollama_client, run_sync
+from llm.models import model_routes
+from llm.pool import ollama_pool
+from utils import metrics
+from utils.log import get_custom_logger
+from config import (
+    EMBEDDING_BACKEND,
+    EMBEDDING_MODEL,
+    KEEPER_INTERVAL,
+    OLLAMA_KEEP_ALIVE,
+    SEMANTIC_CACHE_ENABLED,
+)
+
+logger = get_custom_logger("WARMUP")
+
+OLLAMA_BACKENDS = ("ollama", "deepseek")
+# Go durations as Ollama accepts them ("1h30m", "-1m", "2.5s"), or plain seconds
+DURATION = re.compile(r"^([-+]?)((?:\d+(?:\.\d+)?(?:ns|us|µs|ms|s|m|h))+|\d+(?:\.\d+)?)$")
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ns|us|µs|ms|s|m|h)?")
+UNITS = {"ns": 1e-9, "us": 1e-6, "µs": 1e-6, "ms": 0.001, "s": 1, "m": 60, "h": 3600, None: 1}
+# Keeper interval when OLLAMA_KEEP_ALIVE is forever or cannot be parsed
+DEFAULT_KEEPER_INTERVAL = 300.0
+WARM_PROMPT = "hi"
+
+
+def keep_alive_seconds(keep_alive: str = OLLAMA_KEEP_ALIVE) -> Optional[float]:
+    """Returns keep_alive in seconds, or None for "keep loaded forever" (negative)."""
+    match = DURATION.match(str(keep_alive).strip())
+    if not match:
+        raise ValueError(f"Invalid keep_alive duration: {keep_alive!r}")
+    parts = DURATION_PART.findall(match.group(2))
+    seconds = sum(float(value) * UNITS[unit or None] for value, unit in parts)
+    if match.group(1) == "-":
+        seconds = -seconds
+    return None if seconds < 0 else seconds
+
+
+@dataclass
+class WarmupResult:
+    model: str
+    host: str
+    cold_seconds: Optional[float] = None
+    warm_seconds: Optional[float] = None
+    error: Optional[str] = None
+
+
+def _warm_targets() -> List[tuple]:
+    """(model, kind) pairs to keep loaded; kind is "generate" or "embed"."""
+    targets = [
+        (target.model, "generate")
+        for target in model_routes.targets()
+        if target.backend in OLLAMA_BACKENDS and target.model
+    ]
+    if SEMANTIC_CACHE_ENABLED and EMBEDDING_BACKEND == "ollama":
+        targets.append((EMBEDDING_MODEL, "embed"))
+    return list(dict.fromkeys(targets))
+
+
+async def _load(host: Optional[str], model: str, kind: str, prompt: str = "") -> float:
+    client = get_ollama_client(host)
+    start = time.perf_counter()
+    if kind == "embed":
+        await client.embed(model=model, input=prompt or " ", keep_alive=OLLAMA_KEEP_ALIVE)
+    else:
+        # An empty prompt only loads the model; otherwise generate a single token
+        await client.generate(
+            model=model,
+            prompt=prompt,
+            options={"num_predict": 1},
+            keep_alive=OLLAMA_KEEP_ALIVE,
+        )
+    return time.perf_counter() - start
+
+
+async def _warm(host: Optional[str], model: str, kind: str) -> WarmupResult:
+    result = WarmupResult(model=model, host=host or "default")
+    try:
+        # The same request twice: the first pays for the load, the second does not
+        result.cold_seconds = await _load(host, model, kind, WARM_PROMPT)
+        result.warm_seconds = await _load(host, model, kind, WARM_PROMPT)
+    except Exception as e:
+        result.error = str(e)
+        logger.warning(f"Warm-up of {model} on {result.host} failed: {result.error}")
+        return result
+
+    metrics.incr("warmup.cold_seconds", result.cold_seconds, model=model, host=result.host)
+    metrics.incr("warmup.warm_seconds", result.warm_seconds, model=model, host=result.host)
+    return result
+
+
+def report(results: List[WarmupResult]) -> str:
+    lines = [f"{'model':<32} {'host':<28} {'cold':>8} {'warm':>8}"]
+    for r in results:
+        if r.error:
+            lines.append(f"{r.model:<32} {r.host:<28} failed: {r.error}")
+        else:
+            lines.append(
+                f"{r.model:<32} {r.host:<28} {r.cold_seconds:>7.2f}s {r.warm_seconds:>7.2f}s"
+            )
+    return "\n".join(lines)
+
+
+async def awarm_up() -> List[WarmupResult]:
+    """Loads every routed Ollama model on every host that may serve it."""
+    jobs = [
+        _warm(host, model, kind)
+        for model, kind in _warm_targets()
+        for host in ollama_pool.hosts_for(model)
+    ]
+    if not jobs:
+        return []
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*jobs)
+    logger.info(
+        f"Warm-up finished in {time.perf_counter() - start:.2f}s "
+        f"(keep_alive={OLLAMA_KEEP_ALIVE})\n{report(results)}"
+    )
+    return results
+
+
+def warm_up() -> List[WarmupResult]:
+    return run_sync(awarm_up())
+
+
+class ModelKeeper:
+    """Re-warms models periodically so keep_alive never runs out between requests."""
+
+    def __init__(self, interval: Optional[float] = None):
+        self._interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def interval(self) -> float:
+        """Explicit interval, KEEPER_INTERVAL, or half of OLLAMA_KEEP_ALIVE."""
+        if self._interval is None:
+            self._interval = KEEPER_INTERVAL or self._from_keep_alive()
+        return self._interval
+
+    @staticmethod
+    def _from_keep_alive() -> float:
+        try:
+            keep_alive = keep_alive_seconds()
+        except ValueError as e:
+            logger.warning(f"{str(e)}; re-warming every {DEFAULT_KEEPER_INTERVAL:.0f}s")
+            return DEFAULT_KEEPER_INTERVAL
+        # Refresh well before expiry; models pinned forever only need eviction checks
+        return keep_alive * 0.5 if keep_alive else DEFAULT_KEEPER_INTERVAL
+
+    async def _loaded(self, host: Optional[str]) -> Optional[set]:
+        try:
+            response = await get_ollama_client(host).ps()
+        except Exception as e:
+            logger.warning(f"Could not list loaded models on {host or 'default'}: {str(e)}")
+            return None
+        return {m.model for m in response.models} | {m.name for m in response.models}
+
+    @staticmethod
+    def _is_resident(model: str, resident: set) -> bool:
+        # Untagged names resolve to ":latest" on the server
+        return model in resident or (":" not in model and f"{model}:latest" in resident)
+
+    async def refresh(self) -> Dict[str, int]:
+        """Refreshes keep_alive of every model; returns counts of refreshed/reloaded."""
+        counts = {"refreshed": 0, "reloaded": 0}
+        hosts = {h for model, _ in _warm_targets() for h in ollama_pool.hosts_for(model)}
+        loaded = {host: await self._loaded(host) for host in hosts}
+
+        for model, kind in _warm_targets():
+            for host in ollama_pool.hosts_for(model):
+                resident = loaded.get(host)
+                if resident is not None and not self._is_resident(model, resident):
+                    counts["reloaded"] += 1
+                    metrics.incr("warmup.reloads", model=model, host=host or "default")
+                    logger.warning(f"{model} was unloaded from {host or 'default'}, reloading")
+                try:
+                    await _load(host, model, kind)
+                    counts["refreshed"] += 1
+                except Exception as e:
+                    logger.warning(f"Keep-alive of {model} on {host or 'default'} failed: {str(e)}")
+        return counts
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.refresh()
+
+    def start(self) -> None:
+        """Starts the keeper on the shared background loop."""
+        if self._task is None or self._task.done():
+            self._task = run_sync(self._start())
+            logger.info(f"Model keeper running every {self.interval:.0f}s")
+
+    async def _start(self) -> asyncio.Task:
+        return asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.get_loop().call_soon_threadsafe(self._task.cancel)
+            self._task = None
+
+
+model_keeper = ModelKeeper()
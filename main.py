@@ -8,7 +8,11 @@ from llm.agent import AgentHandler, run_agent
 from utils.log import get_custom_logger
 from colorama import init, Fore, Back, Style
 from llm.initialize_agents import initialize_agents
+from llm.warmup import warm_up, model_keeper
+from config import LLM_TRACE_MODE, WARMUP_ENABLED
 from utils.printing import print_run_header, print_separator
+from utils.exporters import setup_exporters
+from llm.recording import setup_recording
 
 # Initialize colorama
 init()
@@ -23,6 +27,18 @@ MODEL = os.getenv("MODEL")
 # Initialize agents
 agent_manager, agent_list = initialize_agents()
 
+# Export spans and metrics (TRACING_EXPORTERS)
+setup_exporters()
+
+# Record or replay backend calls (LLM_TRACE_MODE)
+setup_recording()
+
+# Load the routed models before the first request and keep them resident; a replay
+# answers from the trace, and warm-up would talk to the real servers
+if WARMUP_ENABLED and LLM_TRACE_MODE != "replay":
+    warm_up()
+    model_keeper.start()
+
 
 # def print_separator():
 #     print(Fore.YELLOW + "=" * 80 + Style.RESET_ALL)
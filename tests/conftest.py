@@ -0,0 +1,4 @@
+import os
+
+# Runtime output stays out of the working tree; set before config is imported
+os.environ.setdefault("LOG_FILE", "")
@@ -0,0 +1,65 @@
+"""
+The shared logging pipeline renders and formats records on its listener thread.
+"""
+
+import json
+import logging
+import sys
+import threading
+
+from utils import log
+
+
+def shared_logger():
+    logger = log.get_custom_logger("TEST LOG")
+    # Only the shared handler; pytest's capture handler on the root formats in place
+    logger.propagate = False
+    return logger
+
+
+class Probe:
+    """Log argument noting the thread it is rendered on."""
+
+    def __init__(self):
+        self.threads = []
+        self.rendered = threading.Event()
+
+    def __str__(self):
+        self.threads.append(threading.current_thread().name)
+        self.rendered.set()
+        return "probe"
+
+
+def test_lazy_payload_is_rendered_once_off_the_logging_thread():
+    logger = shared_logger()
+    probe = Probe()
+
+    logger.warning("payload: %s", log.Lazy(str, probe))
+
+    assert probe.rendered.wait(5)
+    assert len(probe.threads) == 1
+    assert probe.threads[0] != threading.current_thread().name
+
+
+def test_disabled_level_skips_rendering():
+    logger = shared_logger()
+    probe = Probe()
+
+    logger.log(logging.DEBUG - 1, "payload: %s", log.Lazy(str, probe))
+
+    assert not probe.rendered.wait(0.2)
+
+
+def test_json_formatter_keeps_the_exception():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = logging.getLogger("TEST LOG").makeRecord(
+            "TEST LOG", logging.ERROR, __file__, 1, "failed: %s", ("x",), sys.exc_info()
+        )
+
+    entry = json.loads(log.JsonFormatter().format(record))
+
+    assert entry["message"] == "failed: x"
+    assert "ValueError: boom" in entry["exception"]
+    assert entry["location"].endswith(":1")
@@ -0,0 +1,146 @@
+"""
+HostPool against local stand-in Ollama servers (utils.standin_server).
+"""
+
+import asyncio
+import socket
+import time
+
+import ollama
+import pytest
+from llm.pool import HostPool
+from utils.standin_server import Responder, StandinServer
+
+MODEL = "standin-model"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def start(port: int = 0, **options) -> StandinServer:
+    server = StandinServer(**options)
+    await server.start(port=port)
+    return server
+
+
+def url(server_or_port) -> str:
+    port = getattr(server_or_port, "port", server_or_port)
+    return f"http://127.0.0.1:{port}"
+
+
+async def chat(pool: HostPool, affinity: str = None) -> None:
+    async with pool.lease(MODEL, affinity) as client:
+        await client.chat(model=MODEL, messages=[{"role": "user", "content": "hi"}])
+
+
+def test_failing_host_is_ejected_with_doubling_backoff():
+    async def scenario():
+        failing = await start(responder=Responder([{"error": 500}]))
+        pool = HostPool([url(failing)], failure_threshold=2, eject_seconds=10, health_interval=0)
+        state = pool.hosts[url(failing)]
+
+        for _ in range(2):
+            with pytest.raises(ollama.ResponseError):
+                await chat(pool)
+        assert not state.healthy
+        first = state.ejected_until - time.monotonic()
+
+        # Failing again once the ejection is over doubles it
+        state.ejected_until = 0.0
+        for _ in range(2):
+            with pytest.raises(ollama.ResponseError):
+                await chat(pool)
+        second = state.ejected_until - time.monotonic()
+        await failing.close()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert 9 < first <= 10
+    assert 19 < second <= 20
+
+
+def test_requests_avoid_ejected_hosts():
+    async def scenario():
+        good, bad = await start(), await start(responder=Responder([{"error": 500}]))
+        pool = HostPool([url(good), url(bad)], failure_threshold=1, health_interval=0)
+        pool.hosts[url(good)].outstanding = 1  # makes the bad host the least loaded
+        with pytest.raises(ollama.ResponseError):
+            await chat(pool)
+        pool.hosts[url(good)].outstanding = 0
+
+        for _ in range(5):
+            await chat(pool)
+        await good.close()
+        await bad.close()
+        return pool, good, bad
+
+    pool, good, bad = asyncio.run(scenario())
+    assert pool.hosts[url(bad)].ejections == 1
+    assert good.stats["requests"] == 5
+    assert bad.stats["requests"] == 1
+
+
+def test_health_check_ejects_unreachable_host_and_restores_it():
+    async def scenario():
+        port = free_port()
+        pool = HostPool([url(port)], health_interval=0)
+        state = pool.hosts[url(port)]
+
+        assert not await pool.check(state)
+        assert not state.healthy
+        assert state.ejections == 1
+
+        server = await start(port)
+        assert await pool.check(state)
+        await server.close()
+        return state
+
+    state = asyncio.run(scenario())
+    assert state.healthy
+    assert state.ejections == 0
+
+
+def test_least_outstanding_host_is_chosen():
+    pool = HostPool(["a", "b", "c"], health_interval=0)
+    pool.hosts["a"].outstanding = 3
+    pool.hosts["b"].outstanding = 1
+    pool.hosts["c"].outstanding = 2
+    assert pool.select().host == "b"
+
+
+def test_affinity_sticks_within_slack_and_spills_over_beyond_it():
+    pool = HostPool(["a", "b", "c"], health_interval=0, affinity_slack=2)
+    preferred = pool.select(affinity="prefix").host
+    assert all(pool.select(affinity="prefix").host == preferred for _ in range(10))
+
+    pool.hosts[preferred].outstanding = 2
+    assert pool.select(affinity="prefix").host == preferred
+    pool.hosts[preferred].outstanding = 3
+    assert pool.select(affinity="prefix").host != preferred
+
+
+def test_pinned_model_stays_on_its_hosts_while_they_are_healthy():
+    pool = HostPool(["a", "b", "c"], pins={MODEL: ["c"]}, health_interval=0)
+    pool.hosts["c"].outstanding = 5
+    assert pool.select(MODEL).host == "c"
+    assert pool.select("other").host in ("a", "b")
+
+    pool.hosts["c"].ejected_until = time.monotonic() + 60
+    assert pool.select(MODEL).host in ("a", "b")
+
+
+def test_spread_sends_the_second_lease_to_another_host():
+    async def scenario():
+        servers = [await start() for _ in range(2)]
+        pool = HostPool([url(s) for s in servers], health_interval=0)
+        with pool.spread():
+            await asyncio.gather(chat(pool, "prefix"), chat(pool, "prefix"))
+        for server in servers:
+            await server.close()
+        return servers
+
+    servers = asyncio.run(scenario())
+    assert [server.stats["requests"] for server in servers] == [1, 1]
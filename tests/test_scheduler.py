@@ -0,0 +1,91 @@
+"""
+StepScheduler ordering and dependency rules, on agents that record their calls.
+"""
+
+import asyncio
+from typing import ClassVar, Dict, List
+
+from llm.agent import Agent, AgentTask
+from llm.scheduler import StepScheduler, build_dag
+from llm.task import TaskList
+
+
+class RecordingAgent(Agent):
+    calls: List[str] = []
+    delay: float = 0.0
+    # Calls of every agent, in order
+    timeline: ClassVar[List[str]] = []
+
+    def execute(self, agent_task: AgentTask) -> Dict:
+        raise NotImplementedError
+
+    async def aexecute(self, agent_task: AgentTask) -> Dict:
+        for event in (f"start {agent_task.task}", None, f"end {agent_task.task}"):
+            if event is None:
+                await asyncio.sleep(self.delay)
+                continue
+            self.calls.append(event)
+            self.timeline.append(event)
+        return {"task": agent_task.task}
+
+
+def agent(name: str = "recorder", **fields) -> RecordingAgent:
+    return RecordingAgent(
+        name=name, description="", system_prompt="", input_payload={}, output_payload={},
+        calls=[], **fields,
+    )
+
+
+def plan(*steps) -> TaskList:
+    return TaskList.model_validate({
+        "steps": [
+            {"step_number": number, "task": task, "agent": name, "is_async": is_async}
+            for number, task, name, is_async in steps
+        ]
+    })
+
+
+def test_build_dag_uses_positions_for_duplicate_step_numbers():
+    steps = plan((1, "a", "x", False), (1, "b", "x", False), (2, "c", "x", True)).steps
+    assert build_dag(steps) == {0: set(), 1: {0}, 2: {1}}
+
+
+def test_duplicate_sync_step_numbers_run_one_after_another():
+    recorder = agent(delay=0.01)
+    task_list = plan(
+        (1, "a", "recorder", False), (1, "b", "recorder", False), (1, "c", "recorder", False)
+    )
+
+    results = asyncio.run(asyncio.wait_for(StepScheduler([recorder]).run(task_list), 5))
+
+    assert [r["result"]["task"] for r in results] == ["a", "b", "c"]
+    assert recorder.calls == ["start a", "end a", "start b", "end b", "start c", "end c"]
+
+
+def test_non_contiguous_step_numbers_keep_plan_order():
+    recorder = agent()
+    task_list = plan((30, "c", "recorder", False), (5, "a", "recorder", False), (12, "b", "recorder", True))
+
+    results = asyncio.run(asyncio.wait_for(StepScheduler([recorder]).run(task_list), 5))
+
+    assert [r["step"] for r in results] == [5, 12, 30]
+    assert recorder.calls == ["start a", "end a", "start b", "end b", "start c", "end c"]
+
+
+def test_saturated_agent_does_not_hold_global_slots():
+    slow = agent("slow", delay=0.2, max_concurrency=1)
+    fast = agent("fast")
+    task_list = plan(
+        (1, "s1", "slow", True), (2, "s2", "slow", True), (3, "s3", "slow", True),
+        (4, "f1", "fast", True),
+    )
+
+    RecordingAgent.timeline.clear()
+
+    results = asyncio.run(StepScheduler([slow, fast], max_workers=2).run(task_list))
+
+    assert all(r["status"] == "success" for r in results)
+    # Slow steps queued on their agent's limit leave the second global slot free
+    timeline = RecordingAgent.timeline
+    assert timeline.index("end f1") < timeline.index("end s1")
+    assert slow.calls == ["start s1", "end s1", "start s2", "end s2", "start s3", "end s3"]
@@ -0,0 +1,154 @@
+"""
+Exporters for tracing spans and counters.
+
+- JsonlExporter: appends every finished span as one JSON line to a file
+- PrometheusExporter: serves the span histograms (as summaries with p50/p90/p99) and
+  the utils.metrics counters in the Prometheus text format on /metrics
+
+Exporters are plugged into utils.tracing with register_exporter(); any object with
+export(span) and close() works. setup_exporters() registers the ones listed in
+TRACING_EXPORTERS (e.g. "jsonl,prometheus").
+"""
+
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+from utils import metrics, tracing
+from utils.log import get_custom_logger
+from config import PROMETHEUS_HOST, PROMETHEUS_PORT, TRACING_EXPORTERS, TRACING_JSONL_PATH
+
+logger = get_custom_logger("EXPORTERS")
+
+NAMESPACE = "doba"
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class Exporter:
+    def export(self, span: tracing.Span) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class JsonlExporter(Exporter):
+    def __init__(self, path: str = TRACING_JSONL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def export(self, span: tracing.Span) -> None:
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def _metric_name(name: str) -> str:
+    return f"{NAMESPACE}_" + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def _labels(labels: Tuple, **extra) -> str:
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ""
+    escaped = (
+        f'{re.sub(r"[^a-zA-Z0-9_]", "_", str(k))}="'
+        + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        + '"'
+        for k, v in items
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def render_prometheus() -> str:
+    """Renders histograms and counters in the Prometheus text exposition format."""
+    lines: List[str] = []
+
+    summaries: Dict[str, List] = {}
+    for (name, labels), histogram in sorted(tracing.histograms().items()):
+        summaries.setdefault(name, []).append((labels, histogram))
+    for name, series in summaries.items():
+        metric = _metric_name(name)
+        lines.append(f"# TYPE {metric} summary")
+        for labels, histogram in series:
+            for q in QUANTILES:
+                lines.append(f"{metric}{_labels(labels, quantile=q)} {histogram.quantile(q)}")
+            lines.append(f"{metric}_sum{_labels(labels)} {histogram.sum}")
+            lines.append(f"{metric}_count{_labels(labels)} {histogram.count}")
+
+    counters: Dict[str, List] = {}
+    for (name, labels), value in sorted(metrics.items()):
+        counters.setdefault(name, []).append((labels, value))
+    for name, series in counters.items():
+        metric = _metric_name(name) + "_total"
+        lines.append(f"# TYPE {metric} counter")
+        for labels, value in series:
+            lines.append(f"{metric}{_labels(labels)} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are not worth a log line each
+        pass
+
+
+class PrometheusExporter(Exporter):
+    """Serves /metrics from a background thread; spans are read from the histograms."""
+
+    def __init__(self, host: str = PROMETHEUS_HOST, port: int = PROMETHEUS_PORT):
+        self.server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self._thread = threading.Thread(
+            target=self.server.serve_forever, name="prometheus-exporter", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Serving Prometheus metrics on http://{host}:{self.port}/metrics")
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+EXPORTERS = {
+    "jsonl": JsonlExporter,
+    "prometheus": PrometheusExporter,
+}
+
+
+def setup_exporters(names: List[str] = TRACING_EXPORTERS) -> List[Exporter]:
+    """Creates and registers the named exporters, skipping those that fail to start."""
+    created = []
+    for name in names:
+        if name not in EXPORTERS:
+            raise ValueError(
+                f"Invalid exporter: {name}. Exporters available: {', '.join(EXPORTERS)}"
+            )
+        try:
+            exporter = EXPORTERS[name]()
+        except OSError as e:
+            logger.warning(f"Could not start the {name} exporter: {str(e)}")
+            continue
+        tracing.register_exporter(exporter)
+        created.append(exporter)
+    return created
@@ -0,0 +1,235 @@
+"""
+Scripted stand-in for the model backends, for benchmarks and offline runs.
+
+ScriptedBackend answers each request from the tool (or schema) it was asked for, the
+way a well-behaved model would: route_query and plan_query pick the tool agent for
+todo-like messages, route_agent returns one step per clause, todo_batch/todo_action
+return an add action, and plain prompts get a short text reply (streamed word by word).
+
+Latency, transient failures and malformed output are drawn from a seeded random
+generator, so a run is reproducible:
+
+    backend = ScriptedBackend(latency=LatencyModel.parse("lognormal:0.05,0.5"),
+                              failure_rate=0.02, malformed_rate=0.02, seed=0)
+    install(backend)   # registers it as the "bench" backend and routes every stage to it
+
+Every call's busy interval is recorded in the list set by track_calls(), which lets
+callers tell model time from the time spent in the pipeline around it.
+"""
+
+import asyncio
+import json
+import random
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+TODO_WORDS = re.compile(r"\b(todo|to-do|task|tasks|list|add|mark|delete|remove|remind)\b", re.I)
+CLAUSE_SPLIT = re.compile(r"\s+(?:and|then)\s+|;\s*", re.I)
+
+_calls: ContextVar[Optional[List[Tuple[float, float]]]] = ContextVar(
+    "fake_backend_calls", default=None
+)
+
+
+@dataclass(frozen=True)
+class LatencyModel:
+    """Model call latency: "none", "fixed:S", "uniform:A,B" or "lognormal:MEDIAN,SIGMA"."""
+
+    kind: str = "none"
+    a: float = 0.0
+    b: float = 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyModel":
+        kind, _, args = spec.partition(":")
+        values = [float(v) for v in args.split(",") if v]
+        expected = {"none": 0, "fixed": 1, "uniform": 2, "lognormal": 2}
+        if kind not in expected or len(values) != expected[kind]:
+            raise ValueError(
+                f"Invalid latency spec: {spec!r}. "
+                "Use none, fixed:S, uniform:A,B or lognormal:MEDIAN,SIGMA"
+            )
+        return cls(kind, *values)
+
+    def sample(self, rng: random.Random) -> float:
+        match self.kind:
+            case "fixed":
+                return self.a
+            case "uniform":
+                return rng.uniform(self.a, self.b)
+            case "lognormal":
+                return self.a * rng.lognormvariate(0, self.b)
+        return 0.0
+
+
+@contextmanager
+def track_calls() -> Iterator[List[Tuple[float, float]]]:
+    """Collects the (start, end) perf_counter interval of every call made in this context."""
+    calls: List[Tuple[float, float]] = []
+    token = _calls.set(calls)
+    try:
+        yield calls
+    finally:
+        _calls.reset(token)
+
+
+def busy_seconds(calls: List[Tuple[float, float]], start: float, end: float) -> float:
+    """Time within [start, end] during which at least one call was in flight."""
+    total = 0.0
+    current_start = current_end = None
+    for call_start, call_end in sorted(calls):
+        call_start, call_end = max(call_start, start), min(call_end, end)
+        if call_end <= call_start:
+            continue
+        if current_end is None or call_start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = call_start, call_end
+        else:
+            current_end = max(current_end, call_end)
+    if current_end is not None:
+        total += current_end - current_start
+    return total
+
+
+def _user_message(messages: list) -> str:
+    return next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+
+
+def _is_todo(message: str) -> bool:
+    return bool(TODO_WORDS.search(message))
+
+
+def _add_action(text: str) -> Dict:
+    return {"type": "add", "title": text[:60], "due_date": "none", "priority": "medium"}
+
+
+def scripted_content(message: str) -> str:
+    """Plain text reply to a prompt without a tool."""
+    return f"Done: {message[:80]}"
+
+
+def scripted_arguments(name: str, message: str) -> Dict:
+    """Arguments a cooperative model would return for the tool `name`."""
+    match name:
+        case "route_query":
+            return {"agent": "tool" if _is_todo(message) else "conversational"}
+        case "route_agent":
+            clauses = [c for c in CLAUSE_SPLIT.split(message) if c.strip()] or [message]
+            return {
+                "steps": [
+                    {
+                        "step_number": i,
+                        "task": clause.strip(),
+                        "agent": "todoagent",
+                        "expected_output": "The updated todo list",
+                        "is_async": True,
+                    }
+                    for i, clause in enumerate(clauses, 1)
+                ]
+            }
+        case "plan_query":
+            if not _is_todo(message):
+                return {"agent": "conversational", "reply": "Happy to chat!"}
+            return {"agent": "tool", **scripted_arguments("route_agent", message)}
+        case "todo_batch":
+            return {"actions": [_add_action(message)]}
+        case "todo_action":
+            return {"action": _add_action(message)}
+    return {}
+
+
+class ScriptedBackend:
+    def __init__(
+        self,
+        latency: LatencyModel = LatencyModel(),
+        failure_rate: float = 0.0,
+        malformed_rate: float = 0.0,
+        chunk_delay: float = 0.0,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.malformed_rate = malformed_rate
+        self.chunk_delay = chunk_delay
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.failures = 0
+        self.malformed = 0
+
+    async def _wait(self) -> None:
+        self.calls += 1
+        delay = self.latency.sample(self.rng)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.rng.random() < self.failure_rate:
+            self.failures += 1
+            raise ConnectionError("Scripted backend failure")
+
+    def _malformed(self) -> bool:
+        if self.rng.random() < self.malformed_rate:
+            self.malformed += 1
+            return True
+        return False
+
+    async def chat(
+        self, model_name: str, messages: list, tools: list = None, schema: dict = None
+    ) -> dict:
+        """Backend with the llm.invoke.BACKENDS signature."""
+        start = time.perf_counter()
+        try:
+            await self._wait()
+            message = _user_message(messages)
+            payload = tools[0]["function"] if tools else schema
+            if not payload:
+                return {"message": {"role": "assistant", "content": scripted_content(message)}}
+
+            arguments = json.dumps(scripted_arguments(payload["name"], message))
+            if self._malformed():
+                # Nothing local repair can recover, so the call is retried
+                arguments = "Sorry, I am not sure how to answer that."
+            if schema:
+                return {"message": {"role": "assistant", "content": arguments}}
+            return {
+                "message": {
+                    "role": "assistant",
+                    "content": "",
+                    "tool_calls": [
+                        {"function": {"name": payload["name"], "arguments": arguments}}
+                    ],
+                }
+            }
+        finally:
+            self._track(start)
+
+    async def stream(self, target, messages: list) -> AsyncIterator[str]:
+        """Backend with the llm.stream.STREAM_BACKENDS signature."""
+        start = time.perf_counter()
+        try:
+            await self._wait()
+            for word in scripted_content(_user_message(messages)).split(" "):
+                if self.chunk_delay:
+                    await asyncio.sleep(self.chunk_delay)
+                yield word + " "
+        finally:
+            self._track(start)
+
+    def _track(self, start: float) -> None:
+        calls = _calls.get()
+        if calls is not None:
+            calls.append((start, time.perf_counter()))
+
+
+def install(backend: ScriptedBackend, name: str = "bench") -> None:
+    """Registers the backend under `name` and routes every stage to it."""
+    from llm import invoke, stream
+    from llm.models import ModelRoutes, model_routes
+
+    invoke.BACKENDS[name] = backend.chat
+    stream.STREAM_BACKENDS[name] = backend.stream
+    # Mutated in place: the modules using the table hold a reference to it
+    model_routes.routes = ModelRoutes({"default": [f"{name}:scripted"]}).routes
@@ -1,10 +1,50 @@
+"""
+Logging for the whole app.
+
+Every named logger hands its records to one shared QueueHandler, which enqueues
+them as they are; a single QueueListener thread renders the messages, formats them
+and does the console and file I/O, so a log call on the request path costs a queue
+put. Settings (see config.py):
+
+- LOG_LEVEL: level of the named loggers; DEBUG payloads are skipped below it
+- LOG_FILE: log file ("" for console only), rotated at LOG_MAX_BYTES (0 = never)
+  keeping LOG_BACKUP_COUNT old files
+- LOG_FORMAT: "text" or "json" (one JSON object per line) for the file
+
+Large payloads should be logged lazily, so they are only rendered when the record
+is emitted, on the listener thread:
+
+    logger.debug("Task list: %s", lazy_json(tasks_list))
+
+Arguments are rendered after the call returns, so they must not be mutated
+afterwards; log a copy of anything that is.
+"""
+
+import atexit
+import json
 import logging
-import inspect
+import logging.handlers
+import queue
+from functools import lru_cache
 from colorama import init, Fore, Style
 from pathlib import Path
+from config import LOG_BACKUP_COUNT, LOG_FILE, LOG_FORMAT, LOG_LEVEL, LOG_MAX_BYTES
 
 init(autoreset=True)
 
+_CWD = Path.cwd()
+
+
+@lru_cache(maxsize=None)
+def _location(pathname: str) -> str:
+    """Source file of a record, relative to the project when it is in it."""
+    file_path = Path(pathname)
+    try:
+        return str(file_path.relative_to(_CWD))
+    except ValueError:
+        # For system files, just use filename
+        return file_path.name
+
 
 class CustomFormatter(logging.Formatter):
     LOG_COLORS = {
@@ -20,46 +60,116 @@ class CustomFormatter(logging.Formatter):
         formatted_msg = super().format(record)
 
         try:
-            # Get the file path from record
-            file_path = Path(record.pathname)
-
-            # Try to make it relative if it's in our project
-            try:
-                relative_path = file_path.relative_to(Path.cwd())
-                location = f"{relative_path}:{record.lineno}"
-            except ValueError:
-                # For system files, just use filename
-                location = f"{file_path.name}:{record.lineno}"
-
             # Return formatted message with location
-            return f"{location} - {formatted_msg}"
+            return f"{_location(record.pathname)}:{record.lineno} - {formatted_msg}"
 
         except Exception:
             # Fallback to just the message if anything goes wrong
             return formatted_msg
 
 
-def get_custom_logger(name):
-    logger = logging.getLogger(name)
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "logger": record.name,
+            "level": record.levelname,
+            "location": f"{_location(record.pathname)}:{record.lineno}",
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class Lazy:
+    """Log argument rendered by `render(*args)` only if the record is emitted."""
+
+    __slots__ = ("render", "args")
+
+    def __init__(self, render, *args):
+        self.render = render
+        self.args = args
+
+    def __str__(self):
+        return str(self.render(*self.args))
+
+
+def _json(value) -> str:
+    if hasattr(value, "model_dump"):
+        value = value.model_dump()
+    return json.dumps(value, indent=2, default=str)
 
-    if not logger.handlers:
-        logger.setLevel(logging.DEBUG)
+
+def lazy_json(value) -> Lazy:
+    """Indented JSON of a dict or pydantic model, rendered only if emitted."""
+    return Lazy(_json, value)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # The stock prepare() formats the record on the logging thread; the listener
+        # does it instead
+        return record
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def prepare(self, record):
+        # Renders the message (and Lazy arguments) once for all handlers
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+_queue_handler = None
+_listener = None
+
+
+def _file_handler() -> logging.Handler:
+    if LOG_MAX_BYTES > 0:
+        handler = logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+        )
+    else:
+        handler = logging.FileHandler(LOG_FILE, encoding="utf-8")
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(
+            logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+        )
+    return handler
+
+
+def _shared_handler() -> logging.Handler:
+    """The QueueHandler of all loggers; starts the listener on first use."""
+    global _queue_handler, _listener
+    if _queue_handler is None:
+        if LOG_FORMAT not in ("text", "json"):
+            raise ValueError(f"Invalid log format: {LOG_FORMAT}. Formats available: text, json")
 
         # Console Handler
         console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging.DEBUG)
-        console_formatter = CustomFormatter()
-        console_handler.setFormatter(console_formatter)
-        logger.addHandler(console_handler)
-
-        # Optional: File Handler for persistent logging
-        file_handler = logging.FileHandler("app.log")
-        file_handler.setLevel(logging.DEBUG)
-        file_formatter = logging.Formatter(
-            "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-        )
-        file_handler.setFormatter(file_formatter)
-        logger.addHandler(file_handler)
+        console_handler.setFormatter(CustomFormatter())
+        handlers = [console_handler]
+        if LOG_FILE:
+            handlers.append(_file_handler())
+
+        records = queue.SimpleQueue()
+        _listener = _QueueListener(records, *handlers)
+        _listener.start()
+        # Flushes the queue on exit
+        atexit.register(_listener.stop)
+        _queue_handler = _QueueHandler(records)
+    return _queue_handler
+
+
+def get_custom_logger(name):
+    logger = logging.getLogger(name)
+
+    if not logger.handlers:
+        logger.setLevel(LOG_LEVEL)
+        logger.addHandler(_shared_handler())
 
     return logger
 
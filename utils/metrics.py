@@ -0,0 +1,59 @@
+"""
+In-process counters shared across the pipeline.
+
+Counters are identified by a name plus optional labels, e.g.
+`incr("fast_router.decisions", outcome="hit")`.
+"""
+
+import threading
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, Tuple], float] = defaultdict(float)
+
+
+def _key(name: str, labels: Dict) -> Tuple[str, Tuple]:
+    return name, tuple(sorted(labels.items()))
+
+
+def incr(name: str, value: float = 1, **labels) -> None:
+    with _lock:
+        _counters[_key(name, labels)] += value
+
+
+def get(name: str, **labels) -> float:
+    with _lock:
+        return _counters.get(_key(name, labels), 0)
+
+
+def series(name: str) -> Dict[Tuple, float]:
+    """Returns every labelled value of one counter, keyed by its sorted label items."""
+    with _lock:
+        return {labels: value for (n, labels), value in _counters.items() if n == name}
+
+
+def items() -> List[Tuple[Tuple[str, Tuple], float]]:
+    """Returns every counter as ((name, sorted label items), value)."""
+    with _lock:
+        return list(_counters.items())
+
+
+def snapshot(prefix: str = "") -> Dict[str, float]:
+    """Returns all counters whose name starts with prefix, keyed as name{k=v,...}."""
+    with _lock:
+        items = list(_counters.items())
+
+    result = {}
+    for (name, labels), value in items:
+        if not name.startswith(prefix):
+            continue
+        if labels:
+            name = name + "{" + ",".join(f"{k}={v}" for k, v in labels) + "}"
+        result[name] = value
+    return result
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
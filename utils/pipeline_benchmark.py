@@ -0,0 +1,284 @@
+"""
+CPU-only benchmark of the orchestration around the model calls.
+
+Every stage is routed to the scripted fake backend (utils.fake_backend), whose
+latency distribution and failure/malformed-output rates are configurable, so the
+numbers measure the pipeline itself: routing, planning, step scheduling, the todo
+agent, retries and streaming. No GPU or model server is needed.
+
+Scenarios:
+- run_agent: the full pipeline on a mix of conversational and todo messages
+- task_route: llm.task.aroute() on a plan of async and sync steps
+- todo_agent: TodoAgent on commands the local parser handles and ones it does not
+
+Each scenario reports throughput, wall-time p50/p95/p99 and pipeline overhead: wall
+time minus the time during which at least one model call was in flight. Results can
+be saved as a baseline; --compare exits with status 1 when the overhead percentiles
+or the throughput of a scenario regress by more than --tolerance.
+
+With --live the configured backends are used instead, e.g. the stand-in server of
+utils.standin_server for an end-to-end load test; model time is then unknown, so
+only wall times and throughput are reported.
+
+Usage: python -m utils.pipeline_benchmark [--scenario run_agent] [--requests 200]
+           [--concurrency 8] [--latency lognormal:0.02,0.5] [--failure-rate 0.01]
+           [--malformed-rate 0.01] [--seed 0] [--save-baseline bench.json]
+           [--compare bench.json] [--tolerance 0.2] [--live]
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from typing import Awaitable, Callable, Dict, List, Optional
+import llm.invoke
+import llm.query
+import llm.task
+from llm.agent import AgentTask, arun_agent
+from llm.initialize_agents import initialize_agents
+from agents.todo_store import SQLiteTodoStore
+from utils.fake_backend import LatencyModel, ScriptedBackend, busy_seconds, install, track_calls
+from utils.log import get_custom_logger
+
+logger = get_custom_logger("PIPELINE BENCHMARK")
+
+MESSAGES = [
+    "Hello, can you add 'buy milk' to my todo list and mark task of id 3 as completed?",
+    "What tasks do I have on my todo list?",
+    "Remind me to call the plumber sometime next week",
+    "Please delete the task 'buy groceries' from my list",
+    "How's the weather today?",
+    "Hi! How are you doing?",
+]
+
+TODO_COMMANDS = [
+    "add 'buy milk' high priority due 2026-11-01",
+    "show my tasks",
+    "mark task 1 as completed",
+    "remind me to water the plants when I get home",
+    "list high priority tasks",
+    "put something about the dentist on there",
+]
+
+PLAN = {
+    "steps": [
+        {"step_number": 1, "task": "show my tasks", "agent": "todoagent", "is_async": True},
+        {"step_number": 2, "task": "list completed tasks", "agent": "todoagent", "is_async": True},
+        {"step_number": 3, "task": "note that the car needs washing", "agent": "todoagent"},
+        {"step_number": 4, "task": "add 'wash car' low priority", "agent": "todoagent", "is_async": True},
+        {"step_number": 5, "task": "something about groceries", "agent": "todoagent", "is_async": True},
+    ]
+}
+
+# Regressions are checked on these: (section, key, True when higher is worse)
+COMPARED = [
+    ("overhead", "p50", True),
+    ("overhead", "p95", True),
+    ("throughput", None, False),
+]
+
+
+def percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def distribution(samples: List[float]) -> Optional[Dict[str, float]]:
+    if not samples:
+        return None
+    return {
+        "mean": sum(samples) / len(samples),
+        "p50": percentile(samples, 0.5),
+        "p95": percentile(samples, 0.95),
+        "p99": percentile(samples, 0.99),
+    }
+
+
+def scenarios(agent_manager) -> Dict[str, Callable[[int], Awaitable]]:
+    agent_list = agent_manager.get_list()
+    todo_agent = agent_manager.get_agent("TodoAgent")
+    plan = llm.task.TaskList.model_validate(PLAN)
+
+    async def run_agent(i: int):
+        await arun_agent(MESSAGES[i % len(MESSAGES)], agent_manager)
+
+    async def task_route(i: int):
+        results = await llm.task.aroute(plan, agent_list)
+        failed = [r for r in results if r["status"] != "success"]
+        if failed:
+            raise RuntimeError(f"{len(failed)} steps failed: {failed[0]['message']}")
+
+    async def todo_agent_run(i: int):
+        task = AgentTask(task=TODO_COMMANDS[i % len(TODO_COMMANDS)], expected_output="")
+        await todo_agent.aexecute(task)
+
+    return {"run_agent": run_agent, "task_route": task_route, "todo_agent": todo_agent_run}
+
+
+async def measure(
+    run: Callable[[int], Awaitable], requests: int, concurrency: int, live: bool = False
+) -> Dict:
+    walls: List[float] = []
+    overheads: List[float] = []
+    failures = 0
+    next_index = iter(range(requests))
+
+    async def once(i: int):
+        nonlocal failures
+        with track_calls() as calls:
+            start = time.perf_counter()
+            try:
+                await run(i)
+            except Exception as e:
+                failures += 1
+                logger.warning(f"Request {i} failed: {str(e)}")
+                return
+            end = time.perf_counter()
+        walls.append(end - start)
+        if not live:
+            overheads.append(end - start - busy_seconds(calls, start, end))
+
+    async def worker():
+        for i in next_index:
+            await once(i)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests": requests,
+        "failures": failures,
+        "failure_rate": failures / requests if requests else 0.0,
+        "throughput": len(walls) / elapsed if elapsed else 0.0,
+        "wall": distribution(walls),
+        "overhead": distribution(overheads),
+    }
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Returns a description of every regression beyond the tolerance."""
+    regressions = []
+    for name, result in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        for section, key, higher_is_worse in COMPARED:
+            if not result[section] or not base[section]:
+                continue
+            current = result[section][key] if key else result[section]
+            previous = base[section][key] if key else base[section]
+            if not previous:
+                continue
+            change = (current - previous) / previous
+            label = f"{name} {section}{' ' + key if key else ''}"
+            print(f"  {label}: {previous:.6g} -> {current:.6g} ({change:+.1%})")
+            if (change if higher_is_worse else -change) > tolerance:
+                regressions.append(f"{label} regressed by {abs(change):.1%}")
+    return regressions
+
+
+def print_report(results: Dict) -> None:
+    print(f"{'scenario':<12} {'req/s':>9} {'fail':>6}   wall p50/p95/p99 (ms)     overhead p50/p95/p99 (ms)")
+    for name, r in results["scenarios"].items():
+        wall = overhead = "n/a"
+        if r["wall"]:
+            wall = "/".join(f"{r['wall'][k] * 1000:.1f}" for k in ("p50", "p95", "p99"))
+        if r["overhead"]:
+            overhead = "/".join(f"{r['overhead'][k] * 1000:.2f}" for k in ("p50", "p95", "p99"))
+        print(f"{name:<12} {r['throughput']:>9.1f} {r['failure_rate']:>6.1%}   {wall:<25} {overhead}")
+
+
+async def run(args) -> Dict:
+    backend = ScriptedBackend(
+        latency=LatencyModel.parse(args.latency),
+        failure_rate=args.failure_rate,
+        malformed_rate=args.malformed_rate,
+        chunk_delay=args.chunk_delay,
+        seed=args.seed,
+    )
+    if not args.live:
+        install(backend)
+    if not args.cache:
+        # Repeated messages would otherwise be answered from the response cache
+        llm.invoke.response_cache = None
+
+    agent_manager, _ = initialize_agents()
+    selected = scenarios(agent_manager)
+    names = args.scenario or list(selected)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = SQLiteTodoStore(db_path=os.path.join(directory, "bench.db"), json_path="")
+        agent_manager.get_agent("TodoAgent")._store = store
+
+        results = {"config": vars(args).copy(), "scenarios": {}}
+        for name in names:
+            # run_agent prints its answers
+            with redirect_stdout(io.StringIO()):
+                results["scenarios"][name] = await measure(
+                    selected[name], args.requests, args.concurrency, args.live
+                )
+
+    if args.live:
+        return results
+    results["backend"] = {
+        "calls": backend.calls,
+        "failures": backend.failures,
+        "malformed": backend.malformed,
+    }
+    return results
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scenario", action="append", choices=["run_agent", "task_route", "todo_agent"])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", default="lognormal:0.02,0.5")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--chunk-delay", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cache", action="store_true", help="keep the response cache on")
+    parser.add_argument("--logs", action="store_true", help="keep INFO logs on")
+    parser.add_argument("--live", action="store_true", help="use the configured backends")
+    parser.add_argument("--save-baseline")
+    parser.add_argument("--compare")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    if not args.logs:
+        logging.disable(logging.INFO)
+
+    results = asyncio.run(run(args))
+    print_report(results)
+    if "backend" in results:
+        print(f"backend: {json.dumps(results['backend'])}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare, "r") as file:
+            baseline = json.load(file)
+        print(f"Compared with {args.compare}:")
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+Compares the two-call pipeline (llm.query.route, then llm.task.generate) against the
+fused single-call planner (llm.task.plan) on the configured backend.
+
+The fast-path router is bypassed and the response and semantic caches are turned
+off, so both modes pay for their model calls on every repetition.
+
+Usage: python -m utils.planner_benchmark [repetitions]
+"""
+
+import sys
+import time
+import asyncio
+import statistics
+from functools import partial
+import llm.invoke
+import llm.query
+import llm.task
+from llm.initialize_agents import initialize_agents
+from utils.log import get_custom_logger
+
+logger = get_custom_logger("PLANNER BENCHMARK")
+
+MESSAGES = [
+    "Hello, can you add 'buy milk' to my todo list and mark task of id 3 as completed?",
+    "What tasks do I have on my todo list?",
+    "Can you mark the task with index 2 as completed?",
+    "Please delete the task 'buy groceries' from my list",
+    "How's the weather today?",
+    "Hi! How are you doing?",
+]
+
+
+async def two_call(message: str, agent_list) -> str:
+    query_route = await llm.query.aroute(message, agent_list, fast_path=False)
+    if query_route["agent"] == "tool":
+        await llm.task.agenerate(message, agent_list)
+    return query_route["agent"]
+
+
+async def fused(message: str, agent_list) -> str:
+    fallback = partial(llm.task.aplan, agent_list=agent_list)
+    query_route = await llm.query.aroute(
+        message, agent_list, fallback=fallback, fast_path=False
+    )
+    if query_route["agent"] == "tool" and query_route["tasks"] is None:
+        await llm.task.agenerate(message, agent_list)
+    return query_route["agent"]
+
+
+def percentile(samples, q: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def disable_caches() -> None:
+    # Repetitions after the first would otherwise time cache hits, not the model
+    llm.invoke.response_cache = None
+    llm.query.semantic_cache = None
+    llm.task.semantic_cache = None
+
+
+async def run(repetitions: int):
+    disable_caches()
+    _, agent_list = initialize_agents()
+    modes = {"two_call": two_call, "fused": fused}
+    timings = {name: [] for name in modes}
+    failures = {name: 0 for name in modes}
+
+    for _ in range(repetitions):
+        for message in MESSAGES:
+            for name, pipeline in modes.items():
+                start = time.perf_counter()
+                try:
+                    await pipeline(message, agent_list)
+                except Exception as e:
+                    failures[name] += 1
+                    logger.error(f"[{name}] failed on {message!r}: {str(e)}")
+                    continue
+                timings[name].append(time.perf_counter() - start)
+
+    for name, samples in timings.items():
+        if not samples:
+            logger.info(f"{name}: no successful runs")
+            continue
+        logger.info(
+            f"{name}: n={len(samples)} failures={failures[name]} "
+            f"mean={statistics.mean(samples):.3f}s "
+            f"p50={percentile(samples, 0.5):.3f}s "
+            f"p95={percentile(samples, 0.95):.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 3))
@@ -0,0 +1,220 @@
+"""
+Profiles the pipeline on recorded traffic.
+
+Replays a trace captured with LLM_TRACE_MODE=record (see llm.recording) through
+run_agent, with the backends answering from the trace, and reports where the CPU time
+outside the model goes. Model time is only waited for (not spent on the CPU), and with
+the default --speed 0 not at all, so all CPU time reported belongs to the pipeline.
+
+Profilers:
+- cprofile: deterministic, exact call counts; covers the event loop thread running
+  run_agent, but not agent steps run in worker threads
+- sample: samples the stacks of every thread every --interval seconds; statistical,
+  but includes worker threads and adds little overhead
+
+Both print the top functions and the CPU share per module, leaving out time spent
+blocked in select/epoll or on locks.
+
+Usage: python -m utils.profile_replay llm_trace.jsonl [--profiler cprofile|sample]
+           [--speed 0] [--repeat 1] [--concurrency 1] [--top 25] [--output run.prof]
+"""
+
+import argparse
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import sysconfig
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import redirect_stdout
+from typing import Dict, List
+import llm.invoke
+from llm.agent import arun_agent
+from llm.initialize_agents import initialize_agents
+from llm.recording import load_trace, start_replay
+from agents.todo_store import SQLiteTodoStore
+from utils.log import get_custom_logger
+
+logger = get_custom_logger("PROFILE REPLAY")
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STDLIB = sysconfig.get_paths()["stdlib"]
+# Leaf functions of threads that are waiting rather than running
+IDLE = {"select", "poll", "epoll", "wait", "acquire", "get", "sleep", "_worker", "accept"}
+# Built-ins cProfile times while the event loop or a thread is blocked
+IDLE_BUILTINS = ("'select.", "'_thread.lock'", "'_thread.RLock'")
+
+
+def module_of(filename: str) -> str:
+    """Groups a source file into a project module, a third-party package or stdlib."""
+    if filename.startswith(PROJECT_ROOT):
+        return os.path.relpath(filename, PROJECT_ROOT)
+    if "site-packages" in filename:
+        return filename.split("site-packages" + os.sep, 1)[1].split(os.sep, 1)[0]
+    if filename.startswith(STDLIB):
+        return "stdlib:" + os.path.relpath(filename, STDLIB).split(os.sep, 1)[0]
+    return "builtins" if filename in ("", "~") else filename
+
+
+class Sampler:
+    def __init__(self, interval: float = 0.001):
+        self.interval = interval
+        self.samples = 0
+        self.leaves: Counter = Counter()
+        self.inclusive: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampler", daemon=True)
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own or frame.f_code.co_name in IDLE:
+                    continue
+                self.samples += 1
+                code = frame.f_code
+                self.leaves[(code.co_filename, code.co_firstlineno, code.co_name)] += 1
+                seen = set()
+                while frame is not None:
+                    code = frame.f_code
+                    key = (code.co_filename, code.co_firstlineno, code.co_name)
+                    if key not in seen:
+                        seen.add(key)
+                        self.inclusive[key] += 1
+                    frame = frame.f_back
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def report(self, top: int) -> str:
+        if not self.samples:
+            return "No samples"
+        lines = [f"{self.samples} samples of running threads", "", "self%  total%  function"]
+        for key, count in self.leaves.most_common(top):
+            filename, line, name = key
+            lines.append(
+                f"{100 * count / self.samples:5.1f}  {100 * self.inclusive[key] / self.samples:6.1f}"
+                f"  {name} ({module_of(filename)}:{line})"
+            )
+        modules: Counter = Counter()
+        for (filename, _, _), count in self.leaves.items():
+            modules[module_of(filename)] += count
+        lines += ["", "self%  module"]
+        lines += [f"{100 * c / self.samples:5.1f}  {m}" for m, c in modules.most_common(top)]
+        return "\n".join(lines)
+
+
+def cprofile_report(profile: cProfile.Profile, top: int) -> str:
+    out = io.StringIO()
+    stats = pstats.Stats(profile, stream=out)
+    stats.sort_stats("tottime").print_stats(top)
+
+    modules: Dict[str, float] = Counter()
+    total = 0.0
+    for (filename, _, name), (_, _, tottime, _, _) in stats.stats.items():
+        if any(idle in name for idle in IDLE_BUILTINS):
+            continue
+        modules[module_of(filename)] += tottime
+        total += tottime
+    out.write("self%  seconds  module\n")
+    for module, seconds in sorted(modules.items(), key=lambda item: -item[1])[:top]:
+        out.write(f"{100 * seconds / (total or 1):5.1f}  {seconds:7.3f}  {module}\n")
+    return out.getvalue()
+
+
+async def replay(messages: List[str], agent_manager, concurrency: int) -> int:
+    failures = 0
+    pending = iter(messages)
+
+    async def worker():
+        nonlocal failures
+        for message in pending:
+            try:
+                await arun_agent(message, agent_manager)
+            except Exception as e:
+                failures += 1
+                logger.warning(f"Replay of {message!r} failed: {str(e)}")
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return failures
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("trace")
+    parser.add_argument("--profiler", choices=["cprofile", "sample"], default="cprofile")
+    parser.add_argument("--speed", type=float, default=0.0, help="recorded time scale, 0 = no waits")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--interval", type=float, default=0.001)
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--output", help="write cProfile stats for snakeviz/pstats")
+    parser.add_argument("--logs", action="store_true", help="keep INFO logs on")
+    args = parser.parse_args(argv)
+
+    runs, calls = load_trace(args.trace)
+    if not runs:
+        print(f"No run_agent messages in {args.trace}")
+        return 1
+    if not args.logs:
+        logging.disable(logging.INFO)
+
+    replayer = start_replay(calls, args.speed)
+    # Repeated replays would otherwise be answered from the response cache
+    llm.invoke.response_cache = None
+    agent_manager, _ = initialize_agents()
+    messages = runs * args.repeat
+    recorded_seconds = sum(call["seconds"] for call in calls) * args.repeat
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Replayed todo actions must not touch the real list
+        store = SQLiteTodoStore(db_path=os.path.join(directory, "replay.db"), json_path="")
+        agent_manager.get_agent("TodoAgent")._store = store
+
+        profile = cProfile.Profile() if args.profiler == "cprofile" else None
+        sampler = Sampler(args.interval) if args.profiler == "sample" else None
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profile:
+            profile.enable()
+        if sampler:
+            sampler.start()
+        with redirect_stdout(io.StringIO()):
+            failures = asyncio.run(replay(messages, agent_manager, args.concurrency))
+        if profile:
+            profile.disable()
+        if sampler:
+            sampler.stop()
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+    print(
+        f"Replayed {len(messages)} runs ({len(calls)} recorded calls, {failures} failed, "
+        f"{replayer.approximate} approximate and {replayer.misses} missing recordings) "
+        f"at speed {args.speed or 'unlimited'}"
+    )
+    print(
+        f"wall {wall:.3f}s, cpu {cpu:.3f}s ({1000 * cpu / len(messages):.2f} ms per run); "
+        f"recorded model time {recorded_seconds:.3f}s"
+    )
+    print()
+    if profile:
+        print(cprofile_report(profile, args.top))
+        if args.output:
+            profile.dump_stats(args.output)
+            print(f"Stats written to {args.output}")
+    if sampler:
+        print(sampler.report(args.top))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,570 @@
+"""
+Local stand-in for the Ollama and OpenAI-compatible model servers, for load tests.
+
+Speaks the subset of both APIs the pipeline uses, over plain asyncio streams:
+
+- Ollama: POST /api/chat (tools, `format`, NDJSON streaming), /api/generate,
+  /api/embed; GET /api/ps, /api/tags, /api/version
+- OpenAI: POST /v1/chat/completions (tools, `response_format`, SSE streaming with
+  usage), /v1/embeddings; GET /v1/models
+
+Replies are chosen in order from:
+
+1. cassettes: recorded request/response pairs (JSONL, one
+   {"request": {"messages": [...], "tool": name}, "response": {...}} per line)
+   matched exactly on the messages and the requested tool; traces written by
+   llm.recording can be used as cassettes
+2. rules: a JSON list of {"tool", "model", "pattern", "content" | "arguments" |
+   "error"} entries; the first whose tool/model match and whose regex `pattern`
+   is found in the last user message wins; "error" answers with that HTTP status
+   (see standin_rules.example.json)
+3. the scripted replies of utils.fake_backend
+
+Time to first token, generation speed (tokens per second), parallel generation slots
+and queue length are configurable, like a real server's; requests beyond the queue
+get a 503. Point the app at it with OLLAMA_HOST=http://127.0.0.1:11435 (or
+OLLAMA_HOSTS for a pool of stand-ins) and OPENAI_BASE_URL=http://127.0.0.1:11435/v1
+with any OPENAI_API_KEY.
+
+Usage: python -m utils.standin_server [--port 11435] [--rules rules.json]
+           [--cassette calls.jsonl] [--latency fixed:0.05] [--tokens-per-second 200]
+           [--concurrency 4] [--max-queue 64] [--failure-rate 0.01] [--seed 0]
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, List, Optional, Set
+from llm.recording import cassette_key
+from utils.fake_backend import LatencyModel, scripted_arguments, scripted_content
+from utils.log import get_custom_logger
+
+logger = get_custom_logger("STANDIN SERVER")
+
+EMBEDDING_DIMENSIONS = 64
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests",
+           500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass
+class Reply:
+    content: str = ""
+    tool: Optional[str] = None
+    arguments: Optional[Dict] = None
+    error: Optional[int] = None
+
+    @property
+    def text(self) -> str:
+        """The generated text: the content, or the tool arguments as JSON."""
+        if isinstance(self.arguments, str):
+            # Recorded as generated, possibly malformed
+            return self.arguments
+        return json.dumps(self.arguments) if self.arguments is not None else self.content
+
+
+def count_tokens(text: str) -> int:
+    # Roughly four characters per token, like most BPE vocabularies on English
+    return max(1, math.ceil(len(text) / 4))
+
+
+def last_user_message(messages: List[Dict]) -> str:
+    return next(
+        (m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), ""
+    )
+
+
+def schema_tool(schema: Optional[Dict]) -> Optional[str]:
+    """Guesses the tool a bare JSON schema (Ollama `format`) belongs to from its fields."""
+    properties = set((schema or {}).get("properties", {}))
+    if {"agent", "steps"} <= properties:
+        return "plan_query"
+    for field, tool in (("steps", "route_agent"), ("agent", "route_query"),
+                        ("actions", "todo_batch"), ("action", "todo_action")):
+        if field in properties:
+            return tool
+    return None
+
+
+def embedding(text: str) -> List[float]:
+    """Deterministic unit vector from hashed words, so similar texts land close."""
+    vector = [0.0] * EMBEDDING_DIMENSIONS
+    for word in re.findall(r"\w+", text.lower()):
+        h = zlib.crc32(word.encode("utf-8"))
+        vector[h % EMBEDDING_DIMENSIONS] += 1.0 if h & 0x80000000 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class Responder:
+    def __init__(self, rules: List[Dict] = None, cassettes: Dict[str, Dict] = None):
+        self.rules = rules or []
+        self.cassettes = cassettes or {}
+        for rule in self.rules:
+            rule["_pattern"] = re.compile(rule.get("pattern") or "", re.IGNORECASE)
+
+    @classmethod
+    def load(cls, rules_path: str = None, cassette_paths: List[str] = ()) -> "Responder":
+        rules = []
+        if rules_path:
+            with open(rules_path, "r") as file:
+                rules = json.load(file)
+            rules = rules.get("rules", []) if isinstance(rules, dict) else rules
+
+        cassettes = {}
+        prompts = {}
+        for path in cassette_paths:
+            with open(path, "r") as file:
+                for line in file:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    if record.get("type") == "prompt":
+                        prompts[record["id"]] = record["text"]
+                    if "response" not in record:
+                        continue
+                    messages = [
+                        {"role": m["role"], "content": prompts[m["ref"]]} if "ref" in m else m
+                        for m in record["request"]["messages"]
+                    ]
+                    key = cassette_key(messages, record["request"].get("tool"))
+                    cassettes.setdefault(key, record["response"])
+        logger.info(f"Loaded {len(rules)} rules and {len(cassettes)} recorded responses")
+        return cls(rules, cassettes)
+
+    def respond(self, model: str, messages: List[Dict], tool: Optional[str]) -> Reply:
+        recorded = self.cassettes.get(cassette_key(messages, tool))
+        if recorded is not None:
+            return Reply(recorded.get("content") or "", tool, recorded.get("arguments"))
+
+        message = last_user_message(messages)
+        for rule in self.rules:
+            if rule.get("tool") not in (None, tool) or rule.get("model") not in (None, model):
+                continue
+            if rule["_pattern"].search(message):
+                return Reply(rule.get("content", ""), tool, rule.get("arguments"), rule.get("error"))
+
+        if tool:
+            return Reply(tool=tool, arguments=scripted_arguments(tool, message))
+        return Reply(content=scripted_content(message))
+
+
+class _Response:
+    """Writes an HTTP/1.1 response, either whole or with chunked transfer encoding."""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+
+    def _head(self, status: int, content_type: str, extra: str) -> None:
+        self.writer.write(
+            (
+                f"HTTP/1.1 {status} {REASONS.get(status, 'Error')}\r\n"
+                f"Content-Type: {content_type}\r\n{extra}\r\n"
+            ).encode("latin-1")
+        )
+
+    async def json(self, status: int, body) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self._head(status, "application/json", f"Content-Length: {len(data)}\r\n")
+        self.writer.write(data)
+        await self.writer.drain()
+
+    def start_stream(self, content_type: str) -> None:
+        self._head(200, content_type, "Transfer-Encoding: chunked\r\n")
+
+    async def chunk(self, data: str) -> None:
+        data = data.encode("utf-8")
+        self.writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+        await self.writer.drain()
+
+    async def end_stream(self) -> None:
+        self.writer.write(b"0\r\n\r\n")
+        await self.writer.drain()
+
+
+class StandinServer:
+    def __init__(
+        self,
+        responder: Responder = None,
+        latency: LatencyModel = LatencyModel(),
+        tokens_per_second: float = 0.0,
+        concurrency: int = 0,
+        max_queue: int = 0,
+        failure_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.responder = responder or Responder()
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.models: Dict[str, float] = {}
+        self.stats: Dict[str, int] = {"requests": 0, "rejected": 0, "failed": 0, "in_flight": 0}
+        self.port: Optional[int] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._waiting = 0
+        self._connections: Set[asyncio.StreamWriter] = set()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 11435) -> None:
+        self._slots = asyncio.Semaphore(self.concurrency) if self.concurrency else None
+        self._server = await asyncio.start_server(self._serve, host, port, backlog=1024)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Stand-in model server listening on http://{host}:{self.port}")
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            # Idle keep-alive connections would otherwise keep wait_closed() waiting
+            for writer in list(self._connections):
+                writer.close()
+            await self._server.wait_closed()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections.add(writer)
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                request_line, *header_lines = head.decode("latin-1").rstrip("\r\n").split("\r\n")
+                method, target, version = request_line.split(" ", 2)
+                headers = {}
+                for line in header_lines:
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length") or 0)
+                body = await reader.readexactly(length) if length else b""
+                await self._dispatch(method, target.split("?")[0], body, _Response(writer))
+
+                if version != "HTTP/1.1" or headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _dispatch(self, method: str, path: str, body: bytes, response: _Response) -> None:
+        routes = {
+            ("POST", "/api/chat"): self._ollama_chat,
+            ("POST", "/api/generate"): self._ollama_generate,
+            ("POST", "/api/embed"): self._ollama_embed,
+            ("GET", "/api/ps"): self._ollama_ps,
+            ("GET", "/api/tags"): self._ollama_ps,
+            ("GET", "/api/version"): self._version,
+            ("POST", "/v1/chat/completions"): self._openai_chat,
+            ("POST", "/v1/embeddings"): self._openai_embed,
+            ("GET", "/v1/models"): self._openai_models,
+            ("GET", "/stats"): self._stats,
+        }
+        handler = routes.get((method, path))
+        try:
+            if handler is None:
+                raise HTTPError(404, f"{method} {path} not found")
+            request = json.loads(body) if body else {}
+            await handler(request, response)
+        except HTTPError as e:
+            await response.json(e.status, {"error": str(e)})
+        except (ValueError, KeyError, TypeError) as e:
+            await response.json(400, {"error": f"Invalid request: {str(e)}"})
+
+    # Generation
+
+    def _reply(self, model: str, messages: List[Dict], tool: Optional[str]) -> Reply:
+        self.stats["requests"] += 1
+        self.models[model] = time.time()
+        if self.rng.random() < self.failure_rate:
+            self.stats["failed"] += 1
+            raise HTTPError(500, "Injected failure")
+        reply = self.responder.respond(model, messages, tool)
+        if reply.error:
+            self.stats["failed"] += 1
+            raise HTTPError(reply.error, "Error from rule")
+        return reply
+
+    async def _admit(self) -> None:
+        """Waits for a generation slot, then for the time to first token."""
+        if self._slots is not None:
+            if self.max_queue and self._waiting >= self.max_queue and self._slots.locked():
+                self.stats["rejected"] += 1
+                raise HTTPError(503, "Server busy")
+            self._waiting += 1
+            try:
+                await self._slots.acquire()
+            finally:
+                self._waiting -= 1
+        self.stats["in_flight"] += 1
+        delay = self.latency.sample(self.rng)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _release(self) -> None:
+        self.stats["in_flight"] -= 1
+        if self._slots is not None:
+            self._slots.release()
+
+    async def _generate(self, text: str) -> AsyncIterator[str]:
+        """Yields the text word by word at the configured token rate."""
+        words = re.findall(r"\S+\s*", text) or [text]
+        for word in words:
+            if self.tokens_per_second:
+                await asyncio.sleep(count_tokens(word) / self.tokens_per_second)
+            yield word
+
+    async def _ollama_chat(self, request: Dict, response: _Response) -> None:
+        model, messages = request.get("model") or "", request.get("messages") or []
+        tools = request.get("tools") or []
+        schema = request.get("format") if isinstance(request.get("format"), dict) else None
+        tool = tools[0]["function"]["name"] if tools else schema_tool(schema)
+        reply = self._reply(model, messages, tool)
+        # With `format` the JSON document is the content; with tools it is a tool call
+        as_tool_call = bool(tools) and reply.arguments is not None
+
+        await self._admit()
+        try:
+            start = time.perf_counter()
+            prompt_tokens = count_tokens(json.dumps(messages))
+            completion_tokens = count_tokens(reply.text)
+            base = {"model": model, "created_at": _now()}
+            tool_calls = [{"function": {"name": tool, "arguments": reply.arguments}}]
+
+            if not request.get("stream", True):
+                async for _ in self._generate(reply.text):
+                    pass
+                message = {"role": "assistant", "content": "" if as_tool_call else reply.text}
+                if as_tool_call:
+                    message["tool_calls"] = tool_calls
+                await response.json(200, {
+                    **base, "message": message,
+                    **_ollama_done(start, prompt_tokens, completion_tokens),
+                })
+                return
+
+            response.start_stream("application/x-ndjson")
+            if as_tool_call:
+                async for _ in self._generate(reply.text):
+                    pass
+                message = {"role": "assistant", "content": "", "tool_calls": tool_calls}
+                await response.chunk(json.dumps({**base, "message": message, "done": False}) + "\n")
+            else:
+                async for word in self._generate(reply.text):
+                    message = {"role": "assistant", "content": word}
+                    await response.chunk(json.dumps({**base, "message": message, "done": False}) + "\n")
+            final = {
+                **base, "message": {"role": "assistant", "content": ""},
+                **_ollama_done(start, prompt_tokens, completion_tokens),
+            }
+            await response.chunk(json.dumps(final) + "\n")
+            await response.end_stream()
+        finally:
+            self._release()
+
+    async def _ollama_generate(self, request: Dict, response: _Response) -> None:
+        model, prompt = request.get("model") or "", request.get("prompt") or ""
+        self.models[model] = time.time()
+        start = time.perf_counter()
+        if not prompt:
+            # An empty prompt only loads the model
+            await response.json(200, {"model": model, "created_at": _now(), "response": "",
+                                      "done": True, "done_reason": "load"})
+            return
+        reply = self._reply(model, [{"role": "user", "content": prompt}], None)
+        await self._admit()
+        try:
+            async for _ in self._generate(reply.text):
+                pass
+        finally:
+            self._release()
+        await response.json(200, {
+            "model": model, "created_at": _now(), "response": reply.text,
+            **_ollama_done(start, count_tokens(prompt), count_tokens(reply.text)),
+        })
+
+    async def _openai_chat(self, request: Dict, response: _Response) -> None:
+        model, messages = request.get("model") or "", request.get("messages") or []
+        tools = request.get("tools") or []
+        response_format = request.get("response_format") or {}
+        tool = tools[0]["function"]["name"] if tools else None
+        if response_format.get("type") == "json_schema":
+            tool = response_format["json_schema"].get("name") or schema_tool(
+                response_format["json_schema"].get("schema")
+            )
+        reply = self._reply(model, messages, tool)
+        as_tool_call = bool(tools) and reply.arguments is not None
+
+        await self._admit()
+        try:
+            prompt_tokens = count_tokens(json.dumps(messages))
+            completion_tokens = count_tokens(reply.text)
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            }
+            base = {"id": f"chatcmpl-{uuid.uuid4().hex[:24]}", "created": int(time.time()),
+                    "model": model}
+            tool_call = {"id": f"call_{uuid.uuid4().hex[:24]}", "type": "function",
+                         "function": {"name": tool, "arguments": reply.text}}
+            finish_reason = "tool_calls" if as_tool_call else "stop"
+
+            if not request.get("stream"):
+                async for _ in self._generate(reply.text):
+                    pass
+                message = {"role": "assistant", "content": None if as_tool_call else reply.text}
+                if as_tool_call:
+                    message["tool_calls"] = [tool_call]
+                await response.json(200, {
+                    **base, "object": "chat.completion",
+                    "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                    "usage": usage,
+                })
+                return
+
+            def event(delta: Dict, finish: str = None, **extra) -> str:
+                chunk = {**base, "object": "chat.completion.chunk",
+                         "choices": [{"index": 0, "delta": delta, "finish_reason": finish}], **extra}
+                return f"data: {json.dumps(chunk)}\n\n"
+
+            response.start_stream("text/event-stream")
+            await response.chunk(event({"role": "assistant", "content": ""}))
+            if as_tool_call:
+                header = {**tool_call, "index": 0, "function": {"name": tool, "arguments": ""}}
+                await response.chunk(event({"tool_calls": [header]}))
+                async for word in self._generate(reply.text):
+                    piece = {"index": 0, "function": {"arguments": word}}
+                    await response.chunk(event({"tool_calls": [piece]}))
+            else:
+                async for word in self._generate(reply.text):
+                    await response.chunk(event({"content": word}))
+            await response.chunk(event({}, finish_reason))
+            if (request.get("stream_options") or {}).get("include_usage"):
+                chunk = {**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}
+                await response.chunk(f"data: {json.dumps(chunk)}\n\n")
+            await response.chunk("data: [DONE]\n\n")
+            await response.end_stream()
+        finally:
+            self._release()
+
+    # Embeddings and metadata
+
+    async def _ollama_embed(self, request: Dict, response: _Response) -> None:
+        inputs = request.get("input") or ""
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        self.models[request.get("model") or ""] = time.time()
+        await response.json(200, {
+            "model": request.get("model"),
+            "embeddings": [embedding(text) for text in inputs],
+            "prompt_eval_count": sum(count_tokens(text) for text in inputs),
+        })
+
+    async def _openai_embed(self, request: Dict, response: _Response) -> None:
+        inputs = request.get("input") or ""
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        tokens = sum(count_tokens(text) for text in inputs)
+        await response.json(200, {
+            "object": "list",
+            "model": request.get("model"),
+            "data": [{"object": "embedding", "index": i, "embedding": embedding(text)}
+                     for i, text in enumerate(inputs)],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    async def _ollama_ps(self, request: Dict, response: _Response) -> None:
+        expires = (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat()
+        await response.json(200, {"models": [
+            {"name": model, "model": model, "size": 0, "digest": "", "expires_at": expires}
+            for model in self.models
+        ]})
+
+    async def _version(self, request: Dict, response: _Response) -> None:
+        await response.json(200, {"version": "0.0.0-standin"})
+
+    async def _openai_models(self, request: Dict, response: _Response) -> None:
+        await response.json(200, {"object": "list", "data": [
+            {"id": model, "object": "model", "owned_by": "standin"} for model in self.models
+        ]})
+
+    async def _stats(self, request: Dict, response: _Response) -> None:
+        await response.json(200, {**self.stats, "waiting": self._waiting})
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _ollama_done(start: float, prompt_tokens: int, completion_tokens: int) -> Dict:
+    return {
+        "done": True,
+        "done_reason": "stop",
+        "total_duration": int((time.perf_counter() - start) * 1e9),
+        "prompt_eval_count": prompt_tokens,
+        "eval_count": completion_tokens,
+    }
+
+
+def serve_in_thread(host: str = "127.0.0.1", port: int = 0, **options) -> StandinServer:
+    """Starts a server on its own event loop thread, for use from tests and benchmarks."""
+    server = StandinServer(**options)
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(server.start(host, port))
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, name="standin-server", daemon=True).start()
+    started.wait()
+    return server
+
+
+async def _main(args) -> None:
+    server = StandinServer(
+        responder=Responder.load(args.rules, args.cassette or []),
+        latency=LatencyModel.parse(args.latency),
+        tokens_per_second=args.tokens_per_second,
+        concurrency=args.concurrency,
+        max_queue=args.max_queue,
+        failure_rate=args.failure_rate,
+        seed=args.seed,
+    )
+    await server.start(args.host, args.port)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--rules")
+    parser.add_argument("--cassette", action="append", help="JSONL of recorded responses")
+    parser.add_argument("--latency", default="none", help="time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, default=0, help="parallel generations")
+    parser.add_argument("--max-queue", type=int, default=0, help="waiting requests before 503")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,220 @@
+"""
+Structured spans and latency histograms for the run_agent pipeline.
+
+A span covers one stage of work (route, generate, step, final_answer, stream,
+llm_call, ...). Spans nest through a context variable, so a model call made inside a
+step, even from a worker thread or another asyncio task, becomes that step's child.
+
+Code inside a span annotates it without holding a reference:
+
+    with tracing.span("step", agent="todoagent"):
+        tracing.annotate(host="gpu1")       # set attributes on the current span
+        tracing.add(prompt_tokens=120)      # accumulate numeric attributes
+
+Finished spans are aggregated into log-linear (HDR-style) histograms of wall time,
+queue time and token counts, keyed by span name and its stage/agent labels, and are
+handed to the registered exporters (see utils/exporters.py).
+"""
+
+import itertools
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Attributes that become histogram labels
+LABELS = ("stage", "agent")
+# Numeric attributes aggregated into histograms, besides wall_seconds
+MEASURES = ("queue_seconds", "prompt_tokens", "completion_tokens", "retries")
+
+
+class Histogram:
+    """
+    Log-linear histogram: values are bucketed with a fixed number of significant bits,
+    so the relative error is bounded (about 1.5% with 6 bits) at any magnitude while
+    memory stays proportional to the number of occupied buckets.
+    """
+
+    def __init__(self, unit: float = 1e-6, significant_bits: int = 6):
+        self.unit = unit
+        self.bits = significant_bits
+        self.counts: Dict[Tuple[int, int], int] = defaultdict(int)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def _key(self, value: float) -> Tuple[int, int]:
+        n = max(0, int(value / self.unit))
+        shift = max(0, n.bit_length() - self.bits)
+        return shift, n >> shift
+
+    def _value(self, key: Tuple[int, int]) -> float:
+        shift, mantissa = key
+        # Midpoint of the bucket
+        return ((mantissa << shift) + ((1 << shift) - 1) / 2) * self.unit
+
+    def record(self, value: float) -> None:
+        with self._lock:
+            self.counts[self._key(value)] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = max(1, round(q * self.count))
+            seen = 0
+            for key in sorted(self.counts):
+                seen += self.counts[key]
+                if seen >= rank:
+                    return min(self._value(key), self.max)
+            return self.max
+
+    def summary(self, quantiles=(0.5, 0.9, 0.99)) -> Dict[str, float]:
+        result = {f"p{round(q * 100)}": self.quantile(q) for q in quantiles}
+        result.update(count=self.count, sum=self.sum, max=self.max)
+        return result
+
+
+class Span:
+    _ids = itertools.count(1)
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, **attributes):
+        self.name = name
+        self.span_id = f"{os.getpid():x}-{next(self._ids):x}"
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self.attributes = dict(attributes)
+        self.start_time = time.time()
+        self.started = time.perf_counter()
+        self.wall_seconds: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def add(self, **values) -> None:
+        for key, value in values.items():
+            self.attributes[key] = self.attributes.get(key, 0) + (value or 0)
+
+    def finish(self) -> None:
+        if self.wall_seconds is None:
+            self.wall_seconds = time.perf_counter() - self.started
+            _finished(self)
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "wall_seconds": self.wall_seconds,
+            "error": self.error,
+            **self.attributes,
+        }
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("tracing_span", default=None)
+_histograms: Dict[Tuple[str, Tuple], Histogram] = {}
+_histograms_lock = threading.Lock()
+_exporters: List = []
+
+
+def current() -> Optional[Span]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span]:
+    """Runs the block as a child span of the current one."""
+    item = Span(name, _current.get(), **attributes)
+    token = _current.set(item)
+    try:
+        yield item
+    except BaseException as e:
+        item.error = type(e).__name__
+        raise
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:
+            # An async generator finalized from another context; nothing to restore
+            pass
+        item.finish()
+
+
+def traced(name: str, **attributes):
+    """Decorator running each call of an async function in its own span."""
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name, **attributes):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def annotate(**attributes) -> None:
+    item = _current.get()
+    if item is not None:
+        item.set(**attributes)
+
+
+def add(**values) -> None:
+    item = _current.get()
+    if item is not None:
+        item.add(**values)
+
+
+def histogram(name: str, **labels) -> Histogram:
+    key = (name, tuple(sorted(labels.items())))
+    with _histograms_lock:
+        if key not in _histograms:
+            _histograms[key] = Histogram(unit=1e-6 if name.endswith("_seconds") else 1)
+        return _histograms[key]
+
+
+def histograms() -> Dict[Tuple[str, Tuple], Histogram]:
+    with _histograms_lock:
+        return dict(_histograms)
+
+
+def register_exporter(exporter) -> None:
+    """Adds an exporter; its export(span) is called for every finished span."""
+    _exporters.append(exporter)
+
+
+def exporters() -> List:
+    return list(_exporters)
+
+
+def _finished(item: Span) -> None:
+    labels = {"span": item.name}
+    labels.update({k: item.attributes[k] for k in LABELS if k in item.attributes})
+    histogram("span.wall_seconds", **labels).record(item.wall_seconds)
+    for measure in MEASURES:
+        if measure in item.attributes:
+            histogram(f"span.{measure}", **labels).record(item.attributes[measure])
+
+    for exporter in _exporters:
+        try:
+            exporter.export(item)
+        except Exception:
+            # Telemetry must never break the request path
+            pass
+
+
+def reset() -> None:
+    with _histograms_lock:
+        _histograms.clear()